@@ -0,0 +1,115 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from models.entities import Field
+from utils.scenarios import generate_scenario, split_size
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark Field.solve on generated scenarios")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000],
+                        help="counts of entities in scenarios, from 10^2 to 10^6")
+    parser.add_argument("--accuracies", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--modes", nargs="+", choices=("scalar", "batched", "indexed", "exact"),
+                        default=["scalar", "batched"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs of every case, the best time is taken")
+    parser.add_argument("--output", help="file to write the records as JSON")
+    parser.add_argument("--baseline", help="records of the previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown relative to the baseline (default 20%%)")
+    parser.add_argument("--dump-scenarios", metavar="DIR", help="directory to save the generated scenarios")
+
+    return parser.parse_args()
+
+
+def solve(field: Field, mode: str, accuracy: int, workers: int):
+    if mode == "exact":
+        return field.solve_exact(workers=workers)
+
+    return field.solve(accuracy, batched=mode == "batched", indexed=mode == "indexed", workers=workers)
+
+
+def run_case(scenario, mode: str, accuracy: int, workers: int, repeat: int):
+
+    # Time runs without memory tracing, tracing slows allocations down
+    best_time = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        field = Field(scenario["width"], scenario["height"], scenario)
+        achievable_enemies = solve(field, mode, accuracy, workers)
+        elapsed = time.perf_counter() - started
+        best_time = elapsed if best_time is None else min(best_time, elapsed)
+
+    tracemalloc.start()
+    solve(Field(scenario["width"], scenario["height"], scenario), mode, accuracy, workers)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    goals = {str(turret_number): [g.number for g in goals_list]
+             for turret_number, goals_list in sorted(achievable_enemies.items())}
+
+    return {"time": best_time,
+            "peak_memory": peak_memory,
+            "goals_count": sum(len(goals_list) for goals_list in goals.values()),
+            "goals_digest": hashlib.sha1(json.dumps(goals, sort_keys=True).encode()).hexdigest()}
+
+
+def compare(records, baseline, tolerance: float):
+    baseline_records = {record["case"]: record for record in baseline}
+
+    regressions = 0
+    for record in records:
+        previous = baseline_records.get(record["case"])
+        if previous is None:
+            continue
+
+        ratio = record["time"] / previous["time"] if previous["time"] else 1.
+        notes = []
+        if ratio > 1 + tolerance:
+            notes.append("SLOWER")
+        if record["goals_digest"] != previous["goals_digest"]:
+            notes.append("RESULTS CHANGED")
+        regressions += bool(notes)
+
+        print("%-40s time x%.2f  memory x%.2f  %s" % (record["case"], ratio,
+                                                      record["peak_memory"] / max(previous["peak_memory"], 1),
+                                                      " ".join(notes) or "ok"))
+
+    return regressions
+
+
+if __name__ == '__main__':
+
+    arguments = parse_arguments()
+
+    records = []
+    for size in arguments.sizes:
+        scenario = generate_scenario(arguments.seed, **split_size(size))
+        if arguments.dump_scenarios:
+            json.dump(scenario, open(os.path.join(arguments.dump_scenarios,
+                                                  "scenario_%d_%d.json" % (size, arguments.seed)), 'w'))
+
+        for mode in arguments.modes:
+            accuracies = [None] if mode == "exact" else arguments.accuracies
+            for accuracy in accuracies:
+                record = {"case": "size=%d seed=%d mode=%s accuracy=%s" % (size, arguments.seed, mode, accuracy),
+                          "size": size, "seed": arguments.seed, "mode": mode, "accuracy": accuracy}
+                record.update(run_case(scenario, mode, accuracy, arguments.workers, arguments.repeat))
+                records.append(record)
+
+                print("%-40s %10.3f s %12d B %8d goals" % (record["case"], record["time"],
+                                                           record["peak_memory"], record["goals_count"]))
+
+    if arguments.output:
+        json.dump(records, open(arguments.output, 'w'), indent=2)
+
+    if arguments.baseline:
+        if compare(records, json.load(open(arguments.baseline, 'r')), arguments.tolerance):
+            sys.exit(1)
@@ -1,24 +1,122 @@
+import argparse
 import json
-import tkinter as tk
+import os
+import time
 
 from models.entities import Field
+from models.streaming import load_stream
+from utils.rendering import ImageCanvas
+from utils.shared import ResultsCache, profiler
 
 input_data_file = "input/entities.json"
+field_width, field_height = 500, 500
 
-if __name__ == '__main__':
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Find enemies achievable from the turrets")
+    parser.add_argument("scenarios", nargs="*",
+                        help="scenario files, JSON or NDJSON, %s is shown in a window if none" % input_data_file)
+    parser.add_argument("--output", help="file to write results of all scenarios as JSON (default stdout)")
+    parser.add_argument("--png-dir", help="directory to save rendered scenarios as PNG")
+    parser.add_argument("--coverage-dir", help="directory to save heat maps of the turrets coverage as PNG")
+    parser.add_argument("--accuracy", type=int, default=1)
+    parser.add_argument("--mode", choices=("scalar", "batched", "indexed", "exact"), default="scalar")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--cache", metavar="DIR", help="directory of the cache of results, reused between runs")
+    parser.add_argument("--profile", help="file to write phase timings and call counts, as JSON if it ends with "
+                                          ".json, otherwise as folded stacks for flame graphs")
+
+    return parser.parse_args()
+
+
+def solve(field: Field, arguments, cache: ResultsCache = None):
+    if arguments.mode == "exact":
+        return field.solve_exact(workers=arguments.workers, cache=cache)
+
+    return field.solve(arguments.accuracy,
+                       batched=arguments.mode == "batched",
+                       indexed=arguments.mode == "indexed",
+                       workers=arguments.workers,
+                       cache=cache)
+
+
+def solve_scenario(scenario: str, arguments, cache: ResultsCache = None):
+    # Scenarios are read as streams, turrets are solved while the rest of the file is read
+    with open(scenario, 'r') as stream:
+        field, turrets = load_stream(field_width, field_height, stream)
+        achievable_enemies = dict(field.iter_solve(arguments.accuracy,
+                                                   batched=arguments.mode == "batched",
+                                                   indexed=arguments.mode == "indexed",
+                                                   turrets=turrets,
+                                                   exact=arguments.mode == "exact",
+                                                   workers=arguments.workers,
+                                                   cache=cache))
+
+    return field, achievable_enemies
+
+
+def run_headless(arguments, cache: ResultsCache = None):
+    results = {}
+
+    for scenario in arguments.scenarios:
+        started = time.perf_counter()
+        field, achievable_enemies = solve_scenario(scenario, arguments, cache)
+
+        results[scenario] = {
+            "goals": {str(turret_number): [g.number for g in goals_list]
+                      for turret_number, goals_list in achievable_enemies.items()},
+            "time": time.perf_counter() - started
+        }
+
+        if arguments.png_dir:
+            canvas = ImageCanvas(field.width, field.height)
+            field.render(canvas)
+            canvas.save_png(os.path.join(arguments.png_dir, os.path.splitext(os.path.basename(scenario))[0] + ".png"))
+
+        if arguments.coverage_dir:
+            canvas = ImageCanvas(field.width, field.height)
+            canvas.fill_heat_map(field.coverage_map())
+            field.render(canvas)
+            canvas.save_png(os.path.join(arguments.coverage_dir,
+                                         os.path.splitext(os.path.basename(scenario))[0] + ".png"))
+
+    if arguments.output:
+        json.dump(results, open(arguments.output, 'w'), indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+def run_window(arguments, cache: ResultsCache = None):
+    import tkinter as tk
 
     data = json.load(open(input_data_file, 'r'))
-    field = Field(500, 500, data)
+    field = Field(field_width, field_height, data)
 
-    achievable_enemies = field.solve(accuracy=1)
+    achievable_enemies = solve(field, arguments, cache)
     for turret_number, goals_list in achievable_enemies.items():
         print("%s: %s" % (str(turret_number), str([str(g) for g in goals_list])))
 
     window = tk.Tk()
-    canvas = tk.Canvas(window, bg="white", height=500, width=500)
+    canvas = tk.Canvas(window, bg="white", height=field_height, width=field_width)
 
     field.draw(canvas)
 
     canvas.pack()
     window.mainloop()
 
+
+if __name__ == '__main__':
+
+    arguments = parse_arguments()
+    if arguments.profile:
+        profiler.enable()
+
+    cache = ResultsCache(arguments.cache) if arguments.cache else None
+    if arguments.scenarios:
+        run_headless(arguments, cache)
+    else:
+        run_window(arguments, cache)
+
+    if arguments.profile:
+        profiler.disable()
+        profiler.save(arguments.profile)
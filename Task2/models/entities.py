@@ -1,9 +1,34 @@
+from contextlib import nullcontext
+from functools import lru_cache
+from itertools import islice
 from typing import List, Dict
 
-from math import sin, cos, pi
+from math import sin, cos, acos, ceil, pi, sqrt
+
+import numpy as np
 
 from utils.geometric import Point, Polygon, Segment, get_visible_border_from, \
-    get_polygon_of_visible_border
+    get_polygon_of_visible_border, intersect_polygons_batch, get_overlapping_angles_for_circles, Circle
+from utils.regions import VisibilityRegions
+from utils.rendering import ImageCanvas
+from utils.shared import ResultsCache, process_pool, profiler, set_worker_state, worker_state
+from utils.spatial_index import UniformGrid
+from utils.sweep import DepthOrder
+
+
+@lru_cache(maxsize=None)
+def _unit_circle(edges_count: int) -> np.ndarray:
+
+    # Points of the circle with radius 1, the angle is accumulated the same way as the edges are walked
+    angles = [0.0]
+    angle_diff = 2 * pi / float(edges_count)
+    for i in range(0, edges_count):
+        angles.append(angles[-1] + angle_diff)
+
+    circle = np.array([(cos(angle), sin(angle)) for angle in angles], dtype=np.float64)
+    circle.flags.writeable = False
+
+    return circle
 
 
 class EntitiesTypes:
@@ -25,17 +50,41 @@ class BaseEntity:
         self.top_left = top_left
         self.number = number
 
+    @property
+    def top_left(self):
+        return self._top_left
+
+    @top_left.setter
+    def top_left(self, top_left: Point):
+        # Moving the entity invalidates its geometry
+        self._top_left = top_left
+        self._edges = None
+        self._polygon = None
+
+    def edges(self) -> np.ndarray:
+        if self._edges is None:
+            self._edges = self._build_edges()
+            self._edges.flags.writeable = False
+
+        return self._edges
+
     def polygon(self):
-        segments = [Segment(self.top_left,
-                            Point(self.top_left.x + self.width, self.top_left.y)),
-                    Segment(Point(self.top_left.x + self.width, self.top_left.y),
-                            Point(self.top_left.x + self.width, self.top_left.y + self.height)),
-                    Segment(Point(self.top_left.x + self.width, self.top_left.y + self.height),
-                            Point(self.top_left.x, self.top_left.y + self.height)),
-                    Segment(Point(self.top_left.x, self.top_left.y + self.height),
-                            self.top_left)]
+        if self._polygon is None:
+            self._polygon = Polygon.from_array(self.edges())
+
+        return self._polygon
+
+    def shape(self):
+        return self.edges()
+
+    def _build_edges(self):
+        x, y = self.top_left.x, self.top_left.y
+        corners = np.array([(x, y),
+                            (x + self.width, y),
+                            (x + self.width, y + self.height),
+                            (x, y + self.height)], dtype=np.float64)
 
-        return Polygon(segments)
+        return np.hstack((corners, np.roll(corners, -1, axis=0)))
 
     def __str__(self):
         return str(self.number)
@@ -57,7 +106,9 @@ class Carrier(BaseEntity):
 
 class Obstacle(BaseEntity):
 
+    # Round obstacles are tessellated into polygons, which differ from the circle by at most the precision
     _round_edges = 100
+    precision = 0.01
 
     def __init__(self, number: int, top_left_corner: Point, radius: int = None, width: int = None, height: int = None):
 
@@ -66,30 +117,29 @@ class Obstacle(BaseEntity):
         else:  # init rounded
             BaseEntity.__init__(self, number, top_left_corner, radius=radius)
 
-    def polygon(self):
+    def shape(self):
         if self.radius:
-            return self._rounded_polygon()
-        return BaseEntity.polygon(self)
-
-    def _rounded_polygon(self):
-        segments = []
-        curr_angle = 0
-        angle_diff = 2 * pi / float(self._round_edges)
+            return Circle(self.top_left, self.radius)
+        return self.edges()
 
-        curr_point = self._point_of_circle(curr_angle)
-        for i in range(0, self._round_edges):
-
-            next_point = self._point_of_circle(curr_angle + angle_diff)
+    def _build_edges(self):
+        if self.radius:
+            return self._rounded_edges()
+        return BaseEntity._build_edges(self)
 
-            segments.append(Segment(curr_point, next_point))
+    def _round_edges_count(self):
 
-            curr_angle += angle_diff
-            curr_point = next_point
+        # Edges count, for which the distance between an edge and the arc is within the precision
+        if self.precision >= self.radius:
+            return 4
+        return min(self._round_edges, max(4, int(ceil(pi / acos(1 - self.precision / self.radius)))))
 
-        return Polygon(segments)
+    def _rounded_edges(self):
+        unit_circle = _unit_circle(self._round_edges_count())
+        circle = np.column_stack((self.top_left.x + self.radius * unit_circle[:, 0],
+                                  self.top_left.y + self.radius * unit_circle[:, 1]))
 
-    def _point_of_circle(self, curr_angle):
-        return Point(self.top_left.x + self.radius * cos(curr_angle), self.top_left.y + self.radius * sin(curr_angle))
+        return np.hstack((circle[:-1], circle[1:]))
 
 
 class Turret(BaseEntity):
@@ -101,6 +151,26 @@ class Turret(BaseEntity):
 
 
 class Field:
+
+    # Upper bound of ray-versus-edge tests evaluated by a single vectorized pass
+    _batch_size = 1 << 22
+
+    # Neighbouring rays tested against the polygons in their angular interval only
+    _rays_group_size = 64
+
+    # Turrets of a stream solved by workers or cached at once
+    _stream_batch_size = 256
+
+    # Turrets fire up to this y
+    _border_y = 0  # TODO: make it = min(enemies.y)
+
+    # Rays of the sweep events are rounded, so items starting at nearly the same ray are ordered on a ray far enough
+    # from their common point to tell their depths apart
+    _ray_digits = 12
+
+    # Angular bins of the depth buffer, which culls the items behind nearer edges before the sweep
+    _occlusion_bins = 1024
+
     def __init__(self, width: int, height: int, entities: Dict):
         self.height = height
         self.width = width
@@ -129,37 +199,462 @@ class Field:
 
     def _parse_entities(self, entities: Dict):
 
-        # Parse Turrets
-        self.turrets = list(map(self._parse_entity, entities[EntitiesTypes.TURRETS]))
+        with profiler.phase("parsing"):
+
+            # Parse Turrets
+            turrets = list(map(self._parse_entity, entities[EntitiesTypes.TURRETS]))
+
+            # Parse enemies (Tanks and Carriers)
+            enemies = list(map(self._parse_entity, entities[EntitiesTypes.ENEMIES]))
 
-        # Parse enemies (Tanks and Carriers)
-        self.enemies = list(map(self._parse_entity, entities[EntitiesTypes.ENEMIES]))
+            # Parse Obstacles
+            obstacles = list(map(self._parse_entity, entities[EntitiesTypes.OBSTACLES]))
 
-        # Parse Obstacles
-        self.obstacles = list(map(self._parse_entity, entities[EntitiesTypes.OBSTACLES]))
+            self._set_entities(turrets, enemies, obstacles)
+
+    @classmethod
+    def from_entities(cls, width: int, height: int, turrets: List[BaseEntity], enemies: List[BaseEntity],
+                      obstacles: List[BaseEntity]):
+
+        field = cls.__new__(cls)
+        field.height = height
+        field.width = width
+        field._set_entities(turrets, enemies, obstacles)
+
+        return field
+
+    def _set_entities(self, turrets: List[BaseEntity], enemies: List[BaseEntity], obstacles: List[BaseEntity]):
+        self.turrets = turrets
+        self.enemies = enemies
+        self.obstacles = obstacles
+
+        self._build_index()
+        self._packed = None
+        self._regions = None
+
+        # Hash of the shapes of the enemies and obstacles and indices of the enemies by their ids, computed once
+        # after every change of them
+        self._geometry_key = None
+        self._enemies_ids = None
+
+        # Results of the last solve for every turret, and changes since then
+        self._solve_method = None
+        self._turrets_results = {}
+        self._changed_polygons = []
+        self._changed_turrets = set()
 
         self.fire_segments = []
 
-    def solve(self, accuracy: int):
+    def _build_index(self):
 
-        turrets_goals = {}
-        border_y = 0  # TODO: make it = min(enemies.y)
+        # Index enemies and obstacles together, remember entity and whether it is an enemy for every polygon
+        self._indexed_entities = self.enemies + self.obstacles
+        self._indexed_enemies = [True] * len(self.enemies) + [False] * len(self.obstacles)
+        self._indexed_polygons = {e: polygon for polygon, e in enumerate(self._indexed_entities)}
+
+        self.index = UniformGrid([e.shape() for e in self._indexed_entities])
+
+    def _indexed_enemy(self, polygon: int):
+        return self._indexed_entities[polygon] if self._indexed_enemies[polygon] else None
+
+    def add_entity(self, entity: BaseEntity):
+
+        # Enemies don't occlude the view, so only turrets and obstacles change the visibility regions
+        if isinstance(entity, (Turret, Obstacle)):
+            self._regions = None
+
+        if isinstance(entity, Turret):
+            self.turrets.append(entity)
+            self._changed_turrets.add(entity)
+            return
+
+        if isinstance(entity, Obstacle):
+            self.obstacles.append(entity)
+        else:
+            self.enemies.append(entity)
+        self._insert_into_index(entity)
+
+    def remove_entity(self, entity: BaseEntity):
+
+        # Enemies don't occlude the view, so only turrets and obstacles change the visibility regions
+        if isinstance(entity, (Turret, Obstacle)):
+            self._regions = None
+
+        if isinstance(entity, Turret):
+            self.turrets.remove(entity)
+            self._turrets_results.pop(entity, None)
+            self._changed_turrets.discard(entity)
+            return
+
+        if isinstance(entity, Obstacle):
+            self.obstacles.remove(entity)
+        else:
+            self.enemies.remove(entity)
+        self._remove_from_index(entity)
+
+    def move_entity(self, entity: BaseEntity, top_left: Point):
+
+        if isinstance(entity, (Turret, Obstacle)):
+            self._regions = None
+
+        if isinstance(entity, Turret):
+            entity.top_left = top_left
+            self._changed_turrets.add(entity)
+            return
+
+        self._remove_from_index(entity)
+        entity.top_left = top_left
+        self._insert_into_index(entity)
+
+    def _insert_into_index(self, entity: BaseEntity):
+
+        self._packed = None
+        self._geometry_key = None
+        self._enemies_ids = None
+        self._changed_polygons.append(entity.edges())
+
+        # Rebuild the index when it gets too fragmented or the entity is out of its bounds
+        if not self.index.covers(entity.shape()) or self.index.extra_count > max(64, len(self._indexed_entities) // 4):
+            self._build_index()
+            return
+
+        polygon = self.index.insert(entity.shape())
+        self._indexed_entities.append(entity)
+        self._indexed_enemies.append(not isinstance(entity, Obstacle))
+        self._indexed_polygons[entity] = polygon
+
+    def _remove_from_index(self, entity: BaseEntity):
+
+        self._packed = None
+        self._geometry_key = None
+        self._enemies_ids = None
+        self._changed_polygons.append(entity.edges())
+
+        polygon = self._indexed_polygons.pop(entity)
+        self.index.remove(polygon)
+        self._indexed_entities[polygon] = None
+
+    def solve(self, accuracy: int, batched: bool = False, indexed: bool = False, workers: int = 1,
+              cache: ResultsCache = None):
+
+        self._set_solve_method(accuracy, batched, indexed)
+
+        return self._solve_all_turrets(workers, cache)
+
+    def iter_solve(self, accuracy: int, batched: bool = False, indexed: bool = False, turrets=None,
+                   exact: bool = False, workers: int = 1, cache: ResultsCache = None):
+
+        self._set_solve_method(accuracy, batched, indexed, exact)
+        self.fire_segments = []
+
+        # Turrets may come from a stream, they are added to the field and solved as soon as they come.
+        # Workers and the cache take them by batches, one pool of workers solves all batches
+        streamed = turrets is not None
+        turrets = iter(self.turrets if turrets is None else turrets)
+        batch_size = 1 if workers <= 1 and cache is None else self._stream_batch_size
+        if workers > 1:
+            self._packed_polygons()
+        with process_pool(workers, set_worker_state, (self,)) if workers > 1 else nullcontext() as pool:
+            for batch in iter(lambda: list(islice(turrets, batch_size)), []):
+                if streamed:
+                    self.turrets.extend(batch)
+
+                self._solve_turrets_batch(batch, workers, pool, cache)
+                for t in batch:
+                    achievable_enemies, fire_segments = self._turrets_results[t]
+                    self.fire_segments.extend(fire_segments)
+
+                    yield t.number, achievable_enemies
+
+    def _solve_turrets_batch(self, turrets: List[Turret], workers: int, pool, cache: ResultsCache):
+
+        method_name, args = self._solve_method
+        key = None
+        if cache is not None:
+            key = self._cache_key(turrets)
+            with profiler.phase("cache"):
+                arrays = cache.get(key)
+            if arrays is not None:
+                self._unpack_results(turrets, arrays)
+                return
+
+        with profiler.phase("solve"):
+            if pool is None:
+                results = [getattr(self, method_name)(t, *args) for t in turrets]
+            else:
+                results = self._solve_turrets_in_pool(pool, turrets, method_name, workers, args)
+            self._turrets_results.update(zip(turrets, results))
+
+        if key is not None:
+            cache.put(key, self._pack_results(turrets))
+
+    def _set_solve_method(self, accuracy: int, batched: bool, indexed: bool, exact: bool = False):
+
+        if exact:
+            self._solve_method = self._solve_turret_exact.__name__, ()
+        elif batched:
+            self._solve_method = self._solve_turret_batched.__name__, (accuracy,)
+        elif indexed:
+            self._solve_method = self._solve_turret_indexed.__name__, (accuracy,)
+        else:
+            self._solve_method = self._solve_turret.__name__, (accuracy,)
+
+    def solve_exact(self, workers: int = 1, cache: ResultsCache = None):
+
+        self._solve_method = self._solve_turret_exact.__name__, ()
+
+        return self._solve_all_turrets(workers, cache)
+
+    def resolve(self, workers: int = 1):
+
+        if self._solve_method is None:
+            raise ValueError("Field has not been solved yet")
+
+        # Only turrets, which view cones overlap changed entities, are solved again
+        changed_turrets = [t for t in self.turrets if t in self._changed_turrets or t not in self._turrets_results]
+        if self._changed_polygons:
+            changed_edges, changed_starts = self._pack_edges(self._changed_polygons)
+            for t in self.turrets:
+                if t not in changed_turrets and self._view_polygon(t).is_intersect_batch(changed_edges,
+                                                                                          changed_starts).any():
+                    changed_turrets.append(t)
+
+        return self._solve_turrets(changed_turrets, workers)
+
+    def _view_polygon(self, t: Turret):
+
+        border_y = self._border_y
+
+        # Fire segments may pass the visible border by the accuracy
+        _, args = self._solve_method
+        margin = args[0] if args else 1
+        visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
+
+        return get_polygon_of_visible_border(t.top_left, Segment(Point(visible_border.p1.x - margin, border_y),
+                                                                 Point(visible_border.p2.x + margin, border_y)))
+
+    def _solve_all_turrets(self, workers: int, cache: ResultsCache):
+
+        if cache is None:
+            return self._solve_turrets(self.turrets, workers)
+
+        # Results of the same geometry, solve method and parameters are taken from the cache
+        key = self._cache_key(self.turrets)
+        with profiler.phase("cache"):
+            arrays = cache.get(key)
+        if arrays is None:
+            turrets_goals = self._solve_turrets(self.turrets, workers)
+            cache.put(key, self._pack_results(self.turrets))
+            return turrets_goals
+
+        self._unpack_results(self.turrets, arrays)
+
+        return self._solve_turrets([], 1)
+
+    def _cache_key(self, turrets: List[Turret]):
+
+        # Enemies and obstacles are hashed once per change, only the turrets of the batch are hashed every time
+        if self._geometry_key is None:
+            self._geometry_key = ResultsCache.key(self._shapes(self.enemies), self._shapes(self.obstacles))
+
+        method_name, args = self._solve_method
+
+        return ResultsCache.key(type(self).__name__, method_name, args, Turret.view_angle, Obstacle.precision,
+                                self._shapes(turrets), self._geometry_key)
+
+    @classmethod
+    def _shapes(cls, entities: List[BaseEntity]):
+
+        # Numbers of the entities don't change results, which refer to enemies by their indices
+        return [(type(e).__name__, e.top_left.x, e.top_left.y, e.width, e.height, e.radius) for e in entities]
+
+    def _enemies_indices(self) -> Dict[int, int]:
+        if self._enemies_ids is None:
+            self._enemies_ids = {id(e): i for i, e in enumerate(self.enemies)}
+
+        return self._enemies_ids
+
+    def _pack_results(self, turrets: List[Turret]) -> Dict[str, np.ndarray]:
+
+        # Same as results of the workers: indices of achievable enemies and destinations of fire segments
+        enemies_indices = self._enemies_indices()
+        counts, enemies, destinations = [], [], []
+        for t in turrets:
+            achievable_enemies, fire_segments = self._turrets_results[t]
+            counts.append(len(achievable_enemies))
+            enemies.extend(enemies_indices[id(e)] for e in achievable_enemies)
+            destinations.extend((s.p2.x, s.p2.y) for s in fire_segments)
+
+        return {"counts": np.array(counts, dtype=np.int64),
+                "enemies": np.array(enemies, dtype=np.int64),
+                "destinations": np.array(destinations, dtype=np.float64).reshape(-1, 2)}
+
+    def _unpack_results(self, turrets: List[Turret], arrays: Dict[str, np.ndarray]):
+
+        enemies, destinations = arrays["enemies"].tolist(), arrays["destinations"].tolist()
+        start = 0
+        for t, count in zip(turrets, arrays["counts"].tolist()):
+            end = start + count
+            self._turrets_results[t] = ([self.enemies[i] for i in enemies[start:end]],
+                                        [Segment(t.top_left, Point(x, y)) for x, y in destinations[start:end]])
+            start = end
+
+    def visibility_regions(self) -> VisibilityRegions:
+
+        # Regions are kept until turrets or obstacles change
+        if self._regions is None:
+            with profiler.phase("regions"):
+                is_obstacle = ~np.array(self._indexed_enemies, dtype=bool)
+                self._regions = VisibilityRegions([(t.top_left.x, t.top_left.y) for t in self.turrets],
+                                                  [self._visibility_fan(t, is_obstacle) for t in self.turrets])
+
+        return self._regions
+
+    def turrets_covering_batch(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Turrets, which view any part of the boxes not occluded by obstacles (enemies don't occlude the view)
+        :param boxes: array of boxes (x1, y1, x2, y2) of shape (m, 4), boxes of zero size are points
+        :return: boolean array of shape (m, len(turrets)), columns are in order of the turrets
+        """
+        return self.visibility_regions().intersect_boxes(boxes)
+
+    def is_exposed_batch(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Whether enemies placed to the boxes would be viewed by any turret
+        :param boxes: array of boxes (x1, y1, x2, y2) of shape (m, 4)
+        :return: boolean array of shape (m,)
+        """
+        return self.turrets_covering_batch(boxes).any(axis=1)
+
+    def coverage_map(self, cell_size: float = 1.) -> np.ndarray:
+        """
+        Heat map of the field: number of the turrets viewing each cell, cells of 0 aren't covered by any turret,
+        their points are raster.cells_centers(coverage == 0, cell_size=cell_size)
+        :param cell_size: distance between the centers of the neighbouring cells, the cell (i, j) is the point
+                          (j * cell_size, i * cell_size)
+        :return: int32 array of shape (height / cell_size + 1, width / cell_size + 1)
+        """
+        shape = (int(self.height // cell_size) + 1, int(self.width // cell_size) + 1)
+        with profiler.phase("coverage"):
+            return self.visibility_regions().count_cells(shape, cell_size)
+
+    def _visibility_fan(self, t: Turret, is_obstacle: np.ndarray):
+
+        border_y = self._border_y
+
+        visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
+        depth = t.top_left.y - border_y
+        if depth <= 0:
+            return np.zeros(1), np.zeros((0, 4))
+
+        # Same rays as of the exact solve, obstacles in the cells of the view cone are swept by their polygons' edges
+        ray_from = (visible_border.p1.x - t.top_left.x) / depth
+        ray_to = (visible_border.p2.x - t.top_left.x) / depth
+        cells = self._view_cells(t.top_left, depth, ray_from, ray_to)
+        edges, owners = self.index.edges_in_cells(cells)
+        _, circles_owners = self.index.circles_in_cells(cells)
+        circles_owners = circles_owners[is_obstacle[circles_owners]].tolist()
+        polygons_edges = [self._indexed_entities[owner].edges() for owner in circles_owners]
+        edges = np.vstack([edges[is_obstacle[owners]]] + polygons_edges)
+        owners = np.concatenate([owners[is_obstacle[owners]]] + [np.full(len(polygon_edges), owner, dtype=np.intp)
+                                 for polygon_edges, owner in zip(polygons_edges, circles_owners)])
+        owners, rays_from, rays_to, edges = self._project_edges(t.top_left, depth, ray_from, ray_to, edges, owners)
+        is_visible = self._unoccluded(rays_from, rays_to, np.minimum(edges[:, 1], edges[:, 3]),
+                                      np.maximum(edges[:, 1], edges[:, 3]), ray_from, ray_to, depth)
+        owners, rays_from, rays_to, edges = \
+            np.asarray(owners)[is_visible], rays_from[is_visible], rays_to[is_visible], edges[is_visible]
+        x1, h1, x2, h2 = (edges[:, i].tolist() for i in range(4))
+
+        def depth_of(edge, ray):
+            if edge is None:
+                return depth
+
+            w = (ray * h1[edge] - x1[edge]) / ((x2[edge] - x1[edge]) - ray * (h2[edge] - h1[edge]))
+            return h1[edge] + w * (h2[edge] - h1[edge])
+
+        crossings = self._crossings(edges, np.zeros((0, 3)), owners, rays_from, rays_to,
+                                    self.index.overlapping_shapes(cells))
+
+        # Neighbouring intervals with the same nearest edge (or the border) are one triangle
+        rays, nearest = [ray_from], []
+        for ray_start, ray_end, edge in self._sweep_nearest_items(rays_from.tolist(), rays_to.tolist(), depth_of,
+                                                                  (ray_from, ray_to), crossings):
+            if nearest and nearest[-1] == edge:
+                rays[-1] = ray_end
+            else:
+                rays.append(ray_end)
+                nearest.append(edge)
+
+        # Far sides of the triangles from the ray start to the ray end
+        sides = []
+        for edge, ray_start, ray_end in zip(nearest, rays, rays[1:]):
+            depth_start, depth_end = depth_of(edge, ray_start), depth_of(edge, ray_end)
+            sides.append((t.top_left.x + ray_start * depth_start, t.top_left.y - depth_start,
+                          t.top_left.x + ray_end * depth_end, t.top_left.y - depth_end))
+
+        return np.array(rays, dtype=np.float64), np.array(sides, dtype=np.float64).reshape(-1, 4)
+
+    def _solve_turrets(self, turrets: List[Turret], workers: int):
+
+        method_name, args = self._solve_method
 
         # Consider every turret
+        with profiler.phase("solve"):
+            if workers > 1:
+                results = self._solve_turrets_parallel(turrets, method_name, workers, args)
+            else:
+                results = (getattr(self, method_name)(t, *args) for t in turrets)
+
+            self._turrets_results.update(zip(turrets, results))
+        self._changed_polygons = []
+        self._changed_turrets = set()
+
+        # Fix achievable enemies for every turret in order of the turrets
+        turrets_goals = {}
+        self.fire_segments = []
         for t in self.turrets:
+            achievable_enemies, fire_segments = self._turrets_results[t]
+            turrets_goals[t.number] = achievable_enemies
+            self.fire_segments.extend(fire_segments)
+
+        return turrets_goals
+
+    def _solve_turrets_parallel(self, turrets: List[Turret], method_name: str, workers: int, args: tuple):
+
+        # Build shared geometry before workers start, so they inherit it
+        self._packed_polygons()
+
+        with process_pool(workers, set_worker_state, (self,)) as pool:
+            return self._solve_turrets_in_pool(pool, turrets, method_name, workers, args)
 
-            # Get visible border (segment) from the turret, and polygon, that can be visible
-            visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
-            visible_polygon = get_polygon_of_visible_border(t.top_left, visible_border)
+    def _solve_turrets_in_pool(self, pool, turrets: List[Turret], method_name: str, workers: int, args: tuple):
 
-            # Scan enemies and find enemies that are potentially achievable from the turret
+        # Turrets are sent with the tasks, streamed turrets come after the workers have started
+        tasks = [(t, method_name, args) for t in turrets]
+        results = pool.map(_solve_turret_in_worker, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+        return [([self.enemies[i] for i in enemies_indices],
+                 [Segment(t.top_left, Point(x, y)) for x, y in destinations])
+                for t, (enemies_indices, destinations) in zip(turrets, results)]
+
+    def _solve_turret(self, t: Turret, accuracy: int):
+
+        border_y = self._border_y
+
+        # Get visible border (segment) from the turret, and polygon, that can be visible
+        visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
+        visible_polygon = get_polygon_of_visible_border(t.top_left, visible_border)
+
+        # Scan enemies and find enemies that are potentially achievable from the turret
+        with profiler.phase("cone culling"):
             possible_enemies = []
             for e in self.enemies:
                 if visible_polygon.is_intersect(e.polygon()):
                     possible_enemies.append(e)
 
-            # Try to fire to each point from border with the given accuracy
-            achievable_enemies = []
+        # Try to fire to each point from border with the given accuracy
+        achievable_enemies, fire_segments = [], []
+        with profiler.phase("ray casting"):
             for destination_x in range(int(visible_border.p1.x), int(visible_border.p2.x + accuracy), accuracy):
                 fire_segment = Segment(t.top_left, Point(destination_x, border_y))
 
@@ -167,19 +662,503 @@ class Field:
                 if achievable_enemy and achievable_enemy not in achievable_enemies:
 
                     # Is fire segment overlaps by an obstacle?
-                    achievable_obstacle = self._has_entity_achievable_from(self.obstacles, fire_segment)
+                    with profiler.phase("obstacle checks"):
+                        achievable_obstacle = self._has_entity_achievable_from(self.obstacles, fire_segment)
 
                     # If obstacle exists, is enemy closer than an obstacle?
                     if not achievable_obstacle or self._is_entity1_closer_to(t.top_left,
                                                                              achievable_enemy,
                                                                              achievable_obstacle):
                         achievable_enemies.append(achievable_enemy)
-                        self.fire_segments.append(fire_segment)
+                        fire_segments.append(fire_segment)
 
-            # Fix achievable enemies for the turret
-            turrets_goals[t.number] = achievable_enemies
+        return achievable_enemies, fire_segments
 
-        return turrets_goals
+    def _solve_turret_batched(self, t: Turret, accuracy: int):
+
+        border_y = self._border_y
+
+        # Edges of all polygons in the field are packed once
+        (enemies_edges, enemies_starts), (obstacles_edges, obstacles_starts) = self._packed_polygons()
+
+        # Get visible border (segment) from the turret, and polygon, that can be visible
+        visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
+        visible_polygon = get_polygon_of_visible_border(t.top_left, visible_border)
+
+        # Scan enemies and find enemies that are potentially achievable from the turret
+        with profiler.phase("cone culling"):
+            is_possible = visible_polygon.is_intersect_batch(enemies_edges, enemies_starts)
+            possible_enemies = [e for e, possible in zip(self.enemies, is_possible) if possible]
+            possible_edges, possible_starts = self._select_polygons(enemies_edges, enemies_starts, is_possible)
+
+        # Fire to each point from border with the given accuracy at once
+        destinations_x = np.arange(int(visible_border.p1.x), int(visible_border.p2.x + accuracy), accuracy)
+        segments = np.column_stack((np.full(len(destinations_x), t.top_left.x, dtype=np.float64),
+                                    np.full(len(destinations_x), t.top_left.y, dtype=np.float64),
+                                    destinations_x,
+                                    np.full(len(destinations_x), border_y, dtype=np.float64)))
+
+        with profiler.phase("ray casting"):
+            hit_enemies = self._first_hits(segments, possible_edges, possible_starts)
+
+        # Only fire segments that achieve an enemy are checked against obstacles
+        with profiler.phase("obstacle checks"):
+            hit_obstacles = np.full(len(segments), -1)
+            has_enemy = hit_enemies >= 0
+            hit_obstacles[has_enemy] = self._first_hits(segments[has_enemy], obstacles_edges, obstacles_starts)
+
+        achievable_enemies, fire_segments = [], []
+        for destination_x, enemy_index, obstacle_index in zip(destinations_x[has_enemy],
+                                                              hit_enemies[has_enemy],
+                                                              hit_obstacles[has_enemy]):
+            achievable_enemy = possible_enemies[enemy_index]
+            if achievable_enemy not in achievable_enemies:
+
+                # If obstacle exists, is enemy closer than an obstacle?
+                if obstacle_index < 0 or self._is_entity1_closer_to(t.top_left,
+                                                                    achievable_enemy,
+                                                                    self.obstacles[obstacle_index]):
+                    achievable_enemies.append(achievable_enemy)
+                    fire_segments.append(Segment(t.top_left, Point(int(destination_x), border_y)))
+
+        return achievable_enemies, fire_segments
+
+    def _solve_turret_indexed(self, t: Turret, accuracy: int):
+
+        border_y = self._border_y
+
+        # Get visible border (segment) from the turret
+        visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
+
+        # Try to fire to each point from border with the given accuracy
+        achievable_enemies, fire_segments = [], []
+        with profiler.phase("ray casting"):
+            for destination_x in range(int(visible_border.p1.x), int(visible_border.p2.x + accuracy), accuracy):
+                fire_segment = Segment(t.top_left, Point(destination_x, border_y))
+
+                # The nearest entity on the fire segment is achievable if it is an enemy
+                hit = self.index.nearest_hit(np.array([t.top_left.x, t.top_left.y, destination_x, border_y],
+                                                      dtype=np.float64))
+                achievable_enemy = self._indexed_enemy(hit[0]) if hit is not None else None
+                if achievable_enemy is not None:
+                    if achievable_enemy not in achievable_enemies:
+                        achievable_enemies.append(achievable_enemy)
+                        fire_segments.append(fire_segment)
+
+        return achievable_enemies, fire_segments
+
+    def _solve_turret_exact(self, t: Turret):
+
+        border_y = self._border_y
+
+        # Rays from the turret are parametrized by x offset on the border per unit of depth to the border
+        visible_border = get_visible_border_from(t.top_left, Turret.view_angle, border_y)
+        depth = t.top_left.y - border_y
+        if depth <= 0:
+            return [], []
+
+        # Sweep the view cone and find the nearest edge between every pair of neighbouring vertices
+        achievable_enemies, fire_segments = [], []
+        with profiler.phase("ray casting"):
+            for ray, polygon in self._sweep_nearest_polygons(t.top_left, depth,
+                                                             (visible_border.p1.x - t.top_left.x) / depth,
+                                                             (visible_border.p2.x - t.top_left.x) / depth):
+                achievable_enemy = self._indexed_enemy(polygon)
+                if achievable_enemy is not None and achievable_enemy not in achievable_enemies:
+                    achievable_enemies.append(achievable_enemy)
+                    fire_segments.append(Segment(t.top_left, Point(t.top_left.x + ray * depth, border_y)))
+
+        return achievable_enemies, fire_segments
+
+    def _sweep_nearest_polygons(self, p: Point, depth: float, ray_from: float, ray_to: float):
+
+        # Only shapes in the cells of the view cone are swept, and only edges of overlapping shapes cross
+        cells = self._view_cells(p, depth, ray_from, ray_to)
+        overlapping = self.index.overlapping_shapes(cells)
+
+        # Circles in front of the point are swept analytically, others are swept by their polygons' edges
+        circles_owners, circles_rays_from, circles_rays_to, circles, edges, edges_owners = \
+            self._project_circles(p, depth, ray_from, ray_to, *self.index.circles_in_cells(cells))
+
+        # Clip edges by depth (0, depth] in front of the point and project them to the rays
+        cone_edges, cone_edges_owners = self.index.edges_in_cells(cells)
+        edges_owners, rays_from, rays_to, edges = self._project_edges(p, depth, ray_from, ray_to,
+                                                                      np.vstack((cone_edges, edges)),
+                                                                      np.concatenate((cone_edges_owners, edges_owners)))
+
+        # Edges and circles behind the nearer edges are culled, only edges occlude
+        edges_count = len(edges_owners)
+        is_visible = self._unoccluded(np.concatenate((rays_from, circles_rays_from)),
+                                      np.concatenate((rays_to, circles_rays_to)),
+                                      np.concatenate((np.minimum(edges[:, 1], edges[:, 3]),
+                                                      circles[:, 1] - circles[:, 2])),
+                                      np.concatenate((np.maximum(edges[:, 1], edges[:, 3]),
+                                                      np.full(len(circles), np.inf))),
+                                      ray_from, ray_to, depth)
+        is_edge_visible, is_circle_visible = is_visible[:edges_count], is_visible[edges_count:]
+        edges_owners, rays_from, rays_to, edges = np.asarray(edges_owners)[is_edge_visible].tolist(), \
+            rays_from[is_edge_visible], rays_to[is_edge_visible], edges[is_edge_visible]
+        circles_owners, circles_rays_from, circles_rays_to, circles = \
+            np.asarray(circles_owners, dtype=np.intp)[is_circle_visible].tolist(), \
+            circles_rays_from[is_circle_visible], circles_rays_to[is_circle_visible], circles[is_circle_visible]
+
+        x1, h1, x2, h2 = (edges[:, i].tolist() for i in range(4))
+        center_x, center_h, radius = (circles[:, i].tolist() for i in range(3))
+
+        # Items of the sweep are edges followed by circles
+        edges_count = len(edges_owners)
+        owners = edges_owners + circles_owners
+
+        def depth_of(item, ray):
+            if item < edges_count:
+                # Depth of the intersection of the edge with the ray
+                w = (ray * h1[item] - x1[item]) / ((x2[item] - x1[item]) - ray * (h2[item] - h1[item]))
+                return h1[item] + w * (h2[item] - h1[item])
+
+            # Depth of the nearest intersection of the circle with the ray
+            item -= edges_count
+            b = ray * center_x[item] + center_h[item]
+            a = ray * ray + 1
+            c = center_x[item] * center_x[item] + center_h[item] * center_h[item] - radius[item] * radius[item]
+            return (b - sqrt(max(b * b - a * c, 0.))) / a
+
+        rays_from, rays_to = np.concatenate((rays_from, circles_rays_from)), np.concatenate((rays_to, circles_rays_to))
+        crossings = self._crossings(edges, circles, owners, rays_from, rays_to, overlapping)
+        for ray_start, ray_end, item in self._sweep_nearest_items(rays_from.tolist(), rays_to.tolist(), depth_of,
+                                                                  crossings=crossings):
+            if item is not None:
+                yield (ray_start + ray_end) / 2, owners[item]
+
+    @classmethod
+    def _unoccluded(cls, rays_from: np.ndarray, rays_to: np.ndarray, near_depths: np.ndarray, far_depths: np.ndarray,
+                    ray_from: float, ray_to: float, depth: float) -> np.ndarray:
+        """
+        Culls the items, which are behind a nearer item on every ray between their rays. Bins of the rays keep the
+        nearest far depth of the items spanning the whole bin, an item is hidden if it is farther than all bins it
+        touches
+        :param rays_from: first rays of the items
+        :param rays_to: last rays of the items
+        :param near_depths: lower bounds of the depths of the items
+        :param far_depths: upper bounds of the depths of the items, inf for items, which don't occlude
+        :param ray_from: first ray of the view
+        :param ray_to: last ray of the view
+        :param depth: depth of the border, which occludes everything behind it
+        :return: mask of the items, which may be the nearest on some ray
+        """
+        bins_count = cls._occlusion_bins
+        scale = bins_count / (ray_to - ray_from) if ray_from < ray_to else 0.
+        bins_from = np.clip((rays_from - ray_from) * scale, 0, bins_count)
+        bins_to = np.clip((rays_to - ray_from) * scale, 0, bins_count)
+
+        # Nearest far depth in every bin of the items spanning the whole bin
+        spanned_from = np.ceil(bins_from).astype(np.intp)
+        spanned_counts = np.maximum(np.floor(bins_to).astype(np.intp) - spanned_from, 0)
+        spanned_counts[~np.isfinite(far_depths)] = 0
+        spanned = np.repeat(spanned_from - np.cumsum(spanned_counts) + spanned_counts, spanned_counts) + \
+            np.arange(spanned_counts.sum())
+        bounds = np.full(bins_count, float(depth))
+        np.minimum.at(bounds, spanned, np.repeat(far_depths, spanned_counts))
+
+        # Farthest bound of the bins touched by every item, by a sparse table of the maxima of 2^k bins
+        touched_from = np.minimum(np.floor(bins_from).astype(np.intp), bins_count - 1)
+        touched_counts = np.maximum(np.ceil(bins_to).astype(np.intp) - touched_from, 1)
+        levels = np.floor(np.log2(touched_counts)).astype(np.intp)
+        maxima = [bounds]
+        while 1 << len(maxima) <= bins_count:
+            width = 1 << len(maxima) - 1
+            maxima.append(np.maximum(maxima[-1][:-width], maxima[-1][width:]))
+        farthest = np.full(len(levels), -np.inf)
+        for level, level_maxima in enumerate(maxima):
+            is_level = levels == level
+            first, last = touched_from[is_level], touched_from[is_level] + touched_counts[is_level] - (1 << level)
+            farthest[is_level] = np.maximum(level_maxima[first], level_maxima[last])
+
+        return near_depths <= farthest
+
+    @classmethod
+    def _sweep_nearest_items(cls, rays_from: List[float], rays_to: List[float], depth_of, bounds=(), crossings=()):
+
+        # Intervals between consecutive rays through the ends of the items, their crossings (and the bounds) with
+        # the nearest item on the rays of the interval, None if there are no items
+        starts, ends, swaps = {}, {}, {}
+        for item, (ray_start, ray_end) in enumerate(zip(rays_from, rays_to)):
+            ray_start, ray_end = round(ray_start, cls._ray_digits), round(ray_end, cls._ray_digits)
+            if ray_start < ray_end:
+                starts.setdefault(ray_start, []).append(item)
+                ends.setdefault(ray_end, []).append(item)
+        for ray, item_1, item_2 in crossings:
+            swaps.setdefault(round(ray, cls._ray_digits), set()).update((item_1, item_2))
+        events = sorted(set(starts) | set(ends) | set(swaps) | set(round(ray, cls._ray_digits) for ray in bounds))
+
+        # Active items ordered by depth along the current ray, items cross only at the events,
+        # so the order stays valid between events
+        active = DepthOrder(depth_of)
+        for i, event in enumerate(events):
+
+            # Crossing items are taken out and put back in their new order
+            for item in ends.get(event, []):
+                active.remove(item)
+            swapped = [item for item in swaps.get(event, ()) if item in active]
+            for item in swapped:
+                active.remove(item)
+
+            if i + 1 == len(events):
+                break
+
+            ray = (event + events[i + 1]) / 2
+            for item in starts.get(event, []) + swapped:
+                active.insert(item, ray)
+
+            yield event, events[i + 1], active.first()
+
+    @classmethod
+    def _crossings(cls, edges: np.ndarray, circles: np.ndarray, owners: List[int], rays_from: np.ndarray,
+                   rays_to: np.ndarray, overlapping: np.ndarray):
+
+        # Items (edges followed by circles) of every pair of overlapping shapes are paired with each other
+        owners = np.array(owners, dtype=np.intp)
+        order = np.argsort(owners, kind='stable')
+        firsts = np.searchsorted(owners[order], overlapping, side='left')
+        counts = np.searchsorted(owners[order], overlapping, side='right') - firsts
+        pairs_counts = counts[:, 0] * counts[:, 1]
+        pairs = np.repeat(np.arange(len(overlapping)), pairs_counts)
+        offsets = np.arange(pairs_counts.sum()) - np.repeat(np.cumsum(pairs_counts) - pairs_counts, pairs_counts)
+        items_1 = order[firsts[pairs, 0] + offsets // counts[pairs, 1]]
+        items_2 = order[firsts[pairs, 1] + offsets % counts[pairs, 1]]
+        items_1, items_2 = np.minimum(items_1, items_2), np.maximum(items_1, items_2)
+
+        # Points, where the items cross: edges inside both of them, circles on their near arcs
+        edges_count = len(edges)
+        is_edge_1, is_edge_2 = items_1 < edges_count, items_2 < edges_count
+        is_arc = is_edge_1 & ~is_edge_2
+        edges_points, edges_1, edges_2 = cls._edges_crossings(edges, items_1[is_edge_2], items_2[is_edge_2])
+        arcs_points, arcs_edges, arcs_circles = cls._edge_circle_crossings(edges, circles, items_1[is_arc],
+                                                                           items_2[is_arc] - edges_count)
+        circles_points, circles_1, circles_2 = cls._circles_crossings(circles, items_1[~is_edge_1] - edges_count,
+                                                                      items_2[~is_edge_1] - edges_count)
+        points = np.vstack((edges_points, arcs_points, circles_points))
+        items_1 = np.concatenate((edges_1, arcs_edges, circles_1 + edges_count))
+        items_2 = np.concatenate((edges_2, arcs_circles + edges_count, circles_2 + edges_count))
+
+        # Rays through the points inside the rays of both items
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rays = points[:, 0] / points[:, 1]
+        is_crossing = (0 < points[:, 1]) & (np.maximum(rays_from[items_1], rays_from[items_2]) < rays) & \
+                      (rays < np.minimum(rays_to[items_1], rays_to[items_2]))
+
+        return zip(rays[is_crossing].tolist(), items_1[is_crossing].tolist(), items_2[is_crossing].tolist())
+
+    @classmethod
+    def _edges_crossings(cls, edges: np.ndarray, edges_1: np.ndarray, edges_2: np.ndarray):
+
+        start_1, direction_1 = edges[edges_1, 0:2], edges[edges_1, 2:4] - edges[edges_1, 0:2]
+        start_2, direction_2 = edges[edges_2, 0:2], edges[edges_2, 2:4] - edges[edges_2, 0:2]
+        offset = start_2 - start_1
+        denominator = direction_1[:, 0] * direction_2[:, 1] - direction_1[:, 1] * direction_2[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w_1 = (offset[:, 0] * direction_2[:, 1] - offset[:, 1] * direction_2[:, 0]) / denominator
+            w_2 = (offset[:, 0] * direction_1[:, 1] - offset[:, 1] * direction_1[:, 0]) / denominator
+        is_inside = (0 < w_1) & (w_1 < 1) & (0 < w_2) & (w_2 < 1)
+
+        return start_1[is_inside] + w_1[is_inside, None] * direction_1[is_inside], edges_1[is_inside], \
+            edges_2[is_inside]
+
+    @classmethod
+    def _edge_circle_crossings(cls, edges: np.ndarray, circles: np.ndarray, edges_1: np.ndarray,
+                               circles_2: np.ndarray):
+
+        # Both roots of |start + w * direction - center| = radius
+        start, direction = edges[edges_1, 0:2], edges[edges_1, 2:4] - edges[edges_1, 0:2]
+        centers, radius = circles[circles_2, 0:2], circles[circles_2, 2]
+        offset = start - centers
+        a = np.einsum('ij,ij->i', direction, direction)
+        b = np.einsum('ij,ij->i', offset, direction)
+        root = np.sqrt(np.maximum(b * b - a * (np.einsum('ij,ij->i', offset, offset) - radius * radius), 0.))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w = np.concatenate(((-b - root) / a, (-b + root) / a))
+        points = np.tile(start, (2, 1)) + w[:, None] * np.tile(direction, (2, 1))
+        edges_1, circles_2 = np.tile(edges_1, 2), np.tile(circles_2, 2)
+        is_inside = (0 < w) & (w < 1) & np.tile(b * b - a * (np.einsum('ij,ij->i', offset, offset) - radius * radius)
+                                                > 0, 2) & cls._is_on_near_arc(points, circles[circles_2])
+
+        return points[is_inside], edges_1[is_inside], circles_2[is_inside]
+
+    @classmethod
+    def _circles_crossings(cls, circles: np.ndarray, circles_1: np.ndarray, circles_2: np.ndarray):
+
+        # Points on the chord of the circles, symmetric about the line of the centers
+        centers_1, radius_1 = circles[circles_1, 0:2], circles[circles_1, 2]
+        centers_2, radius_2 = circles[circles_2, 0:2], circles[circles_2, 2]
+        direction = centers_2 - centers_1
+        distance = np.hypot(direction[:, 0], direction[:, 1])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            along = (radius_1 * radius_1 - radius_2 * radius_2 + distance * distance) / (2 * distance)
+            across = np.sqrt(radius_1 * radius_1 - along * along)
+            middle = centers_1 + (along / distance)[:, None] * direction
+            normal = np.column_stack((-direction[:, 1], direction[:, 0])) * (across / distance)[:, None]
+        points = np.vstack((middle - normal, middle + normal))
+        circles_1, circles_2 = np.tile(circles_1, 2), np.tile(circles_2, 2)
+        is_inside = np.tile(across > 0, 2) & cls._is_on_near_arc(points, circles[circles_1]) & \
+            cls._is_on_near_arc(points, circles[circles_2])
+
+        return points[is_inside], circles_1[is_inside], circles_2[is_inside]
+
+    @classmethod
+    def _is_on_near_arc(cls, points: np.ndarray, circles: np.ndarray):
+
+        # Rays enter the circles through the points of the arcs facing the origin
+        return np.einsum('ij,ij->i', points - circles[:, 0:2], points) < 0
+
+    def _view_cells(self, p: Point, depth: float, ray_from: float, ray_to: float):
+
+        # Cells of the index overlapped by the view cone from the point to the border
+        return self.index.cells_in_triangle((p.x, p.y), (p.x + ray_from * depth, p.y - depth),
+                                            (p.x + ray_to * depth, p.y - depth))
+
+    def _project_circles(self, p: Point, depth: float, ray_from: float, ray_to: float, circles: np.ndarray,
+                         owners: np.ndarray):
+
+        # Circles relative to the point: x offset and depth of the center (distance along y towards the border)
+        center_x, center_h, radius = circles[:, 0] - p.x, p.y - circles[:, 1], circles[:, 2]
+        is_analytic = (center_h - radius > depth * 1e-9) & (center_h + radius <= depth)
+
+        # Circles crossing the depth range are clipped as polygons
+        fallback = [self._indexed_entities[owner] for owner in owners[~is_analytic].tolist()]
+        fallback_edges = [e.edges() for e in fallback]
+        fallback_owners = [np.full(len(edges), owner, dtype=np.intp)
+                           for edges, owner in zip(fallback_edges, owners[~is_analytic].tolist())]
+
+        # Rays tangent to the circles, clipped by the view cone
+        half_angles = get_overlapping_angles_for_circles(p, circles[is_analytic]) / 2
+        center_angles = np.arctan2(center_x[is_analytic], center_h[is_analytic])
+        rays_from = np.maximum(np.tan(center_angles - half_angles), ray_from)
+        rays_to = np.minimum(np.tan(center_angles + half_angles), ray_to)
+
+        is_visible = rays_from < rays_to
+        circles = np.column_stack((center_x, center_h, radius))[is_analytic][is_visible]
+
+        return owners[is_analytic][is_visible].tolist(), rays_from[is_visible], rays_to[is_visible], circles, \
+            np.vstack(fallback_edges) if fallback_edges else np.zeros((0, 4)), \
+            np.concatenate(fallback_owners) if fallback_owners else np.zeros(0, dtype=np.intp)
+
+    def _project_edges(self, p: Point, depth: float, ray_from: float, ray_to: float, edges: np.ndarray,
+                       owners: np.ndarray):
+
+        # Edges relative to the point: x offset and depth (distance along y towards the border)
+        edges = np.column_stack((edges[:, 0] - p.x, p.y - edges[:, 1], edges[:, 2] - p.x, p.y - edges[:, 3]))
+
+        # Clip edges by the depth range
+        min_depth = depth * 1e-9
+        depth_diff = edges[:, 3] - edges[:, 1]
+        is_flat = depth_diff == 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            w_min = (min_depth - edges[:, 1]) / depth_diff
+            w_max = (depth - edges[:, 1]) / depth_diff
+        w_from = np.where(is_flat, 0., np.maximum(0., np.minimum(w_min, w_max)))
+        w_to = np.where(is_flat, 1., np.minimum(1., np.maximum(w_min, w_max)))
+        is_in_depth = np.where(is_flat, (min_depth <= edges[:, 1]) & (edges[:, 1] <= depth), w_from < w_to)
+
+        direction = edges[:, 2:4] - edges[:, 0:2]
+        edges = np.hstack((edges[:, 0:2] + w_from[:, None] * direction, edges[:, 0:2] + w_to[:, None] * direction))
+
+        # Rays through the ends of the edges, clipped by the view cone
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rays_1, rays_2 = edges[:, 0] / edges[:, 1], edges[:, 2] / edges[:, 3]
+        rays_from = np.maximum(np.minimum(rays_1, rays_2), ray_from)
+        rays_to = np.minimum(np.maximum(rays_1, rays_2), ray_to)
+
+        # Edges collinear with a ray are covered by the neighbouring edges of their polygon
+        is_visible = is_in_depth & (rays_from < rays_to)
+        indices = np.flatnonzero(is_visible)
+
+        return owners[indices].tolist(), rays_from[indices], rays_to[indices], edges[indices]
+
+    def _packed_polygons(self):
+        if self._packed is None:
+            self._packed = self._pack_polygons(self.enemies), self._pack_polygons(self.obstacles)
+
+        return self._packed
+
+    @classmethod
+    def _pack_polygons(cls, entities: List[BaseEntity]):
+
+        return cls._pack_edges([e.edges() for e in entities])
+
+    @classmethod
+    def _pack_edges(cls, polygons_edges: List[np.ndarray]):
+
+        # Edges of all polygons one after another, and index of the first edge of every polygon
+        edges_starts = np.cumsum([0] + [len(edges) for edges in polygons_edges[:-1]], dtype=np.intp)
+
+        if not polygons_edges:
+            return np.zeros((0, 4)), np.zeros(0, dtype=np.intp)
+
+        return np.vstack(polygons_edges), edges_starts
+
+    @classmethod
+    def _select_polygons(cls, edges: np.ndarray, edges_starts: np.ndarray, mask: np.ndarray):
+
+        edges_counts = np.diff(np.append(edges_starts, len(edges)))
+        selected_counts = edges_counts[mask]
+        selected_starts = np.cumsum(selected_counts, dtype=np.intp) - selected_counts
+
+        return edges[np.repeat(mask, edges_counts)], selected_starts
+
+    @classmethod
+    def _first_hits(cls, segments: np.ndarray, edges: np.ndarray, edges_starts: np.ndarray):
+
+        # Index of the first polygon achieved by every segment, -1 if none
+        first_hits = np.full(len(segments), -1)
+        if len(edges_starts) == 0 or len(segments) == 0:
+            return first_hits
+
+        # Segments fired from one point towards the border are parametrized by their rays, polygons by the interval
+        # of rays through their vertices
+        origin = segments[0, :2]
+        depths = origin[1] - segments[:, 3]
+        if (segments[:, :2] == origin).all() and (depths > 0).all():
+            rays = (segments[:, 2] - origin[0]) / depths
+            polygons_from, polygons_to = cls._polygons_rays(origin, edges, edges_starts)
+        else:
+            rays = None
+
+        for begin in range(0, len(segments), cls._rays_group_size):
+            group = slice(begin, begin + cls._rays_group_size)
+
+            # Only polygons in the rays of the group (with a margin for rounding) are tested
+            if rays is None:
+                candidates = np.arange(len(edges_starts))
+                candidate_edges, candidate_starts = edges, edges_starts
+            else:
+                margin = 1e-9 * (1 + np.abs(rays[group]).max())
+                is_candidate = (polygons_from <= rays[group].max() + margin) & \
+                               (polygons_to >= rays[group].min() - margin)
+                candidates = np.flatnonzero(is_candidate)
+                if len(candidates) == 0:
+                    continue
+                candidate_edges, candidate_starts = cls._select_polygons(edges, edges_starts, is_candidate)
+
+            group_segments = segments[group]
+            chunk = max(1, cls._batch_size // len(candidate_edges))
+            for chunk_begin in range(0, len(group_segments), chunk):
+                hits = intersect_polygons_batch(group_segments[chunk_begin:chunk_begin + chunk], candidate_edges,
+                                                candidate_starts)
+                first_hits[begin + chunk_begin:begin + chunk_begin + len(hits)] = \
+                    np.where(hits.any(axis=1), candidates[hits.argmax(axis=1)], -1)
+
+        return first_hits
+
+    @classmethod
+    def _polygons_rays(cls, origin: np.ndarray, edges: np.ndarray, edges_starts: np.ndarray):
+
+        # Rays through the vertices of the polygons, polygons reaching the origin's depth may be on any ray
+        depths = origin[1] - edges[:, 1]
+        is_ahead = depths > 0
+        rays = (edges[:, 0] - origin[0]) / np.where(is_ahead, depths, 1)
+        rays_from = np.minimum.reduceat(np.where(is_ahead, rays, -np.inf), edges_starts)
+        rays_to = np.maximum.reduceat(np.where(is_ahead, rays, np.inf), edges_starts)
+
+        return rays_from, rays_to
 
     @classmethod
     def _is_entity1_closer_to(cls, p: Point, e1: BaseEntity, e2: BaseEntity):
@@ -221,3 +1200,32 @@ class Field:
                                s.p2.x, s.p2.y,
                                fill="red",
                                dash=(1, 1))
+
+    def render(self, canvas: ImageCanvas):
+
+        canvas.create_ovals([(t.top_left.x - 1, t.top_left.y - 1, t.top_left.x + 1, t.top_left.y + 1)
+                             for t in self.turrets])
+
+        canvas.create_rectangles([(e.top_left.x, e.top_left.y, e.top_left.x + e.width, e.top_left.y + e.height)
+                                  for e in self.enemies])
+
+        canvas.create_ovals([(o.top_left.x - o.radius, o.top_left.y - o.radius,
+                              o.top_left.x + o.radius, o.top_left.y + o.radius)
+                             for o in self.obstacles if o.radius])
+        canvas.create_rectangles([(o.top_left.x, o.top_left.y, o.top_left.x + o.width, o.top_left.y + o.height)
+                                  for o in self.obstacles if not o.radius])
+
+        canvas.create_lines([(s.p1.x, s.p1.y, s.p2.x, s.p2.y) for s in self.fire_segments],
+                            fill=(255, 0, 0),
+                            dash=(1, 1))
+
+
+def _solve_turret_in_worker(task):
+    t, method_name, args = task
+
+    field = worker_state()
+    achievable_enemies, fire_segments = getattr(field, method_name)(t, *args)
+
+    # Send back indices and coordinates only, the parent process maps them to its own entities
+    enemies_indices = field._enemies_indices()
+    return [enemies_indices[id(e)] for e in achievable_enemies], [(s.p2.x, s.p2.y) for s in fire_segments]
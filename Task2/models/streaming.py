@@ -0,0 +1,249 @@
+import json
+import re
+from itertools import chain
+from typing import Dict, Iterator, Tuple, TextIO, Optional
+
+from models.entities import EntitiesTypes, Field, Turret
+from utils.shared import ResultsCache, profiler
+
+
+_types_categories = {
+    EntitiesTypes.E_TANK: EntitiesTypes.ENEMIES,
+    EntitiesTypes.E_CARRIER: EntitiesTypes.ENEMIES,
+    EntitiesTypes.T_TURRET: EntitiesTypes.TURRETS,
+    EntitiesTypes.O_ROUND: EntitiesTypes.OBSTACLES,
+    EntitiesTypes.O_SQUARE: EntitiesTypes.OBSTACLES,
+}
+
+# Size of the field, which a JSON document may have along with the entities
+_field_size = ("width", "height")
+
+# The first object of the stream up to its first list or its end. A JSON document has lists of entities,
+# an NDJSON line is a flat entity with a type, strings are skipped as they may have brackets
+_first_object = re.compile(r'\s*\{((?:[^\[\]{}"]|"(?:[^"\\]|\\.)*")*)([\[{}])')
+_type_key = re.compile(r'"type"\s*:')
+
+
+class _StreamBuffer:
+    """
+    Text read from the stream by chunks, consumed text is dropped
+    """
+
+    def __init__(self, stream: TextIO, chunk_size: int):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._text = ""
+        self._position = 0
+        self._eof = False
+
+    def _read(self) -> bool:
+        if self._eof:
+            return False
+
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+
+        self._text = self._text[self._position:] + chunk
+        self._position = 0
+        return True
+
+    def peek(self) -> Optional[str]:
+        """
+        Skips whitespaces and returns the next character, None at the end of the stream
+        """
+        while True:
+            while self._position < len(self._text) and self._text[self._position].isspace():
+                self._position += 1
+            if self._position < len(self._text):
+                return self._text[self._position]
+            if not self._read():
+                return None
+
+    def lookahead(self, pattern, limit: int = 1 << 12):
+        """
+        Matches the pattern at the current position without consuming the text, the stream is read
+        until the pattern matches or the limit of the text length is reached
+        """
+        while True:
+            match = pattern.match(self._text, self._position)
+            if match or len(self._text) - self._position >= limit or not self._read():
+                return match
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if character is None or character not in characters:
+            raise ValueError("Expected one of '%s' in entities stream, got %r" % (characters, character))
+        self._position += 1
+
+        return character
+
+    def decode(self):
+        """
+        Decodes the next JSON value, the stream is read until the value is complete
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._text, self._position)
+            except json.JSONDecodeError:
+                if not self._read():
+                    raise
+                continue
+
+            # A number can be cut at the end of the chunk
+            if end == len(self._text) and not isinstance(value, (dict, list, str)) and self._read():
+                continue
+
+            self._position = end
+            return value
+
+
+def iter_entities(stream: TextIO, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Optional[Dict]]]:
+    """
+    Parses entities from the stream incrementally. The stream is either a JSON document in the format
+    of input/entities.json or NDJSON, one entity object per line, with turrets after enemies and obstacles.
+    :param stream: text stream
+    :param chunk_size: size of the chunks read from the stream
+    :return: generator of pairs (category, entity), category is one of EntitiesTypes.ENEMIES, TURRETS or OBSTACLES,
+             the pair (category, None) marks the end of the category. Other values of a JSON document, e.g. the size
+             of the field, are pairs (key, value)
+    """
+    buffer = _StreamBuffer(stream, chunk_size)
+    if buffer.peek() is None:
+        return
+
+    # JSON document is an object of lists, NDJSON lines are entities
+    match = buffer.lookahead(_first_object)
+    if match is None or match.group(2) != "}" or not _type_key.search(match.group(1)):
+        yield from _iter_document_entities(buffer)
+    else:
+        yield from _iter_lines_entities(buffer)
+
+
+def _iter_lines_entities(buffer: _StreamBuffer):
+
+    e, has_turrets = buffer.decode(), False
+    while e is not None:
+        if e.get("type") not in _types_categories:
+            raise ValueError("Unknown entity type")
+        category = _types_categories[e["type"]]
+
+        # The first turret ends enemies and obstacles
+        if category == EntitiesTypes.TURRETS and not has_turrets:
+            has_turrets = True
+            yield EntitiesTypes.ENEMIES, None
+            yield EntitiesTypes.OBSTACLES, None
+        elif category != EntitiesTypes.TURRETS and has_turrets:
+            raise ValueError("Enemies and obstacles must precede turrets in entities stream")
+
+        yield category, e
+        e = buffer.decode() if buffer.peek() is not None else None
+
+    if not has_turrets:
+        yield EntitiesTypes.ENEMIES, None
+        yield EntitiesTypes.OBSTACLES, None
+    yield EntitiesTypes.TURRETS, None
+
+
+def _iter_document_entities(buffer: _StreamBuffer):
+
+    buffer.expect("{")
+    if buffer.peek() == "}":
+        return
+    category = buffer.decode()
+    while True:
+        buffer.expect(":")
+
+        # Values other than lists of entities (e.g. size of the field) are passed as they are
+        if buffer.peek() != "[":
+            yield category, buffer.decode()
+        else:
+            buffer.expect("[")
+            if buffer.peek() == "]":
+                buffer.expect("]")
+            else:
+                while True:
+                    yield category, buffer.decode()
+                    if buffer.expect(",]") == "]":
+                        break
+            yield category, None
+
+        if buffer.expect(",}") == "}":
+            break
+        category = buffer.decode()
+
+
+def load_stream(width: int, height: int, stream: TextIO) -> Tuple[Field, Iterator[Turret]]:
+    """
+    Loads enemies and obstacles of the stream into the field, turrets are parsed as they are consumed.
+    The size of the field in a JSON document takes the place of the given one.
+    Only the text of the stream is held by chunks: enemies and obstacles are kept in the field as entities,
+    as all of them are needed to solve any turret, and consumed turrets are added to the field when solved
+    :param width: width of the field
+    :param height: height of the field
+    :param stream: text stream of entities (see iter_entities)
+    :return: field without turrets and generator of the turrets
+    """
+    entities = iter_entities(stream)
+
+    # Enemies and obstacles are read first, turrets before them are postponed
+    size = {"width": width, "height": height}
+    parsed = {EntitiesTypes.TURRETS: [], EntitiesTypes.ENEMIES: [], EntitiesTypes.OBSTACLES: []}
+    completed = set()
+    with profiler.phase("parsing"):
+        for category, e in entities:
+            if category not in parsed:
+                if category in size:
+                    size[category] = e
+            elif e is None:
+                completed.add(category)
+                if EntitiesTypes.ENEMIES in completed and EntitiesTypes.OBSTACLES in completed:
+                    break
+            else:
+                parsed[category].append(Field._parse_entity(e))
+
+    field = Field.from_entities(size["width"], size["height"], [], parsed[EntitiesTypes.ENEMIES],
+                                parsed[EntitiesTypes.OBSTACLES])
+
+    return field, chain(parsed[EntitiesTypes.TURRETS], _iter_turrets(entities, field))
+
+
+def solve_stream(width: int, height: int, stream: TextIO, accuracy: int, batched: bool = False,
+                 indexed: bool = False, exact: bool = False, workers: int = 1,
+                 cache: ResultsCache = None) -> Iterator[Tuple[int, list]]:
+    """
+    Loads the field from the stream and solves turrets as they come. Entities are parsed into
+    the field as they are read, turrets are solved as soon as all enemies and obstacles are read.
+    Memory grows with the number of entities, as the field keeps the solved turrets and their results for
+    resolve, only the text of the stream and the unsolved turrets aren't held at once (see load_stream).
+    :param width: width of the field
+    :param height: height of the field
+    :param stream: text stream of entities (see iter_entities)
+    :param accuracy: accuracy of the solve
+    :param batched: use the batched solve
+    :param indexed: use the indexed solve
+    :param exact: use the exact solve, the accuracy is not used
+    :param workers: number of the processes solving turrets by batches
+    :param cache: cache of the results of the batches of turrets
+    :return: generator of pairs (turret number, goals list)
+    """
+    field, turrets = load_stream(width, height, stream)
+
+    yield from field.iter_solve(accuracy, batched, indexed, turrets, exact, workers, cache)
+
+
+def _iter_turrets(entities: Iterator[Tuple[str, Optional[Dict]]], field: Field):
+    for category, e in entities:
+        if category not in _types_categories.values():
+            # Size of the field may follow the turrets
+            if category in _field_size:
+                setattr(field, category, e)
+            continue
+        if e is None:
+            continue
+        if category != EntitiesTypes.TURRETS:
+            raise ValueError("Enemies and obstacles must precede turrets in entities stream")
+        yield Field._parse_entity(e)
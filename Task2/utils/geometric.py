@@ -1,8 +1,13 @@
-from math import sqrt, cos, asin
+from math import sqrt, cos, asin, pi
 from typing import List
 
+import numpy as np
+
+from utils.shared import geometry, profiler
+
 
 class Point:
+    __slots__ = ('x', 'y')
 
     def __init__(self, x: int, y: int):
         self.x = x
@@ -16,6 +21,8 @@ class Point:
 
 
 class Segment:
+    __slots__ = ('p1', 'p2')
+
     def __init__(self, p1: Point, p2: Point):
         self.p1 = p1
         self.p2 = p2
@@ -52,10 +59,38 @@ class Segment:
         return False
 
 
+class Circle:
+    __slots__ = ('center', 'radius')
+
+    def __init__(self, center: Point, radius: int):
+        self.center = center
+        self.radius = radius
+
+    def to_array(self) -> np.ndarray:
+        """
+        :return: array (x, y, radius)
+        """
+        return np.array([self.center.x, self.center.y, self.radius], dtype=np.float64)
+
+
 class Polygon:
+    __slots__ = ('segments', '_edges')
 
     def __init__(self, segments: List[Segment]):
         self.segments = segments
+        self._edges = None
+
+    @classmethod
+    def from_array(cls, edges: np.ndarray):
+        """
+        Builds the polygon from an array of segments of shape (n, 4), the array is kept as its packed representation
+        :param edges: array of segments
+        :return: polygon
+        """
+        polygon = cls([Segment(Point(x1, y1), Point(x2, y2)) for x1, y1, x2, y2 in edges.tolist()])
+        polygon._edges = edges
+
+        return polygon
 
     def points(self):
         all_points = set()
@@ -66,6 +101,16 @@ class Polygon:
 
         return list(all_points)
 
+    def to_array(self) -> np.ndarray:
+        """
+        Packs segments of the polygon into an array of shape (n, 4), one row (x1, y1, x2, y2) per segment
+        :return: array of segments
+        """
+        if self._edges is None:
+            self._edges = segments_to_array(self.segments)
+
+        return self._edges
+
     def is_intersect(self, other_polygon):
 
         # If current polygon contains another - they intersect
@@ -81,6 +126,27 @@ class Polygon:
         # Otherwise - not
         return False
 
+    def is_intersect_batch(self, edges: np.ndarray, edges_starts: np.ndarray) -> np.ndarray:
+        """
+        Vectorized is_intersect against many polygons, packed as for intersect_polygons_batch
+        :param edges: edges of all polygons, packed one polygon after another, of shape (m, 4)
+        :param edges_starts: index of the first edge of every polygon in edges, of shape (k,)
+        :return: boolean array of shape (k,)
+        """
+        if len(edges_starts) == 0:
+            return np.zeros(0, dtype=bool)
+
+        own_edges = self.to_array()
+
+        # Every point of another polygon is inside of the polygon (odd intersections count)
+        is_inside = geometry.contain_points(own_edges, edges[:, 0:2], 1000)
+        is_contained = np.logical_and.reduceat(is_inside, edges_starts)
+
+        # Any pair of the polygons' segments intersect
+        is_crossed = np.logical_or.reduceat(intersect_batch(own_edges, edges).any(axis=0), edges_starts)
+
+        return is_contained | is_crossed
+
     def is_contain(self, other_polygon):
 
         for p in other_polygon.points():
@@ -148,7 +214,119 @@ def get_overlapping_angle_for_circle(p: Point, circle_center: Point, radius: int
     :param p: point of view
     :param circle_center: center of the circle
     :param radius: circle radius
-    :return: angle in degrees
+    :return: angle in radians (2 * pi if the point is inside of the circle)
+    """
+    distance = sqrt(pow(p.x - circle_center.x, 2) + pow(p.y - circle_center.y, 2))
+    if distance <= radius:
+        return 2 * pi
+
+    return 2 * asin(radius / distance)
+
+
+def get_overlapping_angles_for_circles(p: Point, circles: np.ndarray) -> np.ndarray:
+    """
+    Vectorized get_overlapping_angle_for_circle
+    :param p: point of view
+    :param circles: array of circles (x, y, radius) of shape (n, 3)
+    :return: array of angles in radians of shape (n,)
+    """
+    distances = np.hypot(circles[:, 0] - p.x, circles[:, 1] - p.y)
+    is_outside = distances > circles[:, 2]
+
+    return np.where(is_outside, 2 * np.arcsin(circles[:, 2] / np.where(is_outside, distances, 1)), 2 * pi)
+
+
+def segments_to_array(segments: List[Segment]) -> np.ndarray:
+    """
+    Packs segments into an array of shape (n, 4), one row (x1, y1, x2, y2) per segment
+    :param segments: list of segments
+    :return: array of segments
+    """
+    return np.array([(s.p1.x, s.p1.y, s.p2.x, s.p2.y) for s in segments], dtype=np.float64).reshape(-1, 4)
+
+
+def orientation_batch(segments: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Vectorized Segment.orientation: orientation of every point relative to every segment
+    :param segments: array of segments of shape (n, 4)
+    :param points: array of points of shape (m, 2)
+    :return: array of shape (n, m) with values -1, 0 or 1
+    """
+    return geometry.orientation(segments[:, None, 0:2], segments[:, None, 2:4], points[None, :])
+
+
+def intersect_batch(segments: np.ndarray, other_segments: np.ndarray) -> np.ndarray:
     """
-    # TODO: implement special case
-    return 2 * asin(radius / Segment(p, circle_center).length())
+    Vectorized Segment.is_intersect: tests every segment against every other segment
+    :param segments: array of segments of shape (n, 4)
+    :param other_segments: array of segments of shape (m, 4)
+    :return: boolean array of shape (n, m)
+    """
+    profiler.count("intersect_batch segment pairs", len(segments) * len(other_segments))
+    return geometry.intersect_matrix(segments, other_segments)
+
+
+def intersect_polygons_batch(segments: np.ndarray, edges: np.ndarray, edges_starts: np.ndarray) -> np.ndarray:
+    """
+    Vectorized Segment.is_intersect_polygon for many segments and many polygons at once
+    :param segments: array of segments of shape (n, 4)
+    :param edges: edges of all polygons, packed one polygon after another, of shape (m, 4)
+    :param edges_starts: index of the first edge of every polygon in edges, of shape (k,)
+    :return: boolean array of shape (n, k)
+    """
+    if len(edges_starts) == 0:
+        return np.zeros((len(segments), 0), dtype=bool)
+
+    return np.logical_or.reduceat(intersect_batch(segments, edges), edges_starts, axis=1)
+
+
+def intersect_distance_batch(segment: np.ndarray, other_segments: np.ndarray) -> np.ndarray:
+    """
+    Position of the intersection of the segment with every other segment, as a fraction of the segment length
+    :param segment: segment (x1, y1, x2, y2) of shape (4,)
+    :param other_segments: array of segments of shape (m, 4)
+    :return: array of shape (m,), values in [0, 1] for intersecting segments and inf otherwise
+    """
+    is_intersect = intersect_batch(segment[None, :], other_segments)[0]
+
+    direction = segment[2:4] - segment[0:2]
+    other_direction = other_segments[:, 2:4] - other_segments[:, 0:2]
+    to_other = other_segments[:, 0:2] - segment[0:2]
+
+    denominator = direction[0] * other_direction[:, 1] - direction[1] * other_direction[:, 0]
+    numerator = to_other[:, 0] * other_direction[:, 1] - to_other[:, 1] * other_direction[:, 0]
+
+    # Collinear segments touch at the closest endpoint of another segment
+    length_squared = max(direction @ direction, 1e-12)
+    collinear = np.minimum(to_other @ direction, (other_segments[:, 2:4] - segment[0:2]) @ direction) / length_squared
+
+    is_parallel = denominator == 0
+    distance = np.where(is_parallel, collinear, numerator / np.where(is_parallel, 1, denominator))
+
+    return np.where(is_intersect, np.clip(distance, 0, 1), np.inf)
+
+
+def intersect_circles_distance_batch(segment: np.ndarray, circles: np.ndarray) -> np.ndarray:
+    """
+    Position of the first intersection of the segment with every circle (disc), as a fraction of the segment length
+    :param segment: segment (x1, y1, x2, y2) of shape (4,)
+    :param circles: array of circles (x, y, radius) of shape (m, 3)
+    :return: array of shape (m,), values in [0, 1] for intersecting circles and inf otherwise
+    """
+    direction = segment[2:4] - segment[0:2]
+    from_center = segment[0:2] - circles[:, 0:2]
+
+    a = max(direction @ direction, 1e-12)
+    b = from_center @ direction
+    c = np.einsum('ij,ij->i', from_center, from_center) - circles[:, 2] * circles[:, 2]
+    discriminant = b * b - a * c
+
+    # Roots of |from_center + t * direction| = radius
+    root = np.sqrt(np.maximum(discriminant, 0))
+    t_enter, t_exit = (-b - root) / a, (-b + root) / a
+    is_intersect = (discriminant >= 0) & (t_exit >= 0) & (t_enter <= 1)
+
+    return np.where(is_intersect, np.maximum(t_enter, 0), np.inf)
+
+
+profiler.count_calls(Segment, "is_intersect")
@@ -0,0 +1,154 @@
+from typing import List, Tuple
+
+import numpy as np
+
+from utils.shared import geometry, raster
+
+
+class VisibilityRegions:
+    """
+    Regions visible from the turrets: view cones clipped by the nearest obstacles. The region of a turret is a fan
+    of triangles with the apex in the turret, the triangle is between two rays from the turret and is closed by
+    its far side (a piece of an obstacle's edge or of the border). Rays are parametrized by x offset per unit of
+    depth, the distance along y towards the border. Triangles of all turrets are kept in one array sorted by turret
+    and ray, so queries of many points or boxes against all turrets are answered by a few vectorized passes.
+    """
+
+    # Depth of the nearest point of boxes reaching the turret's y, rays through it bound the box from the sides
+    _min_depth = 1e-9
+
+    def __init__(self, apexes: np.ndarray, fans: List[Tuple[np.ndarray, np.ndarray]]):
+        """
+        :param apexes: points of the turrets of shape (n, 2)
+        :param fans: for every turret rays of shape (k + 1,), ascending, and far sides (x1, y1, x2, y2) of shape (k, 4)
+                     of the triangles between the consecutive rays
+        """
+        self.apexes = np.asarray(apexes, dtype=np.float64).reshape(-1, 2)
+        turrets_count = len(self.apexes)
+
+        rays = [fan_rays for fan_rays, _ in fans]
+        sides = [fan_sides for _, fan_sides in fans]
+        counts = np.array([len(fan_sides) for fan_sides in sides], dtype=np.intp)
+
+        # Rays of the turret i are shifted by i spans, so the rays of all turrets are one ascending array
+        max_ray = max([np.abs(fan_rays).max() for fan_rays in rays if len(fan_rays)], default=0.)
+        self._span = 2 * max_ray + 1
+        shifts = self._span * np.arange(turrets_count)
+        self._rays_from = np.concatenate([fan_rays[:-1] + shift for fan_rays, shift in zip(rays, shifts)] + [[]])
+        self._rays_to = np.concatenate([fan_rays[1:] + shift for fan_rays, shift in zip(rays, shifts)] + [[]])
+
+        self._turrets = np.repeat(np.arange(turrets_count), counts)
+        self._sides = np.vstack(sides + [np.zeros((0, 4))])
+
+        # Turrets are on one side of the far sides of their triangles
+        self._apex_orientations = geometry.orientation(self._sides[:, 0:2], self._sides[:, 2:4],
+                                                       self.apexes[self._turrets])
+
+        # Separating axes of the triangles: bounding boxes and normals of the edges with the triangles' projections
+        self._triangles = np.stack((self.apexes[self._turrets], self._sides[:, 0:2], self._sides[:, 2:4]), axis=1)
+        self._boxes = np.hstack((self._triangles.min(axis=1), self._triangles.max(axis=1)))
+        edges = np.roll(self._triangles, -1, axis=1) - self._triangles
+        self._normals = np.stack((-edges[..., 1], edges[..., 0]), axis=-1)
+        projections = np.einsum("ijk,ilk->ijl", self._normals, self._triangles)
+        self._projections = np.stack((projections.min(axis=2), projections.max(axis=2)), axis=-1)
+
+    def contain_points(self, points: np.ndarray) -> np.ndarray:
+        """
+        Whether the points are visible from the turrets, points on the borders of the regions are visible
+        :param points: array of points of shape (m, 2)
+        :return: boolean array of shape (m, n), column j is for the turret j
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        turrets = np.arange(len(self.apexes))
+        if not len(self._turrets):
+            return np.zeros((len(points), len(turrets)), dtype=bool)
+
+        rays, is_in_front = self._rays_to_points(points[:, 0, None], points[:, 1, None])
+        rays += self._span * turrets
+
+        # Triangle, which rays contain the ray through the point
+        triangles = np.searchsorted(self._rays_from, rays, side="right") - 1
+        is_in_cone = is_in_front & (triangles >= 0)
+        triangles = np.maximum(triangles, 0)
+        is_in_cone &= (self._turrets[triangles] == turrets) & (rays <= self._rays_to[triangles])
+
+        # The point is not farther than the far side of the triangle
+        sides = self._sides[triangles]
+        orientations = geometry.orientation(sides[..., 0:2], sides[..., 2:4], points[:, None, :])
+
+        return is_in_cone & ((orientations == self._apex_orientations[triangles]) | (orientations == 0))
+
+    def intersect_boxes(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Whether any part of the boxes is visible from the turrets, boxes touching the regions are visible
+        :param boxes: array of boxes (x1, y1, x2, y2) of shape (m, 4)
+        :return: boolean array of shape (m, n), column j is for the turret j
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        x_from, x_to = np.minimum(boxes[:, 0], boxes[:, 2]), np.maximum(boxes[:, 0], boxes[:, 2])
+        y_from, y_to = np.minimum(boxes[:, 1], boxes[:, 3]), np.maximum(boxes[:, 1], boxes[:, 3])
+        shape = (len(boxes), len(self.apexes))
+        if not len(self._turrets):
+            return np.zeros(shape, dtype=bool)
+
+        # Rays through the corners of the part of the box in front of the turret bound the candidate triangles
+        turrets_x, turrets_y = self.apexes[:, 0], self.apexes[:, 1]
+        depth_from = np.maximum(turrets_y - y_to[:, None], self._min_depth)
+        depth_to = np.maximum(turrets_y - y_from[:, None], depth_from)
+        dx_from, dx_to = x_from[:, None] - turrets_x, x_to[:, None] - turrets_x
+        is_in_front = turrets_y - y_from[:, None] > 0
+
+        half_span = self._span / 2
+        shifts = self._span * np.arange(len(self.apexes))
+        rays_from = np.clip(np.minimum(dx_from / depth_from, dx_from / depth_to), -half_span, half_span) + shifts
+        rays_to = np.clip(np.maximum(dx_to / depth_from, dx_to / depth_to), -half_span, half_span) + shifts
+
+        triangles_from = np.searchsorted(self._rays_to, rays_from, side="left")
+        triangles_to = np.searchsorted(self._rays_from, rays_to, side="right")
+        counts = np.where(is_in_front, np.maximum(triangles_to - triangles_from, 0), 0).ravel()
+
+        # Pairs of the boxes and their candidate triangles
+        pairs = np.repeat(np.arange(counts.size), counts)
+        pairs_starts = np.cumsum(counts) - counts
+        triangles = np.repeat(triangles_from.ravel() - pairs_starts, counts) + np.arange(counts.sum())
+        pairs_boxes = pairs // shape[1]
+
+        is_intersect = self._intersect_triangles(np.column_stack((x_from, y_from, x_to, y_to))[pairs_boxes], triangles)
+
+        return (np.bincount(pairs[is_intersect], minlength=counts.size) > 0).reshape(shape)
+
+    def count_cells(self, shape: Tuple[int, int], cell_size: float = 1.) -> np.ndarray:
+        """
+        Number of the turrets viewing the centers of the cells of a grid, the cell (i, j) has the center
+        (j * cell_size, i * cell_size). Triangles are filled by rows, so the cost is in the rows, not in the cells
+        :param shape: rows and columns of the grid
+        :param cell_size: distance between the centers of the neighbouring cells
+        :return: int32 array of shape (rows, columns)
+        """
+        return raster.count_triangles(self._triangles, shape, cell_size=cell_size)
+
+    def _rays_to_points(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+
+        # Rays from every turret through the points, points behind the turrets get the ray out of the rays span
+        depth = self.apexes[:, 1] - y
+        is_in_front = depth > 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rays = np.where(is_in_front, (x - self.apexes[:, 0]) / np.where(is_in_front, depth, 1), 0.)
+
+        return np.clip(rays, -self._span / 2, self._span / 2), is_in_front
+
+    def _intersect_triangles(self, boxes: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+
+        # Boxes are separated from triangles by the axes or by the normals of the triangles' edges
+        triangles_boxes = self._boxes[triangles]
+        is_separated = (triangles_boxes[:, 2] < boxes[:, 0]) | (triangles_boxes[:, 0] > boxes[:, 2]) | \
+                       (triangles_boxes[:, 3] < boxes[:, 1]) | (triangles_boxes[:, 1] > boxes[:, 3])
+
+        normals, projections = self._normals[triangles], self._projections[triangles]
+        centers, extents = (boxes[:, 0:2] + boxes[:, 2:4]) / 2, (boxes[:, 2:4] - boxes[:, 0:2]) / 2
+        centers_projections = np.einsum("ijk,ik->ij", normals, centers)
+        radii = np.einsum("ijk,ik->ij", np.abs(normals), extents)
+        is_separated |= ((centers_projections + radii < projections[..., 0]) |
+                         (centers_projections - radii > projections[..., 1])).any(axis=1)
+
+        return ~is_separated
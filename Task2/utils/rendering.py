@@ -0,0 +1,116 @@
+import struct
+import zlib
+
+import numpy as np
+
+
+class ImageCanvas:
+    """
+    Canvas over an RGB image buffer, shapes are drawn by batches instead of one call per shape
+    """
+
+    def __init__(self, width: int, height: int, background=(255, 255, 255)):
+        self.width = width
+        self.height = height
+        self.image = np.empty((height, width, 3), dtype=np.uint8)
+        self.image[:, :] = background
+
+    def create_lines(self, segments: np.ndarray, fill=(0, 0, 0), dash=None):
+        """
+        Draws segments
+        :param segments: array of segments (x1, y1, x2, y2) of shape (n, 4)
+        :param fill: color of the lines
+        :param dash: pair (length of dash, length of gap) in pixels, solid line if None
+        """
+        segments = np.asarray(segments, dtype=np.float64).reshape(-1, 4)
+        if not len(segments):
+            return
+
+        # Sample every segment once per pixel of its longest projection
+        samples_counts = np.ceil(np.maximum(np.abs(segments[:, 2] - segments[:, 0]),
+                                            np.abs(segments[:, 3] - segments[:, 1]))).astype(np.intp) + 1
+        owners = np.repeat(np.arange(len(segments)), samples_counts)
+        steps = np.arange(samples_counts.sum()) - np.repeat(np.cumsum(samples_counts) - samples_counts, samples_counts)
+        t = steps / np.maximum(samples_counts[owners] - 1, 1)
+
+        if dash is not None:
+            is_dash = steps % (dash[0] + dash[1]) < dash[0]
+            owners, t = owners[is_dash], t[is_dash]
+
+        s = segments[owners]
+        self._plot(s[:, 0] + t * (s[:, 2] - s[:, 0]), s[:, 1] + t * (s[:, 3] - s[:, 1]), fill)
+
+    def create_rectangles(self, boxes: np.ndarray, outline=(0, 0, 0)):
+        """
+        Draws outlines of rectangles
+        :param boxes: array of rectangles (x1, y1, x2, y2) of shape (n, 4)
+        :param outline: color of the outlines
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        x1, y1, x2, y2 = boxes.T
+
+        self.create_lines(np.vstack((np.column_stack((x1, y1, x2, y1)), np.column_stack((x2, y1, x2, y2)),
+                                     np.column_stack((x2, y2, x1, y2)), np.column_stack((x1, y2, x1, y1)))),
+                          outline)
+
+    def create_ovals(self, boxes: np.ndarray, outline=(0, 0, 0)):
+        """
+        Draws outlines of ovals inscribed into rectangles
+        :param boxes: array of rectangles (x1, y1, x2, y2) of shape (n, 4)
+        :param outline: color of the outlines
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        if not len(boxes):
+            return
+
+        center_x, center_y = (boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2
+        radius_x, radius_y = np.abs(boxes[:, 2] - boxes[:, 0]) / 2, np.abs(boxes[:, 3] - boxes[:, 1]) / 2
+
+        # Sample every oval once per pixel of its perimeter
+        samples_counts = np.ceil(2 * np.pi * np.maximum(radius_x, radius_y)).astype(np.intp) + 4
+        owners = np.repeat(np.arange(len(boxes)), samples_counts)
+        steps = np.arange(samples_counts.sum()) - np.repeat(np.cumsum(samples_counts) - samples_counts, samples_counts)
+        angles = 2 * np.pi * steps / samples_counts[owners]
+
+        self._plot(center_x[owners] + radius_x[owners] * np.cos(angles),
+                   center_y[owners] + radius_y[owners] * np.sin(angles), outline)
+
+    def fill_heat_map(self, counts: np.ndarray, low=(255, 255, 255), high=(0, 0, 128), zero=(255, 160, 160)):
+        """
+        Fills the image by counts of the pixels, e.g. of the coverage map with cells of 1 pixel
+        :param counts: array of shape (rows, columns), cropped to the image
+        :param low: color of the count 1
+        :param high: color of the maximal count
+        :param zero: color of the pixels of 0
+        """
+        counts = np.asarray(counts)[:self.height, :self.width]
+        rows, columns = counts.shape
+        weights = ((counts - 1) / max(counts.max() - 1, 1))[..., None]
+
+        colors = np.asarray(low, dtype=np.float64) * (1 - weights) + np.asarray(high, dtype=np.float64) * weights
+        colors[counts == 0] = zero
+        self.image[:rows, :columns] = np.rint(colors).astype(np.uint8)
+
+    def _plot(self, xs: np.ndarray, ys: np.ndarray, color):
+        columns, rows = np.rint(xs).astype(np.intp), np.rint(ys).astype(np.intp)
+        is_inside = (0 <= columns) & (columns < self.width) & (0 <= rows) & (rows < self.height)
+
+        self.image[rows[is_inside], columns[is_inside]] = color
+
+    def save_png(self, path: str):
+        """
+        Saves the image as PNG file
+        :param path: path to the file
+        """
+        # Every row of the image starts with filter type 0 (none)
+        rows = np.hstack((np.zeros((self.height, 1), dtype=np.uint8), self.image.reshape(self.height, -1)))
+
+        def chunk(chunk_type: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + chunk_type + data + \
+                struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)
+
+        with open(path, "wb") as png:
+            png.write(b"\x89PNG\r\n\x1a\n")
+            png.write(chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)))
+            png.write(chunk(b"IDAT", zlib.compress(rows.tobytes())))
+            png.write(chunk(b"IEND", b""))
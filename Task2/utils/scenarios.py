@@ -0,0 +1,91 @@
+from math import ceil, sqrt
+from typing import Dict
+
+import numpy as np
+
+
+# Share of every kind of entities in a scenario of the given size
+default_shares = {"turrets": 0.01, "tanks": 0.35, "carriers": 0.25, "squares": 0.2, "rounds": 0.19}
+
+# Every enemy and obstacle is placed into its own cell, so entities never overlap
+_cell_size = 12
+_max_square_size, _max_radius = 8, 4
+
+
+def split_size(size: int, shares: Dict[str, float] = None) -> Dict[str, int]:
+    """
+    Splits count of entities between kinds of entities, at least one turret is always present
+    :param size: count of entities
+    :param shares: share of every kind (default is default_shares)
+    :return: count of entities of every kind
+    """
+    shares = shares or default_shares
+    counts = {kind: int(size * share) for kind, share in shares.items()}
+    counts["turrets"] = max(1, counts["turrets"])
+    counts["tanks"] += size - sum(counts.values())
+
+    return counts
+
+
+def generate_scenario(seed: int, turrets: int, tanks: int, carriers: int, squares: int, rounds: int) -> Dict:
+    """
+    Generates the scenario in the format of input/entities.json. Enemies are placed in the top band of the field,
+    obstacles in the middle band and turrets at the bottom, so turrets look at obstacles and enemies behind them.
+    :param seed: seed of the random generator
+    :param turrets: count of turrets
+    :param tanks: count of tanks
+    :param carriers: count of carriers
+    :param squares: count of square obstacles
+    :param rounds: count of round obstacles
+    :return: dictionary with the scenario, its "width" and "height" (after the entities) are the size of the field
+    """
+    rng = np.random.default_rng(seed)
+
+    enemies_count, obstacles_count = tanks + carriers, squares + rounds
+    columns = max(40, int(ceil(2 * sqrt(enemies_count + obstacles_count))))
+    enemies_rows = int(ceil(enemies_count / columns))
+    obstacles_rows = int(ceil(obstacles_count / columns))
+
+    width = columns * _cell_size
+    obstacles_top = enemies_rows * _cell_size
+    turrets_top = obstacles_top + obstacles_rows * _cell_size + 2 * _cell_size
+    height = turrets_top + 2 * _cell_size
+
+    # Enemies
+    enemies_types = np.array(["tank"] * tanks + ["carrier"] * carriers)[rng.permutation(enemies_count)]
+    enemies_cells = rng.choice(enemies_rows * columns, enemies_count, replace=False) if enemies_count else []
+    enemies = [{"number": i + 1,
+                "x": int(cell % columns * _cell_size + rng.integers(0, _cell_size - 8)),
+                "y": int(cell // columns * _cell_size + rng.integers(0, _cell_size - 8)),
+                "type": str(enemy_type)}
+               for i, (cell, enemy_type) in enumerate(zip(enemies_cells, enemies_types))]
+
+    # Obstacles
+    obstacles = []
+    is_round = np.array([False] * squares + [True] * rounds)[rng.permutation(obstacles_count)]
+    obstacles_cells = rng.choice(obstacles_rows * columns, obstacles_count, replace=False) if obstacles_count else []
+    for i, (cell, round_obstacle) in enumerate(zip(obstacles_cells, is_round)):
+        left, top = cell % columns * _cell_size, obstacles_top + cell // columns * _cell_size
+        if round_obstacle:
+            radius = int(rng.integers(1, _max_radius + 1))
+            obstacles.append({"number": i + 1,
+                              "x": int(left + _cell_size // 2), "y": int(top + _cell_size // 2),
+                              "radius": radius,
+                              "type": "round"})
+        else:
+            size_x, size_y = (int(size) for size in rng.integers(1, _max_square_size + 1, 2))
+            obstacles.append({"number": i + 1,
+                              "x": int(left + rng.integers(0, _cell_size - size_x)),
+                              "y": int(top + rng.integers(0, _cell_size - size_y)),
+                              "width": size_x, "height": size_y,
+                              "type": "square"})
+
+    # Turrets
+    turrets_x = rng.choice(width, turrets, replace=turrets > width)
+    turrets_list = [{"number": i + 1,
+                     "x": int(x), "y": int(turrets_top + rng.integers(0, _cell_size)),
+                     "type": "turret"}
+                    for i, x in enumerate(turrets_x)]
+
+    return {"enemies": enemies, "obstacles": obstacles, "turrets": turrets_list,
+            "width": width, "height": height}
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Modules shared with Task3 are in the root of the repository
+_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir, os.pardir))
+if _root not in sys.path:
+    sys.path.append(_root)
+
+from shared import geometry, grid, raster  # noqa: E402
+from shared.cache import ResultsCache  # noqa: E402
+from shared.instrumentation import profiler  # noqa: E402
+from shared.parallel import process_pool, set_worker_state, worker_state  # noqa: E402
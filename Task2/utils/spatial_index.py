@@ -0,0 +1,306 @@
+from math import inf
+from typing import List, Tuple, Optional, Union
+
+import numpy as np
+
+from utils.geometric import Circle, intersect_distance_batch, intersect_circles_distance_batch
+from utils.shared import grid
+
+
+class UniformGrid(grid.UniformGrid):
+    """
+    Uniform grid over bounding boxes of shapes: polygons and circles. Every cell keeps indices of edges of
+    all polygons and of all circles, whose bounding boxes overlap the cell, so the segment queries test only
+    the cells the segment crosses. Circles are tested analytically instead of by their polygons.
+    Shapes inserted after the grid is built are kept aside of the packed cells until the grid is rebuilt.
+    """
+
+    def __init__(self, shapes: List[Union[np.ndarray, Circle]], cell_size: float = None):
+        """
+        :param shapes: list of shapes: arrays of polygons' segments, each of shape (n, 4), or circles
+        :param cell_size: size of the cell (default is chosen by the density of the shapes)
+        """
+        self.polygons_count = len(shapes)
+
+        is_circle = np.array([isinstance(shape, Circle) for shape in shapes], dtype=bool)
+        polygons, circles = np.flatnonzero(~is_circle), np.flatnonzero(is_circle)
+
+        # Edges of the polygons
+        polygons_edges = [shapes[polygon] for polygon in polygons]
+        self.edges = np.vstack(polygons_edges) if polygons_edges else np.zeros((0, 4))
+        edges_counts = np.array([len(edges) for edges in polygons_edges], dtype=np.intp)
+        edges_starts = np.cumsum(edges_counts, dtype=np.intp) - edges_counts
+        self.edges_owners = np.repeat(polygons, edges_counts)
+
+        # Circles (x, y, radius)
+        self.circles = np.array([shapes[circle].to_array() for circle in circles]).reshape(-1, 3)
+        self.circles_owners = circles
+
+        # Bounding boxes of the shapes
+        boxes = np.zeros((self.polygons_count, 4))
+        if len(polygons):
+            xs, ys = self.edges[:, 0::2], self.edges[:, 1::2]
+            boxes[polygons, 0] = np.minimum.reduceat(xs.min(axis=1), edges_starts)
+            boxes[polygons, 1] = np.minimum.reduceat(ys.min(axis=1), edges_starts)
+            boxes[polygons, 2] = np.maximum.reduceat(xs.max(axis=1), edges_starts)
+            boxes[polygons, 3] = np.maximum.reduceat(ys.max(axis=1), edges_starts)
+        boxes[circles] = np.column_stack((self.circles[:, 0:2] - self.circles[:, 2:3],
+                                          self.circles[:, 0:2] + self.circles[:, 2:3]))
+        boxes += (-self._margin, -self._margin, self._margin, self._margin)
+        self.boxes = boxes
+        grid.UniformGrid.__init__(self, boxes, cell_size)
+
+        self.cells_edges, self.cells_starts = self._fill_items(boxes[polygons], edges_starts, edges_counts)
+        self.cells_circles, self.cells_circles_starts = self._fill_items(boxes[circles],
+                                                                         np.arange(len(circles), dtype=np.intp),
+                                                                         np.ones(len(circles), dtype=np.intp))
+
+        # Removed packed shapes are masked, inserted shapes are kept in per cell dictionary
+        self._alive = np.ones(self.polygons_count, dtype=bool)
+        self._removed_count = 0
+        self._extra_polygons = {}
+        self._extra_cells = {}
+
+    @property
+    def extra_count(self) -> int:
+        """
+        Count of shapes inserted or removed since the grid was built
+        """
+        return len(self._extra_polygons) + self._removed_count
+
+    def insert(self, shape: Union[np.ndarray, Circle]) -> int:
+        """
+        Inserts the shape into the grid
+        :param shape: array of the polygon's segments of shape (n, 4) or circle
+        :return: index of the shape
+        """
+        polygon = self.polygons_count
+        self.polygons_count += 1
+        self._extra_polygons[polygon] = shape
+
+        for cell in self._cells_of_shape(shape):
+            self._extra_cells.setdefault(cell, []).append(polygon)
+
+        return polygon
+
+    def remove(self, polygon: int):
+        """
+        Removes the shape from the grid
+        :param polygon: index of the shape
+        """
+        if polygon in self._extra_polygons:
+            for cell in self._cells_of_shape(self._extra_polygons.pop(polygon)):
+                self._extra_cells[cell].remove(polygon)
+        elif self._alive[polygon]:
+            self._alive[polygon] = False
+            self._removed_count += 1
+
+    def covers(self, shape: Union[np.ndarray, Circle]) -> bool:
+        """
+        Tests whether the shape is inside of the bounds of the grid, shapes outside are missed by the queries
+        :param shape: array of the polygon's segments of shape (n, 4) or circle
+        :return: True if the shape is inside
+        """
+        min_x, min_y, max_x, max_y = self._box_of(shape).tolist()
+
+        return self.min_x <= min_x and self.min_y <= min_y and \
+            max_x <= self.min_x + self.columns * self.cell_size and max_y <= self.min_y + self.rows * self.cell_size
+
+    def all_edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segments of all polygons in the grid
+        :return: pair of arrays: segments of shape (m, 4) and index of the polygon of every segment of shape (m,)
+        """
+        extra_polygons = {polygon: shape for polygon, shape in self._extra_polygons.items()
+                          if not isinstance(shape, Circle)}
+        if not self._removed_count and not extra_polygons:
+            return self.edges, self.edges_owners
+
+        is_alive = self._alive[self.edges_owners]
+        edges = [self.edges[is_alive]] + list(extra_polygons.values())
+        owners = [self.edges_owners[is_alive]] + [np.full(len(polygon_edges), polygon, dtype=np.intp)
+                                                  for polygon, polygon_edges in extra_polygons.items()]
+
+        return np.vstack(edges), np.concatenate(owners)
+
+    def all_circles(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        All circles in the grid
+        :return: pair of arrays: circles (x, y, radius) of shape (m, 3) and index of the shape of every circle
+        """
+        extra_circles = {polygon: shape for polygon, shape in self._extra_polygons.items()
+                         if isinstance(shape, Circle)}
+        if not self._removed_count and not extra_circles:
+            return self.circles, self.circles_owners
+
+        is_alive = self._alive[self.circles_owners]
+        circles = [self.circles[is_alive]] + [shape.to_array()[None, :] for shape in extra_circles.values()]
+        owners = [self.circles_owners[is_alive], np.array(list(extra_circles), dtype=np.intp)]
+
+        return np.vstack(circles), np.concatenate(owners)
+
+    def edges_in_cells(self, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segments of the polygons listed in the cells
+        :param cells: indices of the cells
+        :return: pair of arrays: segments of shape (m, 4) and index of the polygon of every segment of shape (m,)
+        """
+        _, edges = self._listed_items(self.cells_edges, self.cells_starts, cells)
+        edges = np.unique(edges)
+        if self._removed_count:
+            edges = edges[self._alive[self.edges_owners[edges]]]
+
+        extra_polygons = [polygon for polygon in np.unique(self._listed_extra(cells)[1]).tolist()
+                          if not isinstance(self._extra_polygons[polygon], Circle)]
+        if not extra_polygons:
+            return self.edges[edges], self.edges_owners[edges]
+
+        return np.vstack([self.edges[edges]] + [self._extra_polygons[polygon] for polygon in extra_polygons]), \
+            np.concatenate([self.edges_owners[edges]] + [np.full(len(self._extra_polygons[polygon]), polygon,
+                                                                 dtype=np.intp) for polygon in extra_polygons])
+
+    def circles_in_cells(self, cells: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Circles listed in the cells
+        :param cells: indices of the cells
+        :return: pair of arrays: circles (x, y, radius) of shape (m, 3) and index of the shape of every circle
+        """
+        _, circles = self._listed_items(self.cells_circles, self.cells_circles_starts, cells)
+        circles = np.unique(circles)
+        if self._removed_count:
+            circles = circles[self._alive[self.circles_owners[circles]]]
+
+        extra_circles = [polygon for polygon in np.unique(self._listed_extra(cells)[1]).tolist()
+                         if isinstance(self._extra_polygons[polygon], Circle)]
+
+        return np.vstack([self.circles[circles]] + [self._extra_polygons[polygon].to_array()[None, :]
+                                                    for polygon in extra_circles]), \
+            np.concatenate((self.circles_owners[circles], np.array(extra_circles, dtype=np.intp)))
+
+    def overlapping_shapes(self, cells: np.ndarray) -> np.ndarray:
+        """
+        Pairs of shapes listed in a common cell, whose bounding boxes overlap, only edges of such shapes may cross
+        :param cells: indices of the cells
+        :return: array of pairs of the shapes' indices of shape (m, 2), the first index is less than the second
+        """
+
+        # Shapes listed in the cells by their edges and circles, and the inserted shapes, as pairs (cell, shape)
+        edges_cells, edges = self._listed_items(self.cells_edges, self.cells_starts, cells)
+        circles_cells, circles = self._listed_items(self.cells_circles, self.cells_circles_starts, cells)
+        extra_cells, extra_polygons = self._listed_extra(cells)
+        listed_cells = np.concatenate((edges_cells, circles_cells, extra_cells))
+        listed_shapes = np.concatenate((self.edges_owners[edges], self.circles_owners[circles], extra_polygons))
+
+        # Every shape once per cell, ordered by cells and shapes
+        listed = np.unique(listed_cells * self.polygons_count + listed_shapes)
+        listed_cells, listed_shapes = np.divmod(listed, self.polygons_count)
+        is_packed = listed_shapes < len(self.boxes)
+        is_alive = ~is_packed
+        is_alive[is_packed] = self._alive[listed_shapes[is_packed]]
+        listed_cells, listed_shapes, is_packed = listed_cells[is_alive], listed_shapes[is_alive], is_packed[is_alive]
+
+        boxes = np.zeros((len(listed_shapes), 4))
+        boxes[is_packed] = self.boxes[listed_shapes[is_packed]]
+        boxes[~is_packed] = np.array([self._box_of(self._extra_polygons[polygon])
+                                      for polygon in listed_shapes[~is_packed].tolist()]).reshape(-1, 4)
+
+        # Every shape is paired with the next shapes of its cell
+        counts = np.searchsorted(listed_cells, listed_cells, side='right') - np.arange(len(listed_cells)) - 1
+        first = np.repeat(np.arange(len(listed_cells)), counts)
+        second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        is_overlapping = (boxes[first, 0] <= boxes[second, 2]) & (boxes[second, 0] <= boxes[first, 2]) & \
+                         (boxes[first, 1] <= boxes[second, 3]) & (boxes[second, 1] <= boxes[first, 3])
+        pairs = np.unique(listed_shapes[first[is_overlapping]] * self.polygons_count +
+                          listed_shapes[second[is_overlapping]])
+
+        return np.column_stack(np.divmod(pairs, self.polygons_count))
+
+    def _listed_items(self, items: np.ndarray, starts: np.ndarray, cells: np.ndarray):
+
+        # Items listed in the cells (CSR layout) as pairs of arrays: cells and items
+        cells = np.asarray(cells, dtype=np.intp)
+        counts = starts[cells + 1] - starts[cells]
+        positions = np.repeat(starts[cells] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+
+        return np.repeat(cells, counts), items[positions]
+
+    def _listed_extra(self, cells: np.ndarray):
+
+        # Inserted shapes listed in the cells as pairs of arrays: cells and shapes
+        extra = np.array([(cell, polygon) for cell, polygons in self._extra_cells.items() for polygon in polygons],
+                         dtype=np.intp).reshape(-1, 2)
+        extra = extra[np.isin(extra[:, 0], cells)]
+
+        return extra[:, 0], extra[:, 1]
+
+    def _box_of(self, shape: Union[np.ndarray, Circle]) -> np.ndarray:
+        if isinstance(shape, Circle):
+            radius = shape.radius + self._margin
+            return np.array([shape.center.x - radius, shape.center.y - radius,
+                             shape.center.x + radius, shape.center.y + radius])
+
+        return np.array([shape[:, 0::2].min() - self._margin, shape[:, 1::2].min() - self._margin,
+                         shape[:, 0::2].max() + self._margin, shape[:, 1::2].max() + self._margin])
+
+    def _cells_of_shape(self, shape: Union[np.ndarray, Circle]):
+        column_from, row_from, column_to, row_to = self._cells_of_boxes(self._box_of(shape)[None, :])[0].tolist()
+
+        return [row * self.columns + column
+                for row in range(row_from, row_to + 1)
+                for column in range(column_from, column_to + 1)]
+
+    def _fill_items(self, boxes: np.ndarray, items_starts: np.ndarray, items_counts: np.ndarray):
+
+        # Shapes listed in the cells are expanded to their items (edges or circles), grouped by cells (CSR layout)
+        owners, owners_starts = self._fill_cells(boxes)
+        counts = items_counts[owners]
+        first_items = np.repeat(items_starts[owners], counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        return first_items + offsets, np.append(0, np.cumsum(counts))[owners_starts]
+
+    def nearest_hit(self, segment: np.ndarray) -> Optional[Tuple[int, float]]:
+        """
+        Finds the shape, that is intersected by the segment closest to its first point
+        :param segment: segment (x1, y1, x2, y2)
+        :return: pair (index of the shape, position of the hit as a fraction of the segment length) or None
+        """
+        best_distance, best_polygon = inf, -1
+
+        for cell, t_exit in self.cells_on_segment(segment):
+            cell_edges = self.cells_edges[self.cells_starts[cell]:self.cells_starts[cell + 1]]
+            cell_circles = self.cells_circles[self.cells_circles_starts[cell]:self.cells_circles_starts[cell + 1]]
+            if self._removed_count:
+                cell_edges = cell_edges[self._alive[self.edges_owners[cell_edges]]]
+                cell_circles = cell_circles[self._alive[self.circles_owners[cell_circles]]]
+
+            if len(cell_edges):
+                distances = intersect_distance_batch(segment, self.edges[cell_edges])
+                nearest = distances.argmin()
+                if distances[nearest] < best_distance:
+                    best_distance, best_polygon = distances[nearest], self.edges_owners[cell_edges[nearest]]
+
+            if len(cell_circles):
+                distances = intersect_circles_distance_batch(segment, self.circles[cell_circles])
+                nearest = distances.argmin()
+                if distances[nearest] < best_distance:
+                    best_distance, best_polygon = distances[nearest], self.circles_owners[cell_circles[nearest]]
+
+            for polygon in self._extra_cells.get(cell, ()):
+                shape = self._extra_polygons[polygon]
+                if isinstance(shape, Circle):
+                    distance = intersect_circles_distance_batch(segment, shape.to_array()[None, :])[0]
+                else:
+                    distance = intersect_distance_batch(segment, shape).min()
+                if distance < best_distance:
+                    best_distance, best_polygon = distance, polygon
+
+            # Hits in the next cells can't be closer
+            if best_distance <= t_exit:
+                break
+
+        if best_polygon < 0:
+            return None
+
+        return int(best_polygon), float(best_distance)
@@ -0,0 +1,90 @@
+from typing import Callable, Optional
+
+
+class DepthOrder:
+    """
+    Items of an angular sweep ordered by their depth along the current ray. Depths are evaluated at the ray given
+    to every insert, so the order is valid as long as the items don't cross between the rays of the inserts.
+    Items are kept in blocks of a bounded size: an insert bisects the blocks and moves the items of one block only,
+    instead of all items after it, a removal looks the item up in its block.
+    """
+
+    _block_size = 256
+
+    def __init__(self, depth_of: Callable[[int, float], float]):
+        """
+        :param depth_of: function of an item and a ray, depth of the item along the ray
+        """
+        self._depth_of = depth_of
+        self._blocks = []
+        self._block_of = {}
+
+    def __len__(self) -> int:
+        return len(self._block_of)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._block_of
+
+    def first(self) -> Optional[int]:
+        """
+        :return: the nearest item, None if there are no items
+        """
+        return self._blocks[0][0] if self._blocks else None
+
+    def insert(self, item: int, ray: float):
+        """
+        Inserts the item after the items, which are nearer along the ray
+        :param item: item to insert
+        :param ray: ray, on which the depths are compared
+        """
+        if not self._blocks:
+            self._blocks.append([item])
+            self._block_of[item] = self._blocks[0]
+            return
+
+        block, position = self._bisect(self._depth_of(item, ray), ray)
+        items = self._blocks[block]
+        items.insert(position, item)
+        self._block_of[item] = items
+
+        if len(items) > 2 * self._block_size:
+            tail = items[self._block_size:]
+            del items[self._block_size:]
+            self._blocks.insert(block + 1, tail)
+            for moved in tail:
+                self._block_of[moved] = tail
+
+    def remove(self, item: int):
+        """
+        Removes the item
+        :param item: item to remove
+        """
+        items = self._block_of.pop(item)
+        items.remove(item)
+
+        if not items:
+            del self._blocks[next(block for block, block_items in enumerate(self._blocks) if block_items is items)]
+
+    def _bisect(self, depth: float, ray: float):
+        depth_of, blocks = self._depth_of, self._blocks
+
+        # The last block starting nearer than the depth, and the first item in it not nearer than the depth
+        low, high = 1, len(blocks)
+        while low < high:
+            middle = (low + high) // 2
+            if depth_of(blocks[middle][0], ray) < depth:
+                low = middle + 1
+            else:
+                high = middle
+        block = low - 1
+
+        items = blocks[block]
+        low, high = 0, len(items)
+        while low < high:
+            middle = (low + high) // 2
+            if depth_of(items[middle], ray) < depth:
+                low = middle + 1
+            else:
+                high = middle
+
+        return block, low
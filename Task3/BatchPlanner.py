@@ -0,0 +1,185 @@
+import argparse
+import csv
+import json
+import os
+from time import time
+
+from Common import ResultsCache, profiler
+from SecurityPlanner import SecurityPlanner
+from WallsIndex import WallsIndex
+
+
+# Plans cameras for scenarios from files without the map window, walls indexes are reused between scenarios
+class BatchPlanner(object):
+    def __init__(self, cameras_count=2, time_budget=10.0, workers=1, adaptive_sampling=False, cache=None):
+        self._cameras_count = cameras_count
+        self._time_budget = time_budget
+        self._workers = workers
+        self._adaptive_sampling = adaptive_sampling
+        self._walls_indexes = {}
+        self._cache = cache
+
+    def plan(self, segments, blue_points, cameras_count=None):
+        sp = self._get_planner(segments, blue_points)
+
+        cameras_count = cameras_count or self._cameras_count
+        if cameras_count == 2:
+            return sp.find_cameras_positions(self._workers)
+        return sp.find_cameras_positions_k(cameras_count, exact=True, time_budget=self._time_budget,
+                                           workers=self._workers)
+
+    # Number of the candidate camera positions seeing each cell of the plan
+    def calc_coverage_map(self, segments, blue_points, cell_size=1.0):
+        return self._get_planner(segments, blue_points).calc_coverage_map(cell_size, workers=self._workers)
+
+    def _get_planner(self, segments, blue_points):
+        walls = tuple(segments)
+        if walls not in self._walls_indexes:
+            self._walls_indexes[walls] = WallsIndex(segments)
+
+        return SecurityPlanner(segments, blue_points, adaptive_sampling=self._adaptive_sampling,
+                               walls_index=self._walls_indexes[walls], verbose=False, cache=self._cache)
+
+    def plan_files(self, paths, images_dir=None, coverage_dir=None, coverage_cell_size=1.0):
+        results = {}
+        for path in paths:
+            started = time()
+            segments, blue_points, cameras_count = BatchPlanner.load(path)
+            cameras = self.plan(segments, blue_points, cameras_count)
+
+            results[path] = {
+                'cameras': [list(p) for p in cameras] if cameras is not None else None,
+                'time': time() - started
+            }
+
+            name = os.path.splitext(os.path.basename(path))[0]
+
+            # Rasterization needs the map processor dependencies, so it is only imported on request
+            if images_dir:
+                from MapProcessor import MapProcessor
+                img = MapProcessor.rasterize(segments, list(blue_points.values()), cameras or [])
+                MapProcessor.save(os.path.join(images_dir, name + '.png'), img)
+
+            if coverage_dir:
+                from MapProcessor import MapProcessor
+                coverage_map = self.calc_coverage_map(segments, blue_points, coverage_cell_size)
+                MapProcessor.save(os.path.join(coverage_dir, name + '.png'),
+                                  MapProcessor.rasterize_coverage(coverage_map, segments))
+                results[path]['uncovered_cells'] = coverage_map.get_uncovered_cells().tolist()
+
+        return results
+
+    # Walls as ((x1, y1), (x2, y2)), blue points as {number: (x, y)} and cameras count (None if not given)
+    @staticmethod
+    def load(path):
+        extension = os.path.splitext(path)[1].lower()
+        with open(path, 'r') as f:
+            if extension == '.csv':
+                return BatchPlanner._load_csv(f)
+            if extension == '.dxf':
+                return BatchPlanner._load_dxf(f)
+            return BatchPlanner._load_json(f)
+
+    # {"walls": [[x1, y1, x2, y2], ...], "targets": [[x, y], ...], "cameras": k}
+    @staticmethod
+    def _load_json(f):
+        data = json.load(f)
+
+        segments = [BatchPlanner._get_segment(w) for w in data['walls']]
+        targets = data['targets']
+        if isinstance(targets, dict):
+            blue_points = dict((int(k), tuple(p)) for k, p in targets.items())
+        else:
+            blue_points = dict((i, tuple(p)) for i, p in enumerate(targets))
+
+        return segments, blue_points, data.get('cameras')
+
+    # Rows "wall,x1,y1,x2,y2" and "target,x,y", other rows (e.g. a header) are skipped
+    @staticmethod
+    def _load_csv(f):
+        segments, blue_points = [], {}
+        for row in csv.reader(f):
+            if not row:
+                continue
+            kind = row[0].strip().lower()
+            if kind == 'wall':
+                segments.append(BatchPlanner._get_segment([float(v) for v in row[1:5]]))
+            elif kind == 'target':
+                blue_points[len(blue_points)] = (float(row[1]), float(row[2]))
+
+        return segments, blue_points, None
+
+    # LINE and LWPOLYLINE entities are walls, POINT entities are blue points
+    @staticmethod
+    def _load_dxf(f):
+        lines = [l.strip() for l in f]
+        pairs = zip(lines[0::2], lines[1::2])
+
+        entities, entity = [], None
+        for code, value in pairs:
+            if code == '0':
+                entity = (value, [])
+                entities.append(entity)
+            elif entity is not None and code in ('10', '20', '11', '21', '70'):
+                entity[1].append((code, float(value)))
+
+        segments, blue_points = [], {}
+        for kind, values in entities:
+            coordinates = dict(values)
+            if kind == 'LINE':
+                segments.append(((coordinates['10'], coordinates['20']), (coordinates['11'], coordinates['21'])))
+            elif kind == 'POINT':
+                blue_points[len(blue_points)] = (coordinates['10'], coordinates['20'])
+            elif kind == 'LWPOLYLINE':
+                vertices = list(zip([v for c, v in values if c == '10'], [v for c, v in values if c == '20']))
+                if int(coordinates.get('70', 0)) & 1:
+                    vertices.append(vertices[0])
+                segments.extend(zip(vertices, vertices[1:]))
+
+        return segments, blue_points, None
+
+    @staticmethod
+    def _get_segment(w):
+        if len(w) == 2:
+            return (tuple(w[0]), tuple(w[1]))
+        return ((w[0], w[1]), (w[2], w[3]))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Find cameras positions covering the targets')
+    parser.add_argument('scenarios', nargs='+', help='scenario files (.json, .csv or .dxf)')
+    parser.add_argument('--output', help='file to write results as JSON (default stdout)')
+    parser.add_argument('--png-dir', help='directory to save rendered maps as PNG')
+    parser.add_argument('--coverage-dir', help='directory to save heat maps of the candidate cameras coverage as PNG, '
+                                               'cells not covered are added to the results')
+    parser.add_argument('--coverage-cell', type=float, default=1.0, help='cell size of the coverage heat maps')
+    parser.add_argument('--cameras', type=int, default=2, help='cameras count, 0 to find the minimal one')
+    parser.add_argument('--time-budget', type=float, default=10.0)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--adaptive', action='store_true', help='sample walls at critical points only')
+    parser.add_argument('--cache', metavar='DIR', help='directory of the cache of visible sets, reused between runs')
+    parser.add_argument('--profile', help='file to write phase timings and call counts, as JSON if it ends with '
+                                          '.json, otherwise as folded stacks for flame graphs')
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    if arguments.profile:
+        profiler.enable()
+
+    cache = ResultsCache(arguments.cache) if arguments.cache else None
+    planner = BatchPlanner(arguments.cameras or None, arguments.time_budget, arguments.workers, arguments.adaptive,
+                           cache)
+    results = planner.plan_files(arguments.scenarios, arguments.png_dir, arguments.coverage_dir,
+                                 arguments.coverage_cell)
+
+    if arguments.profile:
+        profiler.disable()
+        profiler.save(arguments.profile)
+
+    if arguments.output:
+        json.dump(results, open(arguments.output, 'w'), indent=2)
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# Modules shared with Task2 are in the root of the repository
+_root = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+if _root not in sys.path:
+    sys.path.append(_root)
+
+from shared import geometry, grid, raster
+from shared.cache import ResultsCache
+from shared.instrumentation import profiler
+from shared.parallel import imap_window, process_pool, set_worker_state, worker_state
@@ -0,0 +1,139 @@
+from math import floor
+from math import pi
+
+import numpy as np
+
+from Common import geometry, process_pool, raster, set_worker_state, worker_state
+
+
+# Number of camera positions seeing each cell of a grid over the floor plan. The view of a camera is a fan of
+# triangles: between two neighbouring angles of the walls ends and crossings the nearest wall is the same, so it
+# closes one triangle. Fans are filled by rows of cells (see raster.count_triangles), not tested cell by cell
+class CoverageMap(object):
+    def __init__(self, segments, bounds=None, cell_size=1.0):
+        self._walls = np.array(segments, dtype=float).reshape(-1, 4)
+        self._visibility_chunk_size = 1 << 20
+
+        # Grid over the walls by default, the cell (i, j) is the point (min x + j * cell_size, min y + i * cell_size)
+        if bounds is None:
+            ends = self._walls.reshape(-1, 2)
+            bounds = (ends[:, 0].min(), ends[:, 1].min(), ends[:, 0].max(), ends[:, 1].max()) if len(ends) else \
+                (0.0, 0.0, 0.0, 0.0)
+        self.bounds = tuple(float(v) for v in bounds)
+        self.cell_size = float(cell_size)
+        self.origin = self.bounds[:2]
+        self.shape = (int(floor((self.bounds[3] - self.bounds[1]) / self.cell_size)) + 1,
+                      int(floor((self.bounds[2] - self.bounds[0]) / self.cell_size)) + 1)
+        self.coverage = np.zeros(self.shape, dtype=np.int32)
+
+        self._walls_points = np.vstack((self._walls.reshape(-1, 2), CoverageMap._calc_walls_crossings(self._walls)))
+        self._border = np.zeros((4, 4))
+
+    # Cameras are spread by chunks across workers, coverages of the chunks are summed
+    def calc_coverage(self, cameras, workers=1):
+        cameras = np.array(cameras, dtype=float).reshape(-1, 2)
+        self._set_border(cameras)
+
+        # Rays by walls tables of the cameras of a chunk have about _visibility_chunk_size cells,
+        # each worker gets a chunk at least
+        rays_count = len(self._walls_points) + len(self._border) + len(self._walls)
+        chunk_size = max(1, min(self._visibility_chunk_size // (rays_count * (len(self._walls) + len(self._border))),
+                                -(-len(cameras) // max(workers, 1))))
+        chunks = [cameras[i:i + chunk_size] for i in range(0, len(cameras), chunk_size)]
+        coverage = np.zeros(self.shape, dtype=np.int32)
+        if workers <= 1:
+            for chunk in chunks:
+                coverage += self._calc_chunk_coverage(chunk)
+        else:
+            with process_pool(workers, set_worker_state, (self,)) as pool:
+                for chunk_coverage in pool.imap_unordered(_calc_chunk_coverage_in_worker, chunks):
+                    coverage += chunk_coverage
+
+        self.coverage = coverage
+        return coverage
+
+    # Points of the cells, which no camera sees
+    def get_uncovered_cells(self):
+        return raster.cells_centers(self.coverage == 0, self.origin, self.cell_size)
+
+    def _calc_chunk_coverage(self, cameras):
+        return raster.count_triangles(self._get_views_triangles(cameras), self.shape, self.origin, self.cell_size)
+
+    # Walls of a rectangle around the grid and the cameras close the views, which don't meet a wall
+    def _set_border(self, cameras):
+        points = np.vstack((self._walls.reshape(-1, 2), cameras, np.reshape(self.bounds, (2, 2))))
+        padding = self.cell_size + 1
+        (min_x, min_y), (max_x, max_y) = points.min(axis=0) - padding, points.max(axis=0) + padding
+        corners = np.array([(min_x, min_y), (max_x, min_y), (max_x, max_y), (min_x, max_y)])
+
+        self._border = np.hstack((corners, np.roll(corners, -1, axis=0)))
+        self._reach = 2.0 * np.hypot(max_x - min_x, max_y - min_y)
+
+    # Collinear points have the negative orientation (see geometry.orientation): the rays from a camera on a wall
+    # to its other side cross the wall at the camera
+    def _get_views_triangles(self, cameras):
+        walls = np.vstack((self._walls, self._border))
+        walls_a, walls_v = walls[:, :2], walls[:, 2:] - walls[:, :2]
+        p = cameras[:, None]
+
+        directions = np.vstack((self._walls_points, self._border[:, :2])) - p
+
+        # A wall ending at the camera blocks the rays on one side of its line only, so the ray from the camera
+        # away from the wall bounds the views too. Other walls repeat the direction to their first end
+        ends_a, ends_b = self._walls[:, :2], self._walls[:, 2:]
+        away = np.where(np.all(ends_a == p, axis=2)[..., None], ends_a - ends_b,
+                        np.where(np.all(ends_b == p, axis=2)[..., None], ends_b - ends_a, ends_a - p))
+        directions = np.concatenate((directions, away), axis=1)
+        angles = np.sort(np.arctan2(directions[..., 1], directions[..., 0]), axis=1)
+        angles = np.hstack((angles, angles[:, :1] + 2 * pi))
+
+        # Nearest walls crossed by the rays between the neighbouring angles
+        middles = (angles[:, :-1] + angles[:, 1:]) / 2
+        rays = np.stack((np.cos(middles), np.sin(middles)), axis=-1)
+        is_crossed = geometry.intersect(p[:, None], (p + self._reach * rays)[:, :, None], walls_a, walls[:, 2:],
+                                        collinear=-1)
+        distances = np.where(is_crossed, CoverageMap._calc_distances(p[:, None], rays[:, :, None], walls_a, walls_v),
+                             np.inf)
+        nearest = np.argmin(distances, axis=2)
+        is_open = (np.take_along_axis(distances, nearest[..., None], axis=2)[..., 0] > 0.0) & \
+            (angles[:, 1:] > angles[:, :-1])
+
+        # Neighbouring open intervals of a camera with the same nearest wall are one triangle
+        is_same = np.zeros(is_open.shape, dtype=bool)
+        is_same[:, 1:] = (nearest[:, 1:] == nearest[:, :-1]) & is_open[:, 1:] & is_open[:, :-1]
+        is_last = np.ones(is_open.shape, dtype=bool)
+        is_last[:, :-1] = ~is_same[:, 1:]
+        cameras_indices, firsts = np.nonzero(is_open & ~is_same)
+        lasts = np.nonzero(is_open & is_last)[1]
+        nearest = nearest[cameras_indices, firsts]
+        p = cameras[cameras_indices]
+
+        # Triangles from the camera to the nearest wall between the rays at the angles
+        corners = []
+        for ray_angles in (angles[cameras_indices, firsts], angles[cameras_indices, lasts + 1]):
+            rays = np.column_stack((np.cos(ray_angles), np.sin(ray_angles)))
+            corners.append(p + CoverageMap._calc_distances(p, rays, walls_a[nearest], walls_v[nearest])[:, None] * rays)
+
+        return np.stack((p, corners[0], corners[1]), axis=1)
+
+    # Distances from the point p along the unit rays to the lines of the walls a + t * v
+    @staticmethod
+    def _calc_distances(p, rays, walls_a, walls_v):
+        offsets = walls_a - p
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return (offsets[..., 0] * walls_v[..., 1] - offsets[..., 1] * walls_v[..., 0]) / \
+                (rays[..., 0] * walls_v[..., 1] - rays[..., 1] * walls_v[..., 0])
+
+    # Points, where walls cross each other not at their ends
+    @staticmethod
+    def _calc_walls_crossings(walls):
+        i, j = np.nonzero(np.triu(geometry.intersect_matrix(walls, walls), 1))
+        a, u = walls[i, :2], walls[i, 2:] - walls[i, :2]
+        b, w = walls[j, :2], walls[j, 2:] - walls[j, :2]
+        t = ((b[:, 0] - a[:, 0]) * w[:, 1] - (b[:, 1] - a[:, 1]) * w[:, 0]) / (u[:, 0] * w[:, 1] - u[:, 1] * w[:, 0])
+
+        return a + t[:, None] * u
+
+
+def _calc_chunk_coverage_in_worker(cameras):
+    return worker_state()._calc_chunk_coverage(cameras)
@@ -27,6 +27,11 @@ class Main(object):
             ((855, 278), (953, 218))
         ]
 
+        # Cameras count, None to find the minimal one
+        self._cameras_count = 2
+        self._cameras_time_budget = 10.0
+        self._workers = 1
+
         self._mp = MapProcessor(Main.find_cameras, self)
 
     def main(self):
@@ -39,11 +44,15 @@ class Main(object):
         print('Ready!')
         sp = SecurityPlanner(self._segments, self._mp.blue_points)
 
-        cam_pos = sp.find_cameras_positions()
+        if self._cameras_count == 2:
+            cam_pos = sp.find_cameras_positions(self._workers)
+        else:
+            cam_pos = sp.find_cameras_positions_k(self._cameras_count, exact=True,
+                                                  time_budget=self._cameras_time_budget, workers=self._workers)
 
         if cam_pos is not None:
-            print('cam pos 1: (%d, %d)' % (cam_pos[0][0], cam_pos[0][1]))
-            print('cam pos 2: (%d, %d)' % (cam_pos[1][0], cam_pos[1][1]))
+            for i, p in enumerate(cam_pos):
+                print('cam pos %d: (%d, %d)' % (i + 1, p[0], p[1]))
             self._mp.draw_cameras(cam_pos)
         else:
             print('No solutions!')
@@ -4,13 +4,13 @@ import skimage
 from skimage.draw import line
 
 class MapProcessor(object):
-    def __init__(self, callback, main):
+    def __init__(self, callback, main, max_blue_points_count=4):
         self.img = np.ndarray((650, 1100, 3), np.dtype('uint8'))
         self.img.fill(255)
         self._fig = plt.figure(figsize=(20, 10))
         self._ax = self._fig.gca()
         self._cid = self._fig.canvas.mpl_connect('button_press_event', self.__onclick__)
-        self._max_blue_points_count = 4
+        self._max_blue_points_count = max_blue_points_count
         self.blue_points = {}
         self._callback = callback
         self._main = main
@@ -25,6 +25,46 @@ class MapProcessor(object):
             self._ax.plot(p[0], p[1], 'ro')
             self._fig.canvas.draw()
 
+    # Image of the walls with blue points and cameras, drawn without a figure
+    @staticmethod
+    def rasterize(segments, blue_points, cameras, margin=20):
+        xs = [p[0] for s in segments for p in s] + [p[0] for p in blue_points] + [p[0] for p in cameras]
+        ys = [p[1] for s in segments for p in s] + [p[1] for p in blue_points] + [p[1] for p in cameras]
+        img = np.ndarray((int(max(ys or [0])) + margin, int(max(xs or [0])) + margin, 3), np.dtype('uint8'))
+        img.fill(255)
+
+        for s in segments:
+            rr, cc = line(int(round(s[0][1])), int(round(s[0][0])), int(round(s[1][1])), int(round(s[1][0])))
+            img[rr, cc, :] = 0
+
+        for points, color in ((blue_points, (0, 0, 255)), (cameras, (255, 0, 0))):
+            for p in points:
+                x, y = int(round(p[0])), int(round(p[1]))
+                img[max(y - 3, 0):y + 4, max(x - 3, 0):x + 4, :] = color
+
+        return img
+
+    # Heat map of the coverage, a pixel for each cell, cells seen by no camera are red, walls are black
+    @staticmethod
+    def rasterize_coverage(coverage_map, segments, color_map='viridis'):
+        coverage = coverage_map.coverage
+        img = plt.get_cmap(color_map)(coverage / float(max(coverage.max(), 1)))[..., :3]
+        img = (img * 255).astype(np.uint8)
+        img[coverage == 0] = (255, 0, 0)
+
+        for s in segments:
+            (c0, r0), (c1, r1) = [(int(round((p[0] - coverage_map.origin[0]) / coverage_map.cell_size)),
+                                   int(round((p[1] - coverage_map.origin[1]) / coverage_map.cell_size))) for p in s]
+            rr, cc = line(r0, c0, r1, c1)
+            is_inside = (rr >= 0) & (rr < img.shape[0]) & (cc >= 0) & (cc < img.shape[1])
+            img[rr[is_inside], cc[is_inside], :] = 0
+
+        return img
+
+    @staticmethod
+    def save(path, img):
+        plt.imsave(path, img)
+
     def show(self):
         plt.imshow(self.img)
         plt.show()
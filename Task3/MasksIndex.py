@@ -0,0 +1,75 @@
+import numpy as np
+
+
+# Bitmasks of blue points with the first points having them, grouped by the number of their bits: supersets of
+# a mask are only in the groups of at least as many bits. Masks are added in order of their points, so the first
+# superset in a group has the smallest point of the group, and a group is scanned by chunks until it is found.
+# Chunks shorter than the chunk size are scanned as ints, longer ones as arrays of 64 bits words
+class MasksIndex(object):
+    def __init__(self, bits_count, chunk_size=256):
+        self._words_count = max(1, (bits_count + 63) // 64)
+        self._chunk_size = chunk_size
+        self._added_count = 0
+
+        # Masks of the group k (as ints and as columns of words), the order of their adding and their points,
+        # the group buffers are doubled when full
+        self._int_masks = [[] for k in range(bits_count + 1)]
+        self._masks = [np.zeros((self._words_count, 64), dtype=np.uint64) for k in range(bits_count + 1)]
+        self._orders = [np.zeros(64, dtype=np.intp) for k in range(bits_count + 1)]
+        self._points = [np.zeros(64, dtype=np.intp) for k in range(bits_count + 1)]
+        self._counts = [0] * (bits_count + 1)
+
+    def __len__(self):
+        return self._added_count
+
+    def add(self, masks, point):
+        for m in masks:
+            k = bin(m).count('1')
+            count = self._counts[k]
+            if count == len(self._points[k]):
+                self._masks[k] = np.hstack((self._masks[k], np.zeros_like(self._masks[k])))
+                self._orders[k] = np.concatenate((self._orders[k], np.zeros_like(self._orders[k])))
+                self._points[k] = np.concatenate((self._points[k], np.zeros_like(self._points[k])))
+
+            self._int_masks[k].append(m)
+            self._masks[k][:, count] = self._pack([m])[0]
+            self._orders[k][count] = self._added_count
+            self._points[k][count] = point
+            self._counts[k] = count + 1
+            self._added_count += 1
+
+    # The smallest point of the masks containing the mask, which were added after the first `since` masks,
+    # None if there are no such masks
+    def find_first_superset(self, mask, since=0):
+        packed = self._pack([mask])[0]
+        first_point = None
+        for k in range(bin(mask).count('1'), len(self._counts)):
+            count = self._counts[k]
+            if count == 0 or self._orders[k][count - 1] < since:
+                continue
+
+            int_masks, masks, points = self._int_masks[k], self._masks[k], self._points[k]
+            start = int(np.searchsorted(self._orders[k][:count], since))
+            for begin in range(start, count, self._chunk_size):
+                if first_point is not None and points[begin] >= first_point:
+                    break
+
+                end = min(begin + self._chunk_size, count)
+                if end - begin < self._chunk_size:
+                    found = next((i for i in range(begin, end) if int_masks[i] & mask == mask), None)
+                else:
+                    is_superset = (masks[0, begin:end] & packed[0]) == packed[0]
+                    for word, packed_word in zip(masks[1:], packed[1:]):
+                        is_superset &= (word[begin:end] & packed_word) == packed_word
+                    found = begin + int(is_superset.argmax()) if is_superset.any() else None
+                if found is not None:
+                    point = int(points[found])
+                    first_point = point if first_point is None else min(first_point, point)
+                    break
+
+        return first_point
+
+    # Masks as rows of 64 bits words
+    def _pack(self, masks):
+        packed = b''.join(m.to_bytes(8 * self._words_count, 'little') for m in masks)
+        return np.frombuffer(packed, dtype='<u8').reshape(-1, self._words_count)
@@ -1,29 +1,385 @@
 from math import sqrt
 from math import acos
 from math import atan2
+from heapq import heapify, heappush, heappop
+from time import time
+from itertools import groupby
+
+import numpy as np
+
+from Common import ResultsCache, geometry, imap_window, process_pool, profiler, set_worker_state, worker_state
+from CoverageMap import CoverageMap
+from MasksIndex import MasksIndex
+from WallsIndex import WallsIndex
 
 
 class SecurityPlanner(object):
-    def __init__(self, segments, blue_points):
+    def __init__(self, segments, blue_points, adaptive_sampling=False, refinement_depth=0, walls_index=None,
+                 verbose=True, cache=None):
         self._step_through_segment = 1.0
+        self._adaptive_sampling = adaptive_sampling
+        self._refinement_depth = refinement_depth
+        self._visibility_chunk_size = 1 << 22
+        self._samples_chunk_size = 256
         self._segments = segments
         self._blue_points = blue_points
+        self._walls = np.array(segments, dtype=float).reshape(-1, 4)
+        self._walls_index = walls_index or WallsIndex(segments)
+        self._verbose = verbose
+        self._cache = cache
+
+    # Workers get the planner without the cache: its SQLite connection can't be shared, and only the parent process
+    # reads and writes the cached results
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_cache'] = None
+        return state
+
+    # With several workers the pair search runs on the visible sets as they come, so the first found pair
+    # is returned, which may differ from the pair found by a single process
+    def find_cameras_positions(self, workers=1):
+        cameras = self._find_cached_cameras(self._find_covering_cameras_pair, (workers > 1,), workers)
+        return tuple(cameras) if cameras is not None else None
+
+    def _find_covering_cameras_pair(self, workers):
+        if workers > 1:
+            return self._find_covering_pair_in_stream(self._iter_visible_sets(workers))
+
+        d = self._calc_visible_sets()
+
+        with profiler.phase('pair search'):
+            return self._find_covering_pair(d)
+
+    # Positions of at most k cameras covering all blue points, the minimal found number of cameras if k is None.
+    # Greedy cover is improved by branch and bound if exact, the search is stopped after time_budget seconds
+    def find_cameras_positions_k(self, k=None, exact=False, time_budget=None, workers=1):
+        return self._find_cached_cameras(self._find_covering_cameras, (k, exact, time_budget),
+                                         k, exact, time_budget, workers)
+
+    def _find_covering_cameras(self, k, exact, time_budget, workers):
+        d = self._calc_visible_sets(workers)
+
+        bits = dict((k, 1 << i) for i, k in enumerate(self._blue_points.keys()))
+        full_mask = (1 << len(bits)) - 1
+
+        # Each mask is placed to the first point having it, masks contained in other masks are not needed
+        first_points = {}
+        for p, vs in d.items():
+            for m in SecurityPlanner._get_maximal_masks(vs, bits):
+                first_points.setdefault(m, p)
+        maximal_masks = set(SecurityPlanner._get_maximal(first_points.keys()))
+        masks = [m for m in first_points.keys() if m in maximal_masks]
+
+        covered = 0
+        for m in masks:
+            covered |= m
+        if covered != full_mask:
+            return None
+
+        # Without blue points the greedy cover is empty, so there is nothing to improve
+        with profiler.phase('cover search'):
+            cover = SecurityPlanner._cover_greedy(masks, full_mask)
+            if exact and full_mask and (k is None or len(cover) > k):
+                cover = SecurityPlanner._cover_exact(masks, full_mask, bits, cover, k,
+                                                     time() + time_budget if time_budget is not None else None)
 
-    def find_cameras_positions(self):
+        if cover is None or (k is not None and len(cover) > k):
+            return None
+
+        return [first_points[masks[i]] for i in cover]
+
+    # Number of the candidate camera positions (samples of the walls) seeing each cell of the grid with the step
+    # cell_size over bounds (min x, min y, max x, max y), the walls by default. Cameras are not turned yet,
+    # so the sectors of 90 degrees are not applied
+    def calc_coverage_map(self, cell_size=1.0, bounds=None, workers=1):
+        cameras = np.unique(np.array([p for p, segm in self._get_samples()], dtype=float).reshape(-1, 2), axis=0)
+        coverage_map = CoverageMap(self._segments, bounds, cell_size)
+
+        with profiler.phase('coverage'):
+            coverage_map.calc_coverage(cameras, workers)
+
+        return coverage_map
+
+    def _calc_visible_sets(self, workers=1):
         d = {}
-        for segm in self._segments:
-            for p in self._get_steps_for_segment(segm):
-                d[p] = self._get_view_points(p, segm[0], segm[1])
+        for p, vs in self._iter_visible_sets(workers):
+            d[p] = vs
+
+        if self._verbose:
+            print('Visible sets calculated')
+
+        return d
+
+    def _get_samples(self):
+        samples = []
+        with profiler.phase('sampling'):
+            for segm in self._segments:
+                steps = self._get_events_steps_for_segment(segm) if self._adaptive_sampling else \
+                    self._get_steps_for_segment(segm)
+                for p in steps:
+                    samples.append((p, segm))
+
+        return samples
+
+    # Samples of one wall are close to each other, so their visibility is calculated together
+    def _calc_samples_view_points(self, samples):
+        visible_sets = []
+        for segm, segm_samples in groupby(samples, key=lambda sample: sample[1]):
+            points = [p for p, s in segm_samples]
+            with profiler.phase('visibility'):
+                visibility = self._calc_visibility_matrix(points)
+            with profiler.phase('sector sets'):
+                chunk = max(1, self._visibility_chunk_size // (len(self._blue_points) + 2) ** 2)
+                for start in range(0, len(points), chunk):
+                    chunk_points = points[start:start + chunk]
+                    sides, is_narrow = self._calc_sectors_tables(chunk_points, segm[0], segm[1])
+                    for p, visible, p_sides, p_is_narrow in zip(chunk_points, visibility[start:start + chunk],
+                                                                sides, is_narrow):
+                        visible_sets.append(self._get_view_points(p, segm[0], segm[1], visible,
+                                                                  p_sides, p_is_narrow))
+
+        return visible_sets
+
+    # Visible sets of the same walls, blue points and sampling are taken from the cache, they are stored
+    # only if all of them are calculated
+    def _iter_visible_sets(self, workers=1):
+        if self._cache is None:
+            for p, vs in self._iter_calculated_visible_sets(workers):
+                yield p, vs
+            return
+
+        key = self._get_cache_key()
+        with profiler.phase('cache'):
+            arrays = self._cache.get(key)
+        if arrays is not None:
+            for p, vs in self._unpack_visible_sets(arrays):
+                yield p, vs
+            return
 
-        print('Visible sets calculated')
+        visible_sets = []
+        for p, vs in self._iter_calculated_visible_sets(workers):
+            visible_sets.append((p, vs))
+            yield p, vs
+        self._cache.put(key, self._pack_visible_sets(visible_sets))
 
-        for p1, vs1 in d.items():
-            for p2, vs2 in d.items():
-                if self._is_visible_sets_full(vs1, vs2):
-                    return (p1, p2)
+    # Cameras found for the same visible sets by the same search are taken from the cache
+    def _find_cached_cameras(self, find, parameters, *arguments):
+        if self._cache is None:
+            return find(*arguments)
+
+        key = ResultsCache.key(self._get_cache_key(), find.__name__, parameters)
+        arrays = self._cache.get(key)
+        if arrays is not None:
+            return [tuple(p) for p in arrays['cameras'].tolist()] if arrays['found'][0] else None
+
+        cameras = find(*arguments)
+        self._cache.put(key, {
+            'found': np.array([cameras is not None]),
+            'cameras': np.array(cameras or [], dtype=float).reshape(-1, 2)
+        })
+
+        return cameras
+
+    def _get_cache_key(self):
+        return ResultsCache.key(type(self).__name__, self._segments, list(self._blue_points.items()),
+                                self._step_through_segment, self._adaptive_sampling, self._refinement_depth)
+
+    # Sets are lists of positions of blue points, points_starts[i]:points_starts[i + 1] are the sets of
+    # the point i and sets_starts[j]:sets_starts[j + 1] are the blue points of the set j
+    def _pack_visible_sets(self, visible_sets):
+        positions = dict((k, i) for i, k in enumerate(self._blue_points.keys()))
+        points_starts, sets_starts, members = [0], [0], []
+        for p, vs in visible_sets:
+            for s in vs:
+                members.extend(positions[k] for k in s)
+                sets_starts.append(len(members))
+            points_starts.append(len(sets_starts) - 1)
+
+        return {
+            'points': np.array([p for p, vs in visible_sets], dtype=float).reshape(-1, 2),
+            'points_starts': np.array(points_starts, dtype=np.int64),
+            'sets_starts': np.array(sets_starts, dtype=np.int64),
+            'members': np.array(members, dtype=np.int64)
+        }
+
+    def _unpack_visible_sets(self, arrays):
+        keys = list(self._blue_points.keys())
+        members = [keys[i] for i in arrays['members'].tolist()]
+        sets_starts = arrays['sets_starts'].tolist()
+        sets = [set(members[sets_starts[j]:sets_starts[j + 1]]) for j in range(len(sets_starts) - 1)]
+
+        points_starts = arrays['points_starts'].tolist()
+        for i, p in enumerate(arrays['points'].tolist()):
+            yield tuple(p), sets[points_starts[i]:points_starts[i + 1]]
+
+    # Pairs (point, visible sets) in the order of the samples, chunks of the samples are spread across workers
+    def _iter_calculated_visible_sets(self, workers=1):
+        samples = self._get_samples()
+        if workers <= 1:
+            for (p, segm), vs in zip(samples, self._calc_samples_view_points(samples)):
+                yield p, vs
+            return
+
+        chunks = [samples[i:i + self._samples_chunk_size] for i in range(0, len(samples), self._samples_chunk_size)]
+
+        with process_pool(workers, set_worker_state, (self,)) as pool:
+            # A consumer stopping early, like the streamed pair search, waits for a window of chunks only
+            window_visible_sets = imap_window(pool, _calc_view_points_in_worker, chunks, 2 * workers)
+            for chunk, chunk_visible_sets in zip(chunks, window_visible_sets):
+                for (p, segm), vs in zip(chunk, chunk_visible_sets):
+                    yield p, vs
+
+    # Each new point is checked against the masks of the points before it and itself. Masks are packed as they come,
+    # a complement searched before is only searched in the masks added since then
+    def _find_covering_pair_in_stream(self, visible_sets):
+        bits = dict((k, 1 << i) for i, k in enumerate(self._blue_points.keys()))
+        full_mask = (1 << len(bits)) - 1
+
+        points, first_points, searched = [], {}, {}
+        masks_index = MasksIndex(len(bits))
+        for p, vs in visible_sets:
+            with profiler.phase('pair search'):
+                masks = SecurityPlanner._get_maximal_masks(vs, bits)
+                new_masks = [m for m in masks if m not in first_points]
+                for m in new_masks:
+                    first_points[m] = len(points)
+                masks_index.add(new_masks, len(points))
+                points.append(p)
+
+                # Masks added since the last search of the same complement are searched only
+                partner = None
+                for m in masks:
+                    complement = full_mask & ~m
+                    searched_count = searched.get(complement, 0)
+                    searched[complement] = len(masks_index)
+                    found = masks_index.find_first_superset(complement, searched_count)
+                    if found is not None and (partner is None or found < partner):
+                        partner = found
+
+                if partner is not None:
+                    visible_sets.close()
+                    return (p, points[partner])
 
         return None
 
+    # Same as checking _is_visible_sets_full for all pairs of points in order, sets are bitmasks of blue points
+    def _find_covering_pair(self, d):
+        bits = dict((k, 1 << i) for i, k in enumerate(self._blue_points.keys()))
+        full_mask = (1 << len(bits)) - 1
+
+        points = list(d.keys())
+        points_masks = [SecurityPlanner._get_maximal_masks(vs, bits) for vs in d.values()]
+
+        # Unique masks with the first point having them
+        first_points = {}
+        for i, masks in enumerate(points_masks):
+            for m in masks:
+                first_points.setdefault(m, i)
+
+        masks_index = MasksIndex(len(bits))
+        for m, i in first_points.items():
+            masks_index.add([m], i)
+
+        # First partners are looked up by the complement of the mask, each complement is searched once
+        partners = {}
+        for i, masks in enumerate(points_masks):
+            partner = None
+            for m in masks:
+                complement = full_mask & ~m
+                if complement not in partners:
+                    partners[complement] = masks_index.find_first_superset(complement)
+                if partners[complement] is not None and (partner is None or partners[complement] < partner):
+                    partner = partners[complement]
+
+            if partner is not None:
+                return (points[i], points[partner])
+
+        return None
+
+    # Masks of the visible sets without duplicates and sets contained in other sets
+    @staticmethod
+    def _get_maximal_masks(vs, bits):
+        masks = set()
+        for s in vs:
+            m = 0
+            for k in s:
+                m |= bits[k]
+            masks.add(m)
+
+        return SecurityPlanner._get_maximal(masks)
+
+    @staticmethod
+    def _get_maximal(masks):
+        maximal_masks = []
+        for m in sorted(set(masks), key=lambda m: -SecurityPlanner._calc_bits_count(m)):
+            if all(m & ~other for other in maximal_masks):
+                maximal_masks.append(m)
+        return maximal_masks
+
+    @staticmethod
+    def _calc_bits_count(m):
+        return bin(m).count('1')
+
+    # Lazy greedy: gains in the heap are only recalculated for the mask on the top
+    @staticmethod
+    def _cover_greedy(masks, full_mask):
+        heap = [(-SecurityPlanner._calc_bits_count(m), i) for i, m in enumerate(masks)]
+        heapify(heap)
+
+        cover = []
+        uncovered = full_mask
+        while uncovered and heap:
+            _, i = heappop(heap)
+            gain = SecurityPlanner._calc_bits_count(masks[i] & uncovered)
+            if not gain:
+                continue
+            if heap and gain < -heap[0][0]:
+                heappush(heap, (-gain, i))
+                continue
+
+            cover.append(i)
+            uncovered &= ~masks[i]
+
+        return cover
+
+    @staticmethod
+    def _cover_exact(masks, full_mask, bits, cover, k, deadline):
+        # Masks covering each blue point
+        covering = [[i for i, m in enumerate(masks) if m & bit] for bit in sorted(bits.values())]
+        max_bits_count = max(SecurityPlanner._calc_bits_count(m) for m in masks)
+
+        # Only covers smaller than the best one are searched
+        best = [cover, len(cover) if k is None or len(cover) <= k else k + 1]
+        SecurityPlanner._search_cover(masks, covering, max_bits_count, full_mask, [], best, deadline)
+
+        return best[0]
+
+    # Returns False if the search is stopped by the deadline
+    @staticmethod
+    def _search_cover(masks, covering, max_bits_count, uncovered, chosen, best, deadline):
+        if not uncovered:
+            best[0], best[1] = list(chosen), len(chosen)
+            return True
+
+        # Each of the next masks covers at most max_bits_count blue points
+        uncovered_count = SecurityPlanner._calc_bits_count(uncovered)
+        if len(chosen) + (uncovered_count + max_bits_count - 1) // max_bits_count >= best[1]:
+            return True
+        if deadline is not None and time() > deadline:
+            return False
+
+        # Branch on the masks covering the blue point with the fewest of them
+        point = min((j for j in range(len(covering)) if uncovered >> j & 1), key=lambda j: len(covering[j]))
+        for i in sorted(covering[point], key=lambda i: -SecurityPlanner._calc_bits_count(masks[i] & uncovered)):
+            chosen.append(i)
+            is_complete = SecurityPlanner._search_cover(masks, covering, max_bits_count, uncovered & ~masks[i],
+                                                        chosen, best, deadline)
+            chosen.pop()
+            if not is_complete:
+                return False
+
+        return True
+
     def _is_visible_sets_full(self, vs1, vs2):
         for s1 in vs1:
             for s2 in vs2:
@@ -31,86 +387,115 @@ class SecurityPlanner(object):
                     return True
         return False
 
-    def _get_view_points(self, p, segm_a, segm_b):
-        visible_points = {}
-        for k, bp in self._blue_points.items():
-            if not self._is_intersect_something((p, bp)):
-                visible_points[k] = bp
+    def _get_view_points(self, p, segm_a, segm_b, visible=None, sides=None, is_narrow=None):
+        if visible is None:
+            visible = [not self._is_intersect_something((p, bp)) for bp in self._blue_points.values()]
+        if sides is None:
+            sides, is_narrow = self._calc_sectors_tables([p], segm_a, segm_b)
+            sides, is_narrow = sides[0], is_narrow[0]
+
+        keys = list(self._blue_points.keys())
+        visible_indices = [i for i, is_visible in enumerate(visible) if is_visible]
+        sides, is_narrow = sides.tolist(), is_narrow.tolist()
+        a, b = len(keys), len(keys) + 1
 
         rvp = []
 
-        for i, vp_i in visible_points.items():
-            for j, vp_j in visible_points.items():
-                if (i != j) and (SecurityPlanner._is_90_degrees_sector(p, vp_i, vp_j)):
-                    if not (SecurityPlanner._is_in_sector(segm_a, p, vp_i, vp_j) and
-                            SecurityPlanner._is_in_sector(segm_b, p, vp_i, vp_j)):
+        for i in visible_indices:
+            for j in visible_indices:
+                if (i != j) and is_narrow[i][j]:
+                    if not (sides[i][a] != sides[j][a] and sides[i][b] != sides[j][b]):
                         # Find points in sector (p, vp_i, vp_j)
-                        sector_points = SecurityPlanner._get_points_in_sector(p, vp_i, vp_j, visible_points)
-                        rvp.append(sector_points | {i, j})
-                    elif SecurityPlanner._is_in_sector(segm_a, p, vp_i, vp_j):
+                        sector_points = SecurityPlanner._get_points_in_sector(keys, visible_indices, sides, i, j)
+                        rvp.append(sector_points | {keys[i], keys[j]})
+                    elif sides[i][a] != sides[j][a]:
                         # Find points in sectors (p, a, vp_i) and (p, a, vp_j) separately
-                        sector_points = SecurityPlanner._get_points_in_sector(p, segm_a, vp_i, visible_points)
-                        rvp.append(sector_points | {i})
-                        sector_points = SecurityPlanner._get_points_in_sector(p, segm_a, vp_j, visible_points)
-                        rvp.append(sector_points | {j})
-                    elif SecurityPlanner._is_in_sector(segm_b, p, vp_i, vp_j):
+                        sector_points = SecurityPlanner._get_points_in_sector(keys, visible_indices, sides, a, i)
+                        rvp.append(sector_points | {keys[i]})
+                        sector_points = SecurityPlanner._get_points_in_sector(keys, visible_indices, sides, a, j)
+                        rvp.append(sector_points | {keys[j]})
+                    elif sides[i][b] != sides[j][b]:
                         # Find points in sectors (p, b, vp_i) and (p, b, vp_j) separately
-                        sector_points = SecurityPlanner._get_points_in_sector(p, segm_b, vp_i, visible_points)
-                        rvp.append(sector_points | {i})
-                        sector_points = SecurityPlanner._get_points_in_sector(p, segm_b, vp_j, visible_points)
-                        rvp.append(sector_points | {j})
+                        sector_points = SecurityPlanner._get_points_in_sector(keys, visible_indices, sides, b, i)
+                        rvp.append(sector_points | {keys[i]})
+                        sector_points = SecurityPlanner._get_points_in_sector(keys, visible_indices, sides, b, j)
+                        rvp.append(sector_points | {keys[j]})
 
-        for k, vp in visible_points.items():
+        for i in visible_indices:
             # I know {k} may be already in rvp
-            rvp.append({k})
+            rvp.append({keys[i]})
 
         return rvp
 
+    # Row i, column j is True if the blue point j is visible from the point i
+    def _calc_visibility_matrix(self, points):
+        points = np.array(points, dtype=float).reshape(-1, 2)
+        targets = np.array(list(self._blue_points.values()), dtype=float).reshape(-1, 2)
+
+        visibility = np.ones((len(points), len(targets)), dtype=bool)
+        if not len(points) or not len(targets) or not len(self._walls):
+            return visibility
+
+        # Sight lines from points on one line (samples of one wall) are inside the triangle of the ends of
+        # the points and the blue point, other sight lines are inside the bounding box with the blue point
+        points_min, points_max = points.min(axis=0), points.max(axis=0)
+        axis = int(points_max[1] - points_min[1] > points_max[0] - points_min[0])
+        first, last = points[np.argmin(points[:, axis])], points[np.argmax(points[:, axis])]
+        deviations = np.abs((points[:, 0] - first[0]) * (last[1] - first[1]) -
+                            (points[:, 1] - first[1]) * (last[0] - first[0]))
+        is_on_line = np.all(deviations <= 1e-6 * (1.0 + np.sum((last - first) ** 2)))
+
+        for j, t in enumerate(targets):
+            if is_on_line:
+                walls_indices = self._walls_index.get_walls_in_triangle(first.tolist(), last.tolist(), t.tolist())
+            else:
+                box_min, box_max = np.minimum(points_min, t), np.maximum(points_max, t)
+                walls_indices = self._walls_index.get_walls_in_box(box_min[0], box_min[1], box_max[0], box_max[1])
+            walls = self._walls[walls_indices]
+            if not len(walls):
+                continue
+
+            walls_a = walls[None, :, :2]
+            walls_b = walls[None, :, 2:]
+
+            # Points are processed by chunks to bound the memory of points x walls arrays
+            chunk = max(1, self._visibility_chunk_size // len(walls))
+            for start in range(0, len(points), chunk):
+                p = points[start:start + chunk, None]
+                profiler.count('visibility segment tests', len(p) * len(walls))
+
+                is_intersect = geometry.intersect(p, t, walls_a, walls_b, collinear=-1)
+                visibility[start:start + chunk, j] = ~is_intersect.any(axis=1)
+
+        return visibility
+
+    # Collinear points have the negative orientation, see geometry.orientation
     def _is_intersect_something(self, segm):
-        for s in self._segments:
-            if SecurityPlanner._is_intersect(segm, s):
-                return True
-        return False
+        walls = self._walls[self._walls_index.get_walls_on_segment(segm)]
+        profiler.count('visibility segment tests', len(walls))
+        return bool(geometry.intersect(segm[0], segm[1], walls[:, :2], walls[:, 2:], collinear=-1).any())
 
-    @staticmethod
-    def _is_intersect(s1, s2):
-        p1 = s1[0]
-        q1 = s1[1]
-        p2 = s2[0]
-        q2 = s2[1]
+    # Rays from each point go through the blue points and then through the ends a and b of the segment,
+    # sides[s][r][c] is the orientation of the blue point (or end) c relative to the ray r from the point s,
+    # is_narrow[s][i][j] is True if the sector between the rays i and j from the point s is < 90 degrees
+    def _calc_sectors_tables(self, points, segm_a, segm_b):
+        points = np.array(points, dtype=float).reshape(-1, 2)
+        targets = np.array(list(self._blue_points.values()), dtype=float).reshape(-1, 2)
+        ends = np.vstack((targets, [segm_a, segm_b]))
 
-        return (SecurityPlanner._calc_orientation(p1, q1, p2) !=
-                SecurityPlanner._calc_orientation(p1, q1, q2)) and \
-               (SecurityPlanner._calc_orientation(p2, q2, p1) !=
-                SecurityPlanner._calc_orientation(p2, q2, q1))
+        sides = geometry.orientation(points[:, None, None], ends[None, :, None], ends[None, None, :], collinear=-1)
 
-    @staticmethod
-    def _calc_orientation(p, q, t):
-        orient_value = (q[1] - p[1]) * (t[0] - q[0]) - (t[1] - q[1]) * (q[0] - p[0])
-        if orient_value > 0.0:
-            return 1
-        else:
-            return -1
-
-    # Assume that sector is <= 90 degrees
-    @staticmethod
-    def _is_in_sector(p, root, left, right):
-        return (SecurityPlanner._calc_orientation(root, left, p) !=
-                SecurityPlanner._calc_orientation(root, right, p))
+        directions = targets[None] - points[:, None]
+        is_narrow = directions[:, :, None, 0] * directions[:, None, :, 0] + \
+            directions[:, :, None, 1] * directions[:, None, :, 1] > 0.0
 
-    @staticmethod
-    def _is_90_degrees_sector(root, left, right):
-        a = (left[0] - root[0], left[1] - root[1])
-        b = (right[0] - root[0], right[1] - root[1])
-        return SecurityPlanner._calc_cross_product(a, b) > 0.0
+        return sides, is_narrow
 
+    # Keys of the points between the rays left and right of the sides table, sector is <= 90 degrees
     @staticmethod
-    def _get_points_in_sector(root, left, right, points):
-        sector_points = set()
-        for k, p in points.items():
-            if SecurityPlanner._is_in_sector(p, root, left, right):
-                sector_points.add(k)
-        return sector_points
+    def _get_points_in_sector(keys, indices, sides, left, right):
+        left_sides, right_sides = sides[left], sides[right]
+        return set(keys[k] for k in indices if left_sides[k] != right_sides[k])
 
     def _get_steps_for_segment(self, s):
         steps = []
@@ -124,9 +509,92 @@ class SecurityPlanner(object):
 
         return steps
 
+    # Visible sets only change where the segment crosses a line through a blue point and a wall end or
+    # another blue point, a circle on two blue points (90 degrees sector border) or another wall,
+    # so one step is taken between each two consecutive events
+    def _get_events_steps_for_segment(self, s):
+        bounds = [0.0] + self._calc_segment_events(s) + [1.0]
+
+        steps = [SecurityPlanner._get_point_of_segment(s, 0.0)]
+        for t0, t1 in zip(bounds, bounds[1:]):
+            steps.extend(self._refine_steps(s, t0, t1, self._refinement_depth))
+        if s[0] != s[1]:
+            steps.append(SecurityPlanner._get_point_of_segment(s, 1.0))
+
+        return steps
+
+    def _calc_segment_events(self, s):
+        a = np.array(s[0], dtype=float)
+        u = np.array(s[1], dtype=float) - a
+        targets = np.array(list(self._blue_points.values()), dtype=float).reshape(-1, 2)
+        walls = np.array(self._segments, dtype=float).reshape(-1, 4)
+        walls_ends = walls.reshape(-1, 2)
+
+        # Sight lines from the blue points passing walls ends
+        t, k = SecurityPlanner._calc_lines_crossing(a, u, targets[:, None], walls_ends[None] - targets[:, None])
+        events = [t[k >= 1.0]]
+
+        # Lines through two blue points
+        t, k = SecurityPlanner._calc_lines_crossing(a, u, targets[:, None], targets[None] - targets[:, None])
+        events.append(t.ravel())
+
+        # Other walls
+        t, k = SecurityPlanner._calc_lines_crossing(a, u, walls[:, :2], walls[:, 2:] - walls[:, :2])
+        events.append(t[(k >= 0.0) & (k <= 1.0)])
+
+        # Circles on two blue points as a diameter: (vi - p(t)) . (vj - p(t)) = 0
+        i, j = np.triu_indices(len(targets), 1)
+        vi, vj = targets[i] - a, targets[j] - a
+        qa = u.dot(u)
+        qb = -(vi + vj).dot(u)
+        qc = (vi * vj).sum(axis=1)
+        discriminant = qb * qb - 4.0 * qa * qc
+        if qa > 0.0:
+            root = np.sqrt(discriminant[discriminant >= 0.0])
+            qb = qb[discriminant >= 0.0]
+            events.extend(((-qb - root) / (2.0 * qa), (-qb + root) / (2.0 * qa)))
+
+        events = np.concatenate(events)
+        events = np.unique(events[(events > 0.0) & (events < 1.0)])
+
+        # Events closer than the sampling step to the previous one (or to the ends) are merged with it, so a wall
+        # never gets more samples than the uniform sampling takes
+        min_gap = self._step_through_segment / max(SecurityPlanner._calc_segment_length(s), 1e-12)
+        merged, previous = [], 0.0
+        for event in events.tolist():
+            if event - previous >= min_gap and 1.0 - event >= min_gap:
+                merged.append(event)
+                previous = event
+
+        return merged
+
+    # Parameters t, k of the crossing a + t * u = b + k * w, NaN for parallel lines
     @staticmethod
-    def _calc_cross_product(a, b):
-        return a[0] * b[0] + a[1] * b[1]
+    def _calc_lines_crossing(a, u, b, w):
+        denominator = u[0] * w[..., 1] - u[1] * w[..., 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = ((b[..., 0] - a[0]) * w[..., 1] - (b[..., 1] - a[1]) * w[..., 0]) / denominator
+            k = ((b[..., 0] - a[0]) * u[1] - (b[..., 1] - a[1]) * u[0]) / denominator
+        t, k = np.broadcast_arrays(t, k)
+        return t, k
+
+    # Steps of the interval between events, split while its visible sets differ inside (coarse to fine)
+    def _refine_steps(self, s, t0, t1, depth):
+        t = (t0 + t1) / 2.0
+        if depth <= 0:
+            return [SecurityPlanner._get_point_of_segment(s, t)]
+
+        points = [SecurityPlanner._get_point_of_segment(s, t) for t in ((t0 + t) / 2.0, t, (t + t1) / 2.0)]
+        views = [set(frozenset(vs) for vs in self._get_view_points(p, s[0], s[1], visible))
+                 for p, visible in zip(points, self._calc_visibility_matrix(points))]
+        if views[0] == views[1] == views[2]:
+            return [points[1]]
+
+        return self._refine_steps(s, t0, t, depth - 1) + self._refine_steps(s, t, t1, depth - 1)
+
+    @staticmethod
+    def _get_point_of_segment(s, t):
+        return (s[0][0] + t*(s[1][0] - s[0][0]), s[0][1] + t*(s[1][1] - s[0][1]))
 
     @staticmethod
     def _calc_segment_length(s):
@@ -136,3 +604,8 @@ class SecurityPlanner(object):
     @staticmethod
     def _calc_vector_length(a):
         return sqrt(a[0] * a[0] + a[1] * a[1])
+
+
+def _calc_view_points_in_worker(samples):
+    return worker_state()._calc_samples_view_points(samples)
+
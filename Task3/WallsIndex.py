@@ -0,0 +1,50 @@
+import numpy as np
+
+from Common import grid
+
+
+# Uniform grid of cells, each wall is listed in the cells overlapped by its bounding box
+class WallsIndex(grid.UniformGrid):
+    def __init__(self, segments, cell_size=None):
+        self._walls = np.array(segments, dtype=float).reshape(-1, 4)
+
+        # Boxes are padded, so walls touching a cell border are listed in both cells
+        boxes = np.column_stack((np.minimum(self._walls[:, 0], self._walls[:, 2]),
+                                 np.minimum(self._walls[:, 1], self._walls[:, 3]),
+                                 np.maximum(self._walls[:, 0], self._walls[:, 2]),
+                                 np.maximum(self._walls[:, 1], self._walls[:, 3])))
+        boxes[:, :2] -= self._margin
+        boxes[:, 2:] += self._margin
+        grid.UniformGrid.__init__(self, boxes, cell_size)
+
+        # Walls of the cell c are _cells_walls[_cells_starts[c]:_cells_starts[c + 1]]
+        self._cells_walls, self._cells_starts = self._fill_cells(boxes)
+
+    def get_walls_in_box(self, min_x, min_y, max_x, max_y):
+        column_from, row_from, column_to, row_to = \
+            self._cells_of_boxes(np.array([min_x, min_y, max_x, max_y], dtype=float))[0].tolist()
+
+        walls = [self._cells_walls[self._cells_starts[row * self.columns + column_from]:
+                                   self._cells_starts[row * self.columns + column_to + 1]]
+                 for row in range(row_from, row_to + 1)]
+        if not walls:
+            return np.zeros(0, dtype=np.intp)
+
+        # Cells of a row are consecutive, so walls of a row are one slice
+        return np.unique(np.concatenate(walls))
+
+    # Walls in the cells overlapped by the triangle, row by row
+    def get_walls_in_triangle(self, a, b, c):
+        walls = [self._cells_walls[self._cells_starts[row * self.columns + column_from]:
+                                   self._cells_starts[row * self.columns + column_to + 1]]
+                 for row, column_from, column_to in self.rows_in_triangle(a, b, c)]
+        if not walls:
+            return np.zeros(0, dtype=np.intp)
+
+        return np.unique(np.concatenate(walls))
+
+    def get_walls_on_segment(self, segm):
+        walls = set()
+        for cell, _ in self.cells_on_segment(np.ravel(segm)):
+            walls.update(self._cells_walls[self._cells_starts[cell]:self._cells_starts[cell + 1]].tolist())
+        return sorted(walls)
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from time import time
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class ResultsCache:
+    """
+    Content-addressed cache of arrays on disk. Every entry is a directory of .npy files, which are memory-mapped
+    on lookup, so nothing is copied until the arrays are read. An SQLite index keeps sizes and access times of the
+    entries, the least recently used entries are evicted when the cache grows over max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1 << 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        os.makedirs(os.path.join(directory, "entries"), exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(directory, "index.sqlite"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER, accessed REAL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._db.commit()
+
+    @staticmethod
+    def key(*parts) -> str:
+        """
+        Hash of the parts: numbers, strings, None, and lists, tuples and dicts of them, other values are taken by repr
+        :param parts: geometry and parameters the cached results depend on
+        :return: hex digest
+        """
+        data = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=repr)
+
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        :param key: key of the entry
+        :return: read-only arrays of the entry by their names, None if there is no entry
+        """
+        if self._db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is None:
+            return None
+
+        path = self._path(key)
+        try:
+            arrays = {os.path.splitext(name)[0]: self._load(os.path.join(path, name))
+                      for name in os.listdir(path) if name.endswith(".npy")}
+        except OSError:
+            # Files were removed by another process
+            self._forget(key)
+            return None
+
+        self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time(), key))
+        self._db.commit()
+
+        return arrays
+
+    def put(self, key: str, arrays: Dict[str, np.ndarray]):
+        """
+        Stores the arrays as the entry, replacing the previous one, and evicts the least recently used entries
+        :param key: key of the entry
+        :param arrays: arrays by their names
+        """
+        path = self._path(key)
+
+        # Files are written aside and moved in place at once, so readers never see a partial entry
+        staging = "%s.%d.tmp" % (path, os.getpid())
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        size = 0
+        for name, array in arrays.items():
+            file_path = os.path.join(staging, name + ".npy")
+            np.save(file_path, np.ascontiguousarray(array), allow_pickle=False)
+            size += os.path.getsize(file_path)
+
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.replace(staging, path)
+        except OSError:
+            # Another process has put the entry after it was removed, entries of the same key are the same
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?)", (key, size, time()))
+        self._evict(key)
+        self._db.commit()
+
+    def clear(self):
+        for key, in self._db.execute("SELECT key FROM entries").fetchall():
+            self._forget(key)
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, "entries", key[:2], key)
+
+    @staticmethod
+    def _load(path: str) -> np.ndarray:
+        try:
+            return np.load(path, mmap_mode="r", allow_pickle=False)
+        except ValueError:
+            # Empty arrays can't be memory-mapped by older NumPy
+            return np.load(path, allow_pickle=False)
+
+    def _evict(self, kept_key: str):
+        total_size, = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if total_size <= self.max_bytes:
+            return
+
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+            if total_size <= self.max_bytes:
+                break
+            if key != kept_key:
+                self._forget(key)
+                total_size -= size
+
+    def _forget(self, key: str):
+        shutil.rmtree(self._path(key), ignore_errors=True)
+        self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
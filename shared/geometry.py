@@ -0,0 +1,87 @@
+import numpy as np
+
+
+def _cross(p: np.ndarray, q: np.ndarray, t: np.ndarray) -> np.ndarray:
+    # Same expression, so the same rounding, as the scalar orientation tests of the solvers
+    return (q[..., 1] - p[..., 1]) * (t[..., 0] - q[..., 0]) - (t[..., 1] - q[..., 1]) * (q[..., 0] - p[..., 0])
+
+
+def _sides(p: np.ndarray, q: np.ndarray, t: np.ndarray, collinear: int) -> np.ndarray:
+    # Cheapest array with the same equalities as orientation: booleans if collinear points are put to a side
+    cross = _cross(p, q, t)
+    if collinear < 0:
+        return cross > 0
+    if collinear > 0:
+        return cross >= 0
+    return np.sign(cross)
+
+
+def orientation(p, q, t, collinear: int = 0) -> np.ndarray:
+    """
+    Orientation of the points t relative to the lines from the points p through the points q.
+    Arrays of points of shape (..., 2) are broadcast against each other
+    :param p: first points of the lines
+    :param q: second points of the lines
+    :param t: tested points
+    :param collinear: orientation of collinear points, 0 keeps them apart, -1 or 1 puts them to that side
+    :return: int8 array of -1, 0 and 1
+
+    Visibility in Task3 (visibility matrix, sectors tables, coverage map) uses collinear=-1: a point on a line
+    is on its negative side. A sight line touching a wall is blocked only if its other end is on the positive
+    side, so a camera on a wall sees one side of it, and the same points are visible in all of them
+    """
+    p, q, t = np.asarray(p, dtype=np.float64), np.asarray(q, dtype=np.float64), np.asarray(t, dtype=np.float64)
+    cross = _cross(p, q, t)
+
+    sides = np.sign(cross).astype(np.int8)
+    if collinear:
+        sides[cross == 0] = collinear
+
+    return sides
+
+
+def intersect(a1, a2, b1, b2, collinear: int = 0) -> np.ndarray:
+    """
+    Whether the segments (a1, a2) cross the segments (b1, b2), ends of shape (..., 2) are broadcast against each other.
+    Segments cross if the ends of each one have different orientations relative to another one, so with collinear=0
+    collinear segments never cross, and with collinear=-1 or 1 a touching end counts on one side only
+    :param a1: first ends of the segments a
+    :param a2: second ends of the segments a
+    :param b1: first ends of the segments b
+    :param b2: second ends of the segments b
+    :param collinear: orientation of collinear points, see orientation
+    :return: boolean array
+    """
+    a1, a2 = np.asarray(a1, dtype=np.float64), np.asarray(a2, dtype=np.float64)
+    b1, b2 = np.asarray(b1, dtype=np.float64), np.asarray(b2, dtype=np.float64)
+
+    return (_sides(a1, a2, b1, collinear) != _sides(a1, a2, b2, collinear)) & \
+           (_sides(b1, b2, a1, collinear) != _sides(b1, b2, a2, collinear))
+
+
+def intersect_matrix(segments: np.ndarray, other_segments: np.ndarray, collinear: int = 0) -> np.ndarray:
+    """
+    Tests every segment against every other segment
+    :param segments: array of segments (x1, y1, x2, y2) of shape (n, 4)
+    :param other_segments: array of segments of shape (m, 4)
+    :param collinear: orientation of collinear points, see orientation
+    :return: boolean array of shape (n, m)
+    """
+    return intersect(segments[:, None, 0:2], segments[:, None, 2:4],
+                     other_segments[None, :, 0:2], other_segments[None, :, 2:4], collinear)
+
+
+def contain_points(edges: np.ndarray, points: np.ndarray, ray_length: float, collinear: int = 0) -> np.ndarray:
+    """
+    Whether the points are inside of the polygon: the segment of ray_length from the point along x
+    crosses an odd number of the polygon's edges
+    :param edges: edges of the polygon of shape (k, 4)
+    :param points: array of points of shape (m, 2)
+    :param ray_length: length of the tested segments, the polygon has to be narrower
+    :param collinear: orientation of collinear points, see orientation
+    :return: boolean array of shape (m,)
+    """
+    rays = np.hstack((points, points + (ray_length, 0)))
+
+    return intersect_matrix(rays, edges, collinear).sum(axis=1) % 2 == 1
+
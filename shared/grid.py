@@ -0,0 +1,167 @@
+from math import floor, sqrt, inf
+from typing import Iterator, Tuple
+
+import numpy as np
+
+
+class UniformGrid:
+    """
+    Uniform grid of square cells over bounding boxes. Boxes are listed in all cells they overlap, the cells
+    crossed by a segment are walked in order, so queries test only the items of a few cells.
+    """
+
+    # Bounding boxes are expanded by the margin, so touching items are in all adjacent cells
+    _margin = 1e-6
+
+    def __init__(self, boxes: np.ndarray, cell_size: float = None):
+        """
+        :param boxes: bounding boxes (min x, min y, max x, max y) of the items of shape (n, 4), they set the bounds
+        :param cell_size: size of the cell (default is chosen by the density of the boxes)
+        """
+        self.min_x, self.min_y = (boxes[:, 0].min(), boxes[:, 1].min()) if len(boxes) else (0., 0.)
+        max_x, max_y = (boxes[:, 2].max(), boxes[:, 3].max()) if len(boxes) else (1., 1.)
+
+        if cell_size is None:
+            cell_size = self._choose_cell_size(boxes, max_x - self.min_x, max_y - self.min_y)
+        self.cell_size = cell_size
+
+        self.columns = max(1, int(floor((max_x - self.min_x) / cell_size)) + 1)
+        self.rows = max(1, int(floor((max_y - self.min_y) / cell_size)) + 1)
+
+    @staticmethod
+    def _choose_cell_size(boxes: np.ndarray, width: float, height: float) -> float:
+
+        # About one box per cell, but not smaller than an average box
+        if not len(boxes):
+            return 1.
+        average_size = np.mean(np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]))
+
+        return max(average_size, sqrt(max(width * height, 1.) / len(boxes)), 1e-3)
+
+    def _fill_cells(self, boxes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Lists the boxes in the cells they overlap (CSR layout)
+        :param boxes: bounding boxes (min x, min y, max x, max y) of shape (n, 4)
+        :return: pair of arrays: indices of the boxes grouped by cells and starts of the cells, boxes of the cell c
+                 are [starts[c]:starts[c + 1]]
+        """
+        cells, owners = [], []
+        for owner, (column_from, row_from, column_to, row_to) in enumerate(self._cells_of_boxes(boxes).tolist()):
+            for row in range(row_from, row_to + 1):
+                for column in range(column_from, column_to + 1):
+                    cells.append(row * self.columns + column)
+                    owners.append(owner)
+
+        cells = np.array(cells, dtype=np.intp)
+        order = np.argsort(cells, kind='stable')
+
+        return np.array(owners, dtype=np.intp)[order], np.searchsorted(cells[order],
+                                                                       np.arange(self.columns * self.rows + 1))
+
+    def _cells_of_boxes(self, boxes: np.ndarray) -> np.ndarray:
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        cells = np.floor((boxes - (self.min_x, self.min_y, self.min_x, self.min_y)) / self.cell_size).astype(np.intp)
+        cells[:, 0::2] = np.clip(cells[:, 0::2], 0, self.columns - 1)
+        cells[:, 1::2] = np.clip(cells[:, 1::2], 0, self.rows - 1)
+
+        return cells
+
+    def cells_on_segment(self, segment: np.ndarray) -> Iterator[Tuple[int, float]]:
+        """
+        Walks the cells crossed by the segment (in order from the first point of the segment)
+        :param segment: segment (x1, y1, x2, y2)
+        :return: generator of (cell, exit) pairs, exit is the position (fraction of the segment length),
+                 where the segment leaves the cell
+        """
+        x1, y1, x2, y2 = np.asarray(segment, dtype=np.float64).reshape(4).tolist()
+        dx, dy = x2 - x1, y2 - y1
+
+        # Clip the segment by the bounds of the grid
+        t_from, t_to = 0., 1.
+        for delta, start, low, high in ((dx, x1, self.min_x, self.min_x + self.columns * self.cell_size),
+                                        (dy, y1, self.min_y, self.min_y + self.rows * self.cell_size)):
+            if delta == 0:
+                if not low <= start <= high:
+                    return
+            else:
+                t_low, t_high = (low - start) / delta, (high - start) / delta
+                t_from = max(t_from, min(t_low, t_high))
+                t_to = min(t_to, max(t_low, t_high))
+        if t_from > t_to:
+            return
+
+        # Traverse the cells (Amanatides-Woo)
+        column, row = self._cell_of(x1 + t_from * dx, y1 + t_from * dy)
+        step_column, t_delta_x, t_next_x = self._traversal_axis(x1, dx, column, self.min_x)
+        step_row, t_delta_y, t_next_y = self._traversal_axis(y1, dy, row, self.min_y)
+
+        while True:
+            t_exit = min(t_next_x, t_next_y, t_to)
+            yield row * self.columns + column, t_exit
+
+            if t_exit >= t_to:
+                return
+            if t_next_x < t_next_y:
+                column += step_column
+                t_next_x += t_delta_x
+            else:
+                row += step_row
+                t_next_y += t_delta_y
+            if not (0 <= column < self.columns and 0 <= row < self.rows):
+                return
+
+    def cells_in_triangle(self, a: Tuple[float, float], b: Tuple[float, float], c: Tuple[float, float]) -> np.ndarray:
+        """
+        Cells overlapped by the triangle
+        :param a: vertex (x, y) of the triangle, as b and c
+        :return: indices of the cells, ascending
+        """
+        cells = [np.arange(row * self.columns + column_from, row * self.columns + column_to + 1)
+                 for row, column_from, column_to in self.rows_in_triangle(a, b, c)]
+
+        return np.concatenate(cells) if cells else np.zeros(0, dtype=np.intp)
+
+    def rows_in_triangle(self, a: Tuple[float, float], b: Tuple[float, float],
+                         c: Tuple[float, float]) -> Iterator[Tuple[int, int, int]]:
+        """
+        Walks the rows of the cells overlapped by the triangle, cells of a row are consecutive
+        :param a: vertex (x, y) of the triangle, as b and c
+        :return: generator of (row, first column, last column) triples
+        """
+        vertices = (a, b, c)
+        edges = ((a, b), (b, c), (c, a))
+
+        column_from, row_from, column_to, row_to = self._cells_of_boxes(np.array(
+            [min(v[0] for v in vertices), min(v[1] for v in vertices),
+             max(v[0] for v in vertices), max(v[1] for v in vertices)], dtype=float))[0].tolist()
+
+        for row in range(row_from, row_to + 1):
+            band_from = self.min_y + row * self.cell_size
+            band_to = band_from + self.cell_size
+
+            # X coordinates of the triangle inside the band: vertices and crossings of edges with the band borders
+            xs = [v[0] for v in vertices if band_from <= v[1] <= band_to]
+            for (x1, y1), (x2, y2) in edges:
+                for y in (band_from, band_to):
+                    if min(y1, y2) <= y <= max(y1, y2) and y1 != y2:
+                        xs.append(x1 + (y - y1) * (x2 - x1) / float(y2 - y1))
+            if not xs:
+                continue
+
+            row_column_from, _ = self._cell_of(min(xs) - self._margin, band_from)
+            row_column_to, _ = self._cell_of(max(xs) + self._margin, band_from)
+            yield row, row_column_from, row_column_to
+
+    def _cell_of(self, x: float, y: float) -> Tuple[int, int]:
+        column = min(max(int(floor((x - self.min_x) / self.cell_size)), 0), self.columns - 1)
+        row = min(max(int(floor((y - self.min_y) / self.cell_size)), 0), self.rows - 1)
+
+        return column, row
+
+    def _traversal_axis(self, start: float, delta: float, cell: int, origin: float):
+        if delta > 0:
+            return 1, self.cell_size / delta, (origin + (cell + 1) * self.cell_size - start) / delta
+        elif delta < 0:
+            return -1, -self.cell_size / delta, (origin + cell * self.cell_size - start) / delta
+
+        return 0, inf, inf
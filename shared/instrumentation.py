@@ -0,0 +1,156 @@
+import json
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+
+class _NullPhase:
+    """
+    Phase of the disabled profiler, does nothing
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_null_phase = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ('_profiler', '_name', '_started')
+
+    def __init__(self, profiler: 'Profiler', name: str):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._profiler._stack.append(self._name)
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = perf_counter() - self._started
+        stack = self._profiler._stack
+        self._profiler._record(tuple(stack), elapsed)
+        stack.pop()
+        return False
+
+
+class Profiler:
+    """
+    Timers of nested phases and counters of calls. Disabled profiler costs one method call per phase
+    and nothing per counted function, counted functions are only wrapped while the profiler is enabled.
+    Phases and calls in worker processes are not collected.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._counted = []
+        self._originals = {}
+        self._calls = {}
+        self.reset()
+
+    def reset(self):
+        self._phases = {}
+        self._stack = []
+
+        # Counted functions keep the dictionary of the calls, so it is cleared, not replaced
+        self._calls.clear()
+
+    def enable(self):
+        if not self.enabled:
+            self.enabled = True
+            for owner, name, label in self._counted:
+                self._wrap(owner, name, label)
+
+    def disable(self):
+        if self.enabled:
+            self.enabled = False
+            for (owner, name), original in self._originals.items():
+                setattr(owner, name, original)
+            self._originals = {}
+
+    def phase(self, name: str):
+        """
+        Context manager timing the phase, phases entered inside it are nested
+        """
+        return _Phase(self, name) if self.enabled else _null_phase
+
+    def count(self, label: str, calls: int = 1):
+        if self.enabled:
+            self._calls[label] = self._calls.get(label, 0) + calls
+
+    def count_calls(self, owner, name: str, label: str = None):
+        """
+        Registers the function (or the method of the class) to be counted while the profiler is enabled
+        :param owner: class or module of the function
+        :param name: name of the function in the owner
+        :param label: name of the counter (default owner.name)
+        """
+        label = label or "%s.%s" % (getattr(owner, '__name__', owner), name)
+        self._counted.append((owner, name, label))
+        if self.enabled:
+            self._wrap(owner, name, label)
+
+    def _wrap(self, owner, name: str, label: str):
+        original = owner.__dict__[name] if isinstance(owner, type) else getattr(owner, name)
+        self._originals[(owner, name)] = original
+
+        function = original.__func__ if isinstance(original, (staticmethod, classmethod)) else original
+        calls = self._calls
+
+        def counted(*args, **kwargs):
+            calls[label] = calls.get(label, 0) + 1
+            return function(*args, **kwargs)
+
+        if isinstance(original, staticmethod):
+            counted = staticmethod(counted)
+        elif isinstance(original, classmethod):
+            counted = classmethod(counted)
+        setattr(owner, name, counted)
+
+    def _record(self, path: Tuple[str, ...], elapsed: float):
+        timer = self._phases.get(path)
+        if timer is None:
+            self._phases[path] = [1, elapsed]
+        else:
+            timer[0] += 1
+            timer[1] += elapsed
+
+    def to_dict(self) -> Dict:
+        """
+        :return: {"phases": [{"path": [...], "calls": n, "seconds": s}, ...], "calls": {label: n}}
+        """
+        return {
+            "phases": [{"path": list(path), "calls": calls, "seconds": seconds}
+                       for path, (calls, seconds) in sorted(self._phases.items())],
+            "calls": dict(sorted(self._calls.items()))
+        }
+
+    def to_folded(self) -> List[str]:
+        """
+        :return: lines "phase;nested phase microseconds" of the time spent in the phases themselves
+                 (without nested phases), the folded stacks format of flame graph tools
+        """
+        own = {path: seconds for path, (_, seconds) in self._phases.items()}
+        for path, (_, seconds) in self._phases.items():
+            if path[:-1] in own:
+                own[path[:-1]] -= seconds
+
+        return ["%s %d" % (";".join(path), max(round(seconds * 1e6), 0)) for path, seconds in sorted(own.items())]
+
+    def save(self, path: str):
+        """
+        Saves the profile as JSON if the path ends with .json, as folded stacks otherwise
+        """
+        with open(path, 'w') as f:
+            if path.endswith(".json"):
+                json.dump(self.to_dict(), f, indent=2)
+            else:
+                f.write("\n".join(self.to_folded()) + "\n")
+
+
+profiler = Profiler()
@@ -0,0 +1,65 @@
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+
+
+@contextmanager
+def process_pool(workers: int, initializer: Callable = None, initargs: tuple = ()):
+    """
+    Pool of worker processes. Forked workers share the initializer's arguments with the parent,
+    other start methods get them once per worker. On exit the pool is closed and joined, not terminated:
+    terminating a pool, which still has queued tasks, may block on its task handler thread
+    :param workers: number of the processes
+    :param initializer: function called with initargs once in every worker
+    :param initargs: arguments of the initializer
+    :return: multiprocessing pool
+    """
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    pool = multiprocessing.get_context(start_method).Pool(workers, initializer=initializer, initargs=initargs)
+    try:
+        yield pool
+    finally:
+        pool.close()
+        pool.join()
+
+
+# State of the worker process shared by its tasks, it is set once per worker
+_worker_state = None
+
+
+def set_worker_state(state):
+    """
+    Initializer of the pool (see process_pool), keeps the state in the worker for its tasks
+    :param state: object the tasks of the worker use, e.g. the solver, which methods they call
+    """
+    global _worker_state
+
+    _worker_state = state
+
+
+def worker_state():
+    """
+    :return: state of the worker process set by set_worker_state
+    """
+    return _worker_state
+
+
+def imap_window(pool, function: Callable, items: Iterable, window: int) -> Iterator:
+    """
+    Results of the function for the items in order, like pool.imap, but at most window items are submitted
+    ahead of the consumer, so a consumer stopping early leaves at most window tasks to finish
+    :param pool: multiprocessing pool
+    :param function: function of one item, picklable
+    :param items: items to submit
+    :param window: maximal number of submitted items, which results are not consumed yet
+    :return: iterator of the results
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= window:
+            yield pending.popleft().get()
+        pending.append(pool.apply_async(function, (item,)))
+
+    while pending:
+        yield pending.popleft().get()
@@ -0,0 +1,86 @@
+from typing import Tuple
+
+import numpy as np
+
+# Centers of the cells closer than this, in cells, to a span's end are taken as on it, so an edge calculated from
+# different vertices on the same line, e.g. a ray of a fan closed by walls at different distances, has the same cells
+_tolerance = 1e-9
+
+
+def count_triangles(triangles: np.ndarray, shape: Tuple[int, int], origin: Tuple[float, float] = (0., 0.),
+                    cell_size: float = 1., chunk_size: int = 1 << 20) -> np.ndarray:
+    """
+    Number of the triangles containing the centers of the cells of a grid. The cell (i, j) has the center
+    (origin x + j * cell_size, origin y + i * cell_size). Triangles are filled by rows of cells: each row of a triangle
+    adds 1 at the first cell of its span and -1 after the last one, running sums along the rows give the counts,
+    so the cost is in the rows of the triangles, not in their cells. Spans are half-open, [x from, x to) by [y from,
+    y to), so triangles sharing an edge, like fans of triangles, never count a cell twice
+    :param triangles: vertices of the triangles of shape (n, 3, 2)
+    :param shape: rows and columns of the grid
+    :param origin: center of the cell (0, 0)
+    :param cell_size: distance between the centers of the neighbouring cells
+    :param chunk_size: rows of the triangles filled at once, bounds the memory
+    :return: int32 array of shape (rows, columns)
+    """
+    rows, columns = shape
+    vertices = (np.asarray(triangles, dtype=np.float64).reshape(-1, 3, 2) - origin) / cell_size
+
+    rows_from = np.clip(np.ceil(vertices[..., 1].min(axis=1) - _tolerance), 0, rows).astype(np.intp)
+    rows_to = np.clip(np.ceil(vertices[..., 1].max(axis=1) - _tolerance), 0, rows).astype(np.intp)
+    counts = np.maximum(rows_to - rows_from, 0)
+    ends = np.cumsum(counts)
+
+    differences = np.zeros(rows * (columns + 1), dtype=np.int64)
+    start = 0
+    while start < len(vertices):
+        end = max(int(np.searchsorted(ends, ends[start] - counts[start] + chunk_size, side="right")), start + 1)
+        differences += _count_spans(vertices[start:end], rows_from[start:end], counts[start:end], rows, columns)
+        start = end
+
+    return np.cumsum(differences.reshape(rows, columns + 1), axis=1)[:, :columns].astype(np.int32)
+
+
+def cells_centers(cells: np.ndarray, origin: Tuple[float, float] = (0., 0.), cell_size: float = 1.) -> np.ndarray:
+    """
+    :param cells: boolean array of shape (rows, columns), e.g. counts == 0 for the cells of no triangles
+    :param origin: center of the cell (0, 0)
+    :param cell_size: distance between the centers of the neighbouring cells
+    :return: points (x, y) of the cells, which are True, of shape (k, 2)
+    """
+    rows, columns = np.nonzero(cells)
+
+    return np.column_stack((origin[0] + columns * cell_size, origin[1] + rows * cell_size)).astype(np.float64)
+
+
+def _count_spans(vertices: np.ndarray, rows_from: np.ndarray, counts: np.ndarray, rows: int,
+                 columns: int) -> np.ndarray:
+
+    # Edges go up, so an edge shared by two triangles gives both the same x, which is exact at the vertices
+    ends = np.roll(vertices, -1, axis=1)
+    is_up = (vertices[..., 1] <= ends[..., 1])[..., None]
+    lows, highs = np.where(is_up, vertices, ends), np.where(is_up, ends, vertices)
+
+    # Pairs of the triangles and their rows, x of the row on the edges crossing it bound the span
+    triangles = np.repeat(np.arange(len(vertices)), counts)
+    y = np.repeat(rows_from - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+    x_from, x_to = np.full(len(y), np.inf), np.full(len(y), -np.inf)
+    for edge in range(3):
+        low_x, low_y = lows[triangles, edge, 0], lows[triangles, edge, 1]
+        high_x, high_y = highs[triangles, edge, 0], highs[triangles, edge, 1]
+        is_crossed = (low_y - _tolerance <= y) & (y <= high_y + _tolerance) & (low_y != high_y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            w = np.clip((y - low_y) / (high_y - low_y), 0, 1)
+            x = low_x * (1 - w) + high_x * w
+        x_from = np.where(is_crossed & (x < x_from), x, x_from)
+        x_to = np.where(is_crossed & (x > x_to), x, x_to)
+
+    columns_from = np.clip(np.ceil(x_from - _tolerance), 0, columns).astype(np.intp)
+    columns_to = np.clip(np.ceil(x_to - _tolerance), 0, columns).astype(np.intp)
+    is_span = columns_to > columns_from
+
+    starts = y[is_span] * (columns + 1)
+    size = rows * (columns + 1)
+
+    return np.bincount(starts + columns_from[is_span], minlength=size) - \
+        np.bincount(starts + columns_to[is_span], minlength=size)
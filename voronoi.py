@@ -0,0 +1,445 @@
+import numpy as np
+
+
+def generate_closest(points, width=500, height=500, tile_size=None):
+    """
+    Labels every pixel of the width x height map with the index of the closest point (the lowest index
+    among equally close points), result is indexed as [y, x] like in Voronoi.ipynb.
+    The map is processed by tiles, each tile is only compared with the points, that can be the closest
+    to some of its pixels, so the memory is bounded by the tile size.
+    """
+    seeds = np.array(points, dtype=float).reshape(-1, 2)
+    result = np.tile(-1, (width, height))
+
+    # Pixels farther than the diagonal from all points get the last label, as in the scalar loop
+    _label_box(seeds, np.arange(len(seeds)), result, 0, 0, width, height, tile_size, np.hypot(width - 1, height - 1))
+
+    return result.T
+
+
+def _label_box(seeds, seeds_labels, result, x_from, y_from, x_to, y_to, tile_size=None, maximum=None):
+
+    # Tiles of about two distances between points keep the candidates few
+    if tile_size is None:
+        tile_size = int(min(max(2 * np.sqrt((x_to - x_from) * (y_to - y_from) / max(len(seeds), 1)), 16), 64))
+
+    for tile_x_from in range(x_from, x_to, tile_size):
+        for tile_y_from in range(y_from, y_to, tile_size):
+            tile_x_to, tile_y_to = min(tile_x_from + tile_size, x_to), min(tile_y_from + tile_size, y_to)
+            candidates = _get_tile_candidates(seeds, tile_x_from, tile_y_from, tile_x_to - 1, tile_y_to - 1)
+
+            dx = seeds[candidates, 0][:, None, None] - np.arange(tile_x_from, tile_x_to)[None, :, None]
+            dy = seeds[candidates, 1][:, None, None] - np.arange(tile_y_from, tile_y_to)[None, None, :]
+            distances = dx * dx + dy * dy
+            closest = np.argmin(distances, axis=0)
+            minimum = np.take_along_axis(distances, closest[None], axis=0)[0]
+
+            # Equally close points are ordered by np.hypot as in the scalar loop, it may differ in the last bit
+            is_tie = (distances <= minimum * (1 + 1e-12)).sum(axis=0) > 1
+            if is_tie.any():
+                ties = np.nonzero(is_tie)
+                closest[ties] = np.argmin(np.hypot(dx[:, ties[0], 0], dy[:, 0, ties[1]]), axis=0)
+
+            labels = candidates[closest]
+            if maximum is not None:
+                far = np.nonzero(np.sqrt(minimum) >= maximum * (1 - 1e-9))
+                if len(far[0]):
+                    far_distances = np.hypot(dx[closest[far], far[0], 0], dy[closest[far], 0, far[1]])
+                    labels[far] = np.where(far_distances >= maximum, len(seeds) - 1, labels[far])
+            result[tile_x_from:tile_x_to, tile_y_from:tile_y_to] = seeds_labels[labels]
+
+
+def _get_tile_candidates(seeds, x_from, y_from, x_to, y_to):
+
+    # Every pixel of the tile is at most bound away from the point with the nearest farthest corner
+    far_x = np.maximum(np.abs(seeds[:, 0] - x_from), np.abs(seeds[:, 0] - x_to))
+    far_y = np.maximum(np.abs(seeds[:, 1] - y_from), np.abs(seeds[:, 1] - y_to))
+    bound = (far_x * far_x + far_y * far_y).min() * (1 + 1e-9)
+
+    # Points farther than the bound from the whole tile are never the closest
+    near_x = np.maximum(np.maximum(x_from - seeds[:, 0], seeds[:, 0] - x_to), 0.)
+    near_y = np.maximum(np.maximum(y_from - seeds[:, 1], seeds[:, 1] - y_to), 0.)
+
+    return np.flatnonzero(near_x * near_x + near_y * near_y <= bound)
+
+
+def generate_lines(image, width=None, height=None, out=None, band_size=256):
+    """
+    Marks the pixels of the labels image [x, y] having a differently labelled neighbour (of 8) with 255,
+    others with 0, result is indexed as [y, x] like in Voronoi.ipynb.
+    The image is processed by bands of rows with one row of neighbours on each side, so the image and
+    the result (out) may be memory-mapped arrays bigger than the memory.
+    """
+    width = image.shape[0] if width is None else width
+    height = image.shape[1] if height is None else height
+    if out is None:
+        out = np.empty((height, width), dtype=int)
+
+    for start in range(0, width, band_size):
+        stop = min(start + band_size, width)
+        band_start, band_stop = max(start - 1, 0), min(stop + 1, width)
+
+        is_boundary = _get_boundary(np.asarray(image[band_start:band_stop, :height]))
+        out[:, start:stop] = np.where(is_boundary[start - band_start:stop - band_start], 255, 0).T
+
+    return out
+
+
+def _get_boundary(labels):
+
+    # Pixels outside of the image are not neighbours, edge padding makes them equal to the pixel
+    padded = np.pad(labels, 1, mode='edge')
+    rows, columns = labels.shape
+
+    is_boundary = np.zeros(labels.shape, dtype=bool)
+    for di in (0, 1, 2):
+        for dj in (0, 1, 2):
+            if di != 1 or dj != 1:
+                is_boundary |= padded[di:di + rows, dj:dj + columns] != labels
+
+    return is_boundary
+
+
+def get_disc_offsets(radius):
+    """
+    Offsets (dx, dy) of the pixels of the disc with the radius, the same pixels as in get_points_in_circle
+    """
+    r = np.arange(-radius, radius + 1)
+    dx, dy = np.meshgrid(r, r, indexing='ij')
+    inside = dx * dx + dy * dy <= radius * radius
+
+    return np.column_stack((dx[inside], dy[inside]))
+
+
+def enlarge_points(data, points, radius=20, out=None, band_size=256, chunk_size=1 << 20):
+    """
+    Paints discs with the radius around the points [x, y] of the data with 255. Pixels outside of the data
+    are skipped (negative indices don't wrap around to the other side).
+    The data is copied to the result (out) by bands of rows, so both may be memory-mapped arrays bigger
+    than the memory, discs are painted by chunks of chunk_size pixels.
+    """
+    if out is None:
+        out = data.copy()
+    else:
+        for start in range(0, data.shape[0], band_size):
+            out[start:start + band_size] = data[start:start + band_size]
+
+    stencil = get_disc_offsets(radius)
+    points = np.array(points, dtype=np.intp).reshape(-1, 2)
+
+    points_chunk = max(1, chunk_size // len(stencil))
+    for start in range(0, len(points), points_chunk):
+        pixels = (points[start:start + points_chunk, None] + stencil[None]).reshape(-1, 2)
+        inside = np.all((pixels >= 0) & (pixels < out.shape[:2]), axis=1)
+        out[pixels[inside, 0], pixels[inside, 1]] = 255
+
+    return out
+
+
+class VoronoiDiagram(object):
+    """
+    Voronoi diagram of the seeds (i, j) kept as its dual Delaunay triangulation, built by incremental
+    Bowyer-Watson insertion. Seeds can be added and removed one by one, only the triangles around the seed
+    are rebuilt. The closest seed of a point is found by walking the triangulation, pixels are only
+    labelled on request, and only the regions changed since the previous request are relabelled.
+    Integer coordinates are handled exactly (Python integers), the seeds must be inside [-bound, bound].
+    """
+
+    def __init__(self, points=(), bound=1 << 20):
+
+        # Vertices 0, 1, 2 are the corners of the super triangle containing all the seeds
+        m = 4 * bound
+        self._vertices = [(-m, -m), (3 * m, -m), (-m, 3 * m)]
+        self._triangles = {0: (0, 1, 2)}
+        self._edges = {(0, 1): 0, (1, 2): 0, (2, 0): 0}
+        self._incident = {0: 0, 1: 0, 2: 0}
+        self._next_triangle = 1
+        self._last_triangle = 0
+
+        # Seeds with equal coordinates share the vertex
+        self._seeds = {}
+        self._seeds_vertices = {}
+        self._vertices_seeds = {}
+        self._coordinates_vertices = {}
+        self._next_seed = 0
+
+        # Seeds are inserted in the order of a serpentine over bands, so the walks between them are short
+        points = [_exact(p) for p in points]
+        if points:
+            band = max(1., np.sqrt(max(np.ptp([p[0] for p in points]) * np.ptp([p[1] for p in points]), 1.) /
+                                   len(points)) * 2)
+            order = sorted(range(len(points)), key=lambda i: (points[i][1] // band,
+                                                              points[i][0] * (1 - 2 * (points[i][1] // band % 2))))
+            for i in order:
+                self._add_seed(i, points[i])
+            self._next_seed = len(points)
+
+        # Boxes of the regions changed since the last rasterization
+        self._dirty_boxes = []
+
+    def __len__(self):
+        return len(self._seeds)
+
+    @property
+    def seeds(self):
+        return dict(self._seeds)
+
+    def add(self, point):
+        """
+        Adds the seed and returns its index, indices are given in the order of addition
+        """
+        seed = self._next_seed
+        self._next_seed += 1
+
+        vertex = self._add_seed(seed, _exact(point))
+        self._dirty_boxes.append(self._get_region_box(vertex))
+        return seed
+
+    def _add_seed(self, seed, point):
+        self._seeds[seed] = point
+
+        if point in self._coordinates_vertices:
+            vertex = self._coordinates_vertices[point]
+            self._vertices_seeds[vertex].append(seed)
+        else:
+            vertex = self._insert_vertex(point)
+            self._coordinates_vertices[point] = vertex
+            self._vertices_seeds[vertex] = [seed]
+
+        self._seeds_vertices[seed] = vertex
+        return vertex
+
+    def remove(self, seed):
+        point = self._seeds.pop(seed)
+        vertex = self._seeds_vertices.pop(seed)
+        self._dirty_boxes.append(self._get_region_box(vertex))
+
+        self._vertices_seeds[vertex].remove(seed)
+        if not self._vertices_seeds[vertex]:
+            del self._vertices_seeds[vertex]
+            del self._coordinates_vertices[point]
+            self._remove_vertex(vertex)
+
+    def locate(self, point):
+        """
+        Index of the seed closest to the point (the lowest index among equally close seeds), None if no seeds
+        """
+        if not self._seeds:
+            return None
+
+        point = _exact(point)
+        triangle = self._triangles[self._find_triangle(point)]
+        vertex = min((v for v in triangle if v > 2),
+                     key=lambda v: _squared_distance(self._vertices[v], point),
+                     default=next(iter(self._vertices_seeds)))
+
+        # Greedy walk over Delaunay neighbours ends at the closest vertex
+        distance = _squared_distance(self._vertices[vertex], point)
+        is_moved = True
+        while is_moved:
+            is_moved = False
+            for neighbour in self._get_neighbours(vertex):
+                neighbour_distance = _squared_distance(self._vertices[neighbour], point)
+                if neighbour_distance < distance:
+                    vertex, distance, is_moved = neighbour, neighbour_distance, True
+                    break
+
+        # Equally close vertices lie on an empty circle, so they are connected by Delaunay edges
+        closest, queue = {vertex}, [vertex]
+        while queue:
+            for neighbour in self._get_neighbours(queue.pop()):
+                if neighbour not in closest and _squared_distance(self._vertices[neighbour], point) == distance:
+                    closest.add(neighbour)
+                    queue.append(neighbour)
+
+        return min(min(self._vertices_seeds[v]) for v in closest)
+
+    def get_triangles(self):
+        """
+        Delaunay triangles as triples of seed indices (the lowest index of seeds with equal coordinates)
+        """
+        return [tuple(min(self._vertices_seeds[v]) for v in triangle)
+                for triangle in self._triangles.values() if min(triangle) > 2]
+
+    def get_region(self, seed):
+        """
+        Vertices of the Voronoi region of the seed in counterclockwise order. Regions of the seeds on the convex
+        hull are unbounded, their far vertices are the circumcenters of the triangles with the super triangle
+        """
+        vertex = self._seeds_vertices[seed]
+        return [_circumcenter(*(self._vertices[v] for v in self._triangles[t]))
+                for t in self._get_star(vertex)]
+
+    def rasterize(self, width=500, height=500, labels=None):
+        """
+        Labels the pixels with the closest seeds like generate_closest, result is indexed as [y, x].
+        If labels of the previous call are given, only the regions changed since then are relabelled in place
+        """
+        if labels is None:
+            labels = np.tile(-1, (height, width))
+            boxes = [(0, 0, width - 1, height - 1)]
+        else:
+            boxes = self._dirty_boxes
+        self._dirty_boxes = []
+
+        if not self._seeds:
+            labels.fill(-1)
+            return labels
+
+        seeds_labels = np.array(sorted(self._seeds), dtype=labels.dtype)
+        seeds = np.array([self._seeds[s] for s in seeds_labels.tolist()], dtype=float)
+        for x_from, y_from, x_to, y_to in boxes:
+            x_from, y_from = max(int(np.floor(x_from)), 0), max(int(np.floor(y_from)), 0)
+            x_to, y_to = min(int(np.ceil(x_to)), width - 1), min(int(np.ceil(y_to)), height - 1)
+            if x_from <= x_to and y_from <= y_to:
+                _label_box(seeds, seeds_labels, labels.T, x_from, y_from, x_to + 1, y_to + 1)
+
+        return labels
+
+    def _insert_vertex(self, point):
+        vertex = len(self._vertices)
+        self._vertices.append(point)
+
+        # Triangles with the point inside their circumcircles form a cavity around the point
+        start = self._find_triangle(point)
+        cavity, queue = {start}, [start]
+        while queue:
+            a, b, c = self._triangles[queue.pop()]
+            for u, v in ((a, b), (b, c), (c, a)):
+                neighbour = self._edges.get((v, u))
+                if neighbour is not None and neighbour not in cavity and \
+                        self._is_in_circumcircle(self._triangles[neighbour], point):
+                    cavity.add(neighbour)
+                    queue.append(neighbour)
+
+        # Border of the cavity is connected to the point
+        border = []
+        for t in cavity:
+            a, b, c = self._triangles[t]
+            for u, v in ((a, b), (b, c), (c, a)):
+                if self._edges.get((v, u)) not in cavity:
+                    border.append((u, v))
+
+        for t in cavity:
+            self._delete_triangle(t)
+        for u, v in border:
+            self._add_triangle(u, v, vertex)
+
+        return vertex
+
+    def _remove_vertex(self, vertex):
+
+        # Link of the vertex in counterclockwise order
+        star = self._get_star(vertex)
+        link = [self._rotate(self._triangles[t], vertex)[1] for t in star]
+        for t in star:
+            self._delete_triangle(t)
+
+        # The hole is triangulated by Delaunay ears: no other vertex of the link is inside their circumcircles
+        while len(link) > 3:
+            ear = None
+            for i in range(len(link)):
+                a, b, c = link[i - 1], link[i], link[(i + 1) % len(link)]
+                if _orientation(self._vertices[a], self._vertices[b], self._vertices[c]) <= 0:
+                    continue
+                if ear is None:
+                    ear = i
+                if not any(self._is_in_circumcircle((a, b, c), self._vertices[v]) for v in link if v not in (a, b, c)):
+                    ear = i
+                    break
+
+            a, b, c = link[ear - 1], link[ear], link[(ear + 1) % len(link)]
+            self._add_triangle(a, b, c)
+            del link[ear]
+        self._add_triangle(*link)
+
+        del self._incident[vertex]
+
+    def _find_triangle(self, point):
+
+        # Walk from the last triangle towards the point
+        t = self._last_triangle if self._last_triangle in self._triangles else next(iter(self._triangles))
+        while True:
+            a, b, c = self._triangles[t]
+            for u, v in ((a, b), (b, c), (c, a)):
+                if _orientation(self._vertices[u], self._vertices[v], point) < 0:
+                    t = self._edges[(v, u)]
+                    break
+            else:
+                self._last_triangle = t
+                return t
+
+    def _get_star(self, vertex):
+        star, t = [], self._incident[vertex]
+        while True:
+            star.append(t)
+            _, a, b = self._rotate(self._triangles[t], vertex)
+            t = self._edges[(vertex, b)]
+            if t == star[0]:
+                return star
+
+    def _get_neighbours(self, vertex):
+        return [v for v in (self._rotate(self._triangles[t], vertex)[1] for t in self._get_star(vertex)) if v > 2]
+
+    def _get_region_box(self, vertex):
+        centers = [_circumcenter(*(self._vertices[v] for v in self._triangles[t])) for t in self._get_star(vertex)]
+        points = centers + [self._vertices[vertex]]
+        xs, ys = [p[0] for p in points], [p[1] for p in points]
+        return min(xs) - 1, min(ys) - 1, max(xs) + 1, max(ys) + 1
+
+    @staticmethod
+    def _rotate(triangle, vertex):
+        i = triangle.index(vertex)
+        return triangle[i:] + triangle[:i]
+
+    def _is_in_circumcircle(self, triangle, point):
+        a, b, c = (self._vertices[v] for v in triangle)
+        return _in_circle(a, b, c, point) > 0
+
+    def _add_triangle(self, a, b, c):
+        t = self._next_triangle
+        self._next_triangle += 1
+
+        self._triangles[t] = (a, b, c)
+        for u, v in ((a, b), (b, c), (c, a)):
+            self._edges[(u, v)] = t
+            self._incident[u] = t
+        self._last_triangle = t
+
+    def _delete_triangle(self, t):
+        a, b, c = self._triangles.pop(t)
+        for u, v in ((a, b), (b, c), (c, a)):
+            if self._edges.get((u, v)) == t:
+                del self._edges[(u, v)]
+
+
+# NumPy integers are converted to Python integers, which don't overflow in the predicates
+def _exact(point):
+    return tuple(int(v) if isinstance(v, (int, np.integer)) else float(v) for v in point)
+
+
+def _squared_distance(p, q):
+    return (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2
+
+
+def _orientation(p, q, t):
+    return (q[0] - p[0]) * (t[1] - p[1]) - (q[1] - p[1]) * (t[0] - p[0])
+
+
+# Positive if the point is inside the circumcircle of the counterclockwise triangle (a, b, c)
+def _in_circle(a, b, c, point):
+    ax, ay = a[0] - point[0], a[1] - point[1]
+    bx, by = b[0] - point[0], b[1] - point[1]
+    cx, cy = c[0] - point[0], c[1] - point[1]
+    return (ax * ax + ay * ay) * (bx * cy - cx * by) - \
+           (bx * bx + by * by) * (ax * cy - cx * ay) + \
+           (cx * cx + cy * cy) * (ax * by - bx * ay)
+
+
+def _circumcenter(a, b, c):
+    d = 2. * (a[0] * (b[1] - c[1]) + b[0] * (c[1] - a[1]) + c[0] * (a[1] - b[1]))
+    if d == 0:
+        return (a[0] + b[0] + c[0]) / 3., (a[1] + b[1] + c[1]) / 3.
+    a2, b2, c2 = a[0] ** 2 + a[1] ** 2, b[0] ** 2 + b[1] ** 2, c[0] ** 2 + c[1] ** 2
+    return ((a2 * (b[1] - c[1]) + b2 * (c[1] - a[1]) + c2 * (a[1] - b[1])) / d,
+            (a2 * (c[0] - b[0]) + b2 * (a[0] - c[0]) + c2 * (b[0] - a[0])) / d)